@@ -0,0 +1,169 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict, deque
+from importlib.util import find_spec
+
+from kivy.graphics.texture import Texture
+
+# ID3标签解析库和图像处理库在后台线程第一次读取封面时才导入，这里只检查是否已安装
+HAS_MUTAGEN = find_spec('mutagen') is not None
+HAS_PIL = find_spec('PIL') is not None
+if not HAS_PIL:
+    print("Note: Pillow library not installed, album art cannot be shown")
+    print("Please install: pip install pillow")
+
+
+def extract_cover(filepath):
+    """读取MP3中嵌入的封面图片（APIC帧），优先使用封面类型，没有时返回None"""
+    from mutagen.id3 import ID3
+
+    try:
+        tags = ID3(filepath)
+    except Exception:
+        return None
+    pictures = tags.getall('APIC')
+    if not pictures:
+        return None
+    # 类型3为封面（Front cover）
+    for picture in pictures:
+        if picture.type == 3:
+            return picture.data
+    return pictures[0].data
+
+
+# 专辑封面缩略图缓存
+class ArtCache(object):
+    """封面缩略图的两级缓存：内存中的纹理（LRU）和磁盘上的PNG缩略图
+
+    缩略图以图片内容的哈希为键，同一专辑的歌曲共用一张图片和一个纹理。
+    读取标签、解码和缩小都在后台线程完成，主线程只用缩略图的像素创建纹理。
+    """
+
+    # 缩略图的最大边长
+    THUMB_SIZE = 256
+    # 等待中的请求最多保留这么多个，快速滚动时丢弃最早的请求
+    QUEUE_LIMIT = 32
+    # 路径 -> 键 的记录超过这么多时清空
+    MAX_KEYS = 20000
+
+    def __init__(self, call_in_main, cache_dir="art_cache", max_items=64):
+        self.call_in_main = call_in_main
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.textures = OrderedDict()  # 键 -> 纹理（只在主线程访问）
+        self.keys = {}  # 路径 -> 键，没有封面时为None
+        self.waiting = {}  # 路径 -> 等待的回调列表
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.thread = None
+
+    @property
+    def available(self):
+        return HAS_MUTAGEN and HAS_PIL
+
+    def get(self, path, callback):
+        """返回已缓存的纹理
+
+        还没有加载过时返回None并在后台加载，完成后在主线程调用
+        callback(路径, 纹理)；歌曲没有封面时纹理为None。
+        """
+        if path in self.keys:
+            key = self.keys[path]
+            if key is None:
+                return None
+            texture = self.textures.get(key)
+            if texture is not None:
+                self.textures.move_to_end(key)
+                return texture
+
+        if not self.available:
+            return None
+        callbacks = self.waiting.get(path)
+        if callbacks is not None:
+            callbacks.append(callback)
+            return None
+        self.waiting[path] = [callback]
+
+        with self.cond:
+            self.queue.append(path)
+            while len(self.queue) > self.QUEUE_LIMIT:
+                # 被丢弃的请求不再回调，视图下次刷新时会重新请求
+                self.waiting.pop(self.queue.popleft(), None)
+            self.cond.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                # 最新的请求最可能还在屏幕上，优先处理
+                path = self.queue.pop()
+
+            try:
+                key, pixels, size = self._load(path)
+            except Exception as e:
+                print(f"Failed to load album art {path}: {e}")
+                key, pixels, size = None, None, None
+            self.call_in_main(lambda path=path, key=key, pixels=pixels, size=size:
+                              self._loaded(path, key, pixels, size))
+
+    def _load(self, path):
+        # 在后台线程中读取封面并得到缩略图的RGBA像素
+        from PIL import Image as PILImage
+
+        data = extract_cover(path)
+        if not data:
+            return None, None, None
+        key = hashlib.sha1(data).hexdigest()
+
+        thumb_path = os.path.join(self.cache_dir, key + ".png")
+        try:
+            image = PILImage.open(thumb_path)
+            image.load()
+        except OSError:
+            image = PILImage.open(io.BytesIO(data))
+            # JPEG可以在解码时直接按比例缩小，比解码完整图片快得多
+            image.draft('RGB', (self.THUMB_SIZE, self.THUMB_SIZE))
+            image = image.convert('RGBA')
+            image.thumbnail((self.THUMB_SIZE, self.THUMB_SIZE))
+            self._save_thumbnail(image, thumb_path)
+
+        image = image.convert('RGBA')
+        return key, image.tobytes(), image.size
+
+    def _save_thumbnail(self, image, thumb_path):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = thumb_path + ".tmp"
+            image.save(tmp_path, format='PNG')
+            os.replace(tmp_path, thumb_path)
+        except OSError as e:
+            print(f"Failed to save album art thumbnail: {e}")
+
+    def _loaded(self, path, key, pixels, size):
+        if len(self.keys) >= self.MAX_KEYS:
+            self.keys.clear()
+        self.keys[path] = key
+
+        texture = None
+        if key is not None:
+            texture = self.textures.get(key)
+            if texture is None:
+                texture = Texture.create(size=size, colorfmt='rgba')
+                texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+                # PIL的像素从上到下排列，纹理从下到上
+                texture.flip_vertical()
+                self.textures[key] = texture
+                while len(self.textures) > self.max_items:
+                    self.textures.popitem(last=False)
+            else:
+                self.textures.move_to_end(key)
+
+        for callback in self.waiting.pop(path, []):
+            callback(path, texture)
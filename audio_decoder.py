@@ -0,0 +1,40 @@
+# 尝试导入PCM解码库和NumPy
+try:
+    import miniaudio
+
+    HAS_DECODER = True
+except ImportError:
+    HAS_DECODER = False
+    print("Note: miniaudio library not installed, audio analysis is disabled")
+    print("Please install: pip install miniaudio")
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+    print("Note: numpy library not installed, audio analysis is disabled")
+    print("Please install: pip install numpy")
+
+
+def can_decode():
+    return HAS_DECODER and HAS_NUMPY
+
+
+def stream_pcm(filepath, sample_rate=22050, nchannels=1, block_frames=4096, start_frame=0):
+    """逐块解码音频文件，生成float32的NumPy数组
+
+    单声道时数组形状为 (帧数,)，多声道时为 (帧数, 声道数)。
+    """
+    stream = miniaudio.stream_file(filepath,
+                                   output_format=miniaudio.SampleFormat.FLOAT32,
+                                   nchannels=nchannels,
+                                   sample_rate=sample_rate,
+                                   frames_to_read=block_frames,
+                                   seek_frame=start_frame)
+    for block in stream:
+        samples = np.frombuffer(block, dtype=np.float32)
+        if nchannels > 1:
+            samples = samples.reshape(-1, nchannels)
+        yield samples
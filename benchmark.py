@@ -0,0 +1,369 @@
+"""Harmony Player 无界面性能基准
+
+生成带有效ID3标签的合成MP3曲库（100到100k个文件），在没有显示器的情况下
+对真实代码路径计时，每项结果输出为一行JSON，便于在不同版本之间比较。
+
+用法：
+    python benchmark.py --sizes 100,1000,10000 --output bench.jsonl
+    python benchmark.py --sizes 100000 --only folder_import,load_playlist
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS = ('get_mp3_info_cold', 'get_mp3_info_warm', 'add_songs', 'folder_walk',
+              'folder_import', 'save_playlist', 'load_playlist', 'playlist_view', 'search')
+
+WORDS = ('love', 'night', 'rain', 'summer', 'dream', 'light', 'river', 'fire', 'blue', 'home',
+         'road', 'heart', 'star', 'city', 'ocean', 'silver', 'shadow', 'winter', 'golden', 'wild',
+         '夜', '雨', '梦', '光', '海', '风', '花', '月')
+
+# 128kbps / 44.1kHz / 联合立体声的MPEG1 Layer III帧，每帧417字节
+FRAME_HEADER = b'\xff\xfb\x90\x64'
+FRAME_SIZE = 417
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# 合成曲库
+def synchsafe(value):
+    return bytes(((value >> shift) & 0x7f) for shift in (21, 14, 7, 0))
+
+
+def text_frame(frame_id, text):
+    body = b'\x03' + text.encode('utf-8')  # UTF-8（ID3v2.4）
+    return frame_id + synchsafe(len(body)) + b'\x00\x00' + body
+
+
+def make_mp3(index, title, artist, album, track, frames):
+    """生成一个带ID3v2.4标签的MP3；音频帧中写入序号，保证每个文件的内容指纹不同"""
+    tag_frames = b''.join((text_frame(b'TIT2', title), text_frame(b'TPE1', artist),
+                           text_frame(b'TALB', album), text_frame(b'TRCK', str(track))))
+    padding = b'\x00' * 256
+    tag = b'ID3\x04\x00\x00' + synchsafe(len(tag_frames) + len(padding)) + tag_frames + padding
+    first = FRAME_HEADER + struct.pack('>I', index) + b'\x00' * (FRAME_SIZE - 8)
+    rest = (FRAME_HEADER + b'\x00' * (FRAME_SIZE - 4)) * (frames - 1)
+    return tag + first + rest
+
+
+def generate_library(root, count, frames=4, seed=0):
+    """在root下生成 艺术家/专辑/曲目.mp3 结构的曲库，已生成过同样的曲库时直接复用"""
+    marker = os.path.join(root, '.complete')
+    expected = f"{count} {frames} {seed}"
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if f.read() == expected:
+                return False
+    shutil.rmtree(root, ignore_errors=True)
+
+    rng = random.Random(seed)
+    tracks_per_album, albums_per_artist = 12, 5
+    for index in range(count):
+        album_index = index // tracks_per_album
+        artist_index = album_index // albums_per_artist
+        track = index % tracks_per_album + 1
+        artist = f"Artist {artist_index} {rng.choice(WORDS)}"
+        album = f"Album {album_index}"
+        title = ' '.join(rng.choice(WORDS) for i in range(rng.randint(1, 4)))
+        folder = os.path.join(root, f"artist_{artist_index:05d}", f"album_{album_index:06d}")
+        if track == 1:
+            os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{track:02d} track_{index}.mp3"), 'wb') as f:
+            f.write(make_mp3(index, title, artist, album, track, frames))
+
+    with open(marker, 'w') as f:
+        f.write(expected)
+    return True
+
+
+def library_paths(root):
+    paths = []
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        paths.extend(os.path.join(folder, name) for name in sorted(files) if name.endswith('.mp3'))
+    return paths
+
+
+# 无界面运行环境
+class HeadlessWindow(object):
+    """代替真实窗口的最小对象，只提供应用在构建界面时用到的属性"""
+
+    size = (400, 700)
+    width, height = size
+    center = (200, 350)
+    clearcolor = (0, 0, 0, 1)
+    dpi = 96
+    children = []
+
+    def __getattr__(self, name):
+        # 其余的窗口方法（bind、add_widget等）都不需要实际效果
+        return lambda *args, **kwargs: None
+
+
+def setup_headless():
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    os.environ['KIVY_WINDOW'] = ''
+    os.environ['KIVY_AUDIO'] = ''
+    os.environ['KIVY_GL_BACKEND'] = 'mock'
+    sys.path.insert(0, HERE)
+
+    import kivy.core.window
+    from kivy.base import EventLoop
+    from kivy.graphics.cgl import cgl_init
+
+    window = HeadlessWindow()
+    kivy.core.window.Window = window
+    EventLoop.window = window
+    cgl_init()
+
+
+@contextlib.contextmanager
+def quiet():
+    # 计时期间丢弃逐首歌曲的打印输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def tick_until(condition, timeout=600.0):
+    from kivy.clock import Clock
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError("benchmark step timed out")
+        Clock.tick()
+        time.sleep(0.001)
+
+
+def start_app(state_dir, fresh=True):
+    """在state_dir中启动一个无界面的应用实例（应用的数据文件都使用相对路径）"""
+    from kivy.app import App
+    from main import MusicPlayerApp
+
+    if fresh:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    os.makedirs(state_dir, exist_ok=True)
+    os.chdir(state_dir)
+
+    app = MusicPlayerApp()
+    App._running_app = app
+    with quiet():
+        app.build()
+        # 响度分析和启动时的重新扫描会占用CPU，基准中关闭
+        app.replay_gain = False
+        app.engine.folder_snapshots.clear()
+    return app
+
+
+def wait_loaded(app):
+    with quiet():
+        tick_until(lambda: app.engine.library_loaded)
+
+
+def stop_app(app):
+    with quiet():
+        app.on_stop()
+
+
+def start_engine(state_dir):
+    """在state_dir中创建不带界面的播放器核心（不导入Kivy）"""
+    from player_engine import PlayerEngine
+
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.makedirs(state_dir, exist_ok=True)
+    os.chdir(state_dir)
+    # 丢弃后台时长扫描的结果，计时期间不修改列表
+    return PlayerEngine(lambda func: None)
+
+
+# 各项基准
+class Runner(object):
+    def __init__(self, workdir, frames, only, output):
+        self.workdir = workdir
+        self.frames = frames
+        self.only = only
+        self.output = output
+        self.info = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+
+    def enabled(self, name):
+        return not self.only or name in self.only
+
+    def record(self, name, size, seconds, **extra):
+        result = dict(self.info, benchmark=name, size=size, seconds=round(seconds, 6),
+                      per_item_us=round(seconds / max(size, 1) * 1e6, 3))
+        result.update(extra)
+        line = json.dumps(result, ensure_ascii=False)
+        print(line)
+        if self.output:
+            with open(self.output, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    def run_size(self, size):
+        root = os.path.join(self.workdir, f"library_{size}")
+        state = os.path.join(self.workdir, f"state_{size}")
+        started = time.perf_counter()
+        if generate_library(root, size, self.frames):
+            self.record('generate_library', size, time.perf_counter() - started, frames=self.frames)
+        paths = library_paths(root)
+
+        self.bench_metadata(paths, state)
+        self.bench_walk(root, len(paths))
+        self.bench_import(root, len(paths), state)
+
+    def bench_metadata(self, paths, state):
+        size = len(paths)
+        if not (self.enabled('get_mp3_info_cold') or self.enabled('get_mp3_info_warm')
+                or self.enabled('add_songs')):
+            return
+        engine = start_engine(state)
+
+        # 空缓存：完整解析每个文件
+        engine.read_stats.reset()
+        started = time.perf_counter()
+        with quiet():
+            for path in paths:
+                engine.get_mp3_info(path)
+            engine.metadata_cache.flush()
+        seconds = time.perf_counter() - started
+        if self.enabled('get_mp3_info_cold'):
+            self.record('get_mp3_info_cold', size, seconds,
+                        bytes_read=engine.read_stats.bytes_read,
+                        bytes_per_file=round(engine.read_stats.bytes_read / max(size, 1), 1))
+
+        if self.enabled('get_mp3_info_warm'):
+            started = time.perf_counter()
+            with quiet():
+                for path in paths:
+                    engine.get_mp3_info(path)
+            self.record('get_mp3_info_warm', size, time.perf_counter() - started)
+
+        if self.enabled('add_songs'):
+            started = time.perf_counter()
+            with quiet():
+                added = engine.files_parsed(engine.parse_files(paths))
+            self.record('add_songs', size, time.perf_counter() - started, added=added)
+        with quiet():
+            engine.close()
+
+    def bench_walk(self, root, size):
+        if not self.enabled('folder_walk'):
+            return
+        from folder_importer import FolderImporter
+
+        # 只计遍历和分发的开销，解析函数不读取文件
+        done = threading.Event()
+        importer = FolderImporter(root, lambda path: {'path': path},
+                                  on_done=lambda parsed, cancelled: done.set())
+        started = time.perf_counter()
+        importer.start()
+        done.wait()
+        self.record('folder_walk', size, time.perf_counter() - started,
+                    found=importer.found_count, directories=len(importer.snapshot))
+
+    def bench_import(self, root, size, state):
+        if not any(self.enabled(name) for name in
+                   ('folder_import', 'save_playlist', 'load_playlist', 'playlist_view', 'search')):
+            return
+        app = start_app(state)
+        wait_loaded(app)
+
+        # 首次导入：空缓存、计算内容指纹、分批追加到播放列表
+        started = time.perf_counter()
+        with quiet():
+            app.start_folder_import(root)
+            tick_until(lambda: app.importer is None)
+        if self.enabled('folder_import'):
+            self.record('folder_import', size, time.perf_counter() - started,
+                        added=len(app.playlist))
+
+        if self.enabled('save_playlist'):
+            started = time.perf_counter()
+            with quiet():
+                app.engine.save_playlist()
+                app.engine.playlist_store.flush()
+            self.record('save_playlist', size, time.perf_counter() - started,
+                        bytes=os.path.getsize(os.path.join(state, 'playlist.json')))
+
+        if self.enabled('playlist_view'):
+            started = time.perf_counter()
+            with quiet():
+                app.show_playlist(None)
+                from kivy.clock import Clock
+                Clock.tick()  # 让RecycleView完成第一次布局
+            self.record('playlist_view', size, time.perf_counter() - started,
+                        rows=len(app.playlist_rv.data))
+
+        if self.enabled('search'):
+            queries = ('love', 'ni', 'golden river', '夜', 'zzz')
+            tick_until(lambda: app.engine.search_ready)
+            started = time.perf_counter()
+            for query in queries:
+                app.engine.search(query)
+            self.record('search', size, (time.perf_counter() - started) / len(queries),
+                        queries=len(queries))
+        stop_app(app)
+
+        if self.enabled('load_playlist'):
+            # 重新启动：读取快照和日志、构建存储和索引
+            started = time.perf_counter()
+            app = start_app(state, fresh=False)
+            wait_loaded(app)
+            self.record('load_playlist', size, time.perf_counter() - started,
+                        songs=len(app.playlist))
+            stop_app(app)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Harmony Player benchmarks")
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help="comma separated library sizes (number of MP3 files)")
+    parser.add_argument('--only', default='',
+                        help="comma separated benchmarks to run: " + ', '.join(BENCHMARKS))
+    parser.add_argument('--frames', type=int, default=4,
+                        help="MPEG frames per generated file")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'harmony_bench'),
+                        help="directory for generated libraries and app state")
+    parser.add_argument('--output', default='',
+                        help="append JSON lines to this file")
+    args = parser.parse_args()
+
+    only = set(name for name in args.only.split(',') if name)
+    unknown = only - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    setup_headless()
+    runner = Runner(os.path.abspath(args.workdir), args.frames, only, args.output)
+    for size in (int(value) for value in args.sizes.split(',')):
+        runner.run_size(size)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,11 @@ package.domain = org.harmony
 version = 1.0
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,json,ttf
+source.exclude_dirs = recipes
 main = main.py
-requirements = python3,kivy==2.1.0,mutagen,android
+requirements = python3,kivy==2.1.0,mutagen,android,sqlite3,numpy,pillow,cffi,miniaudio
+# miniaudio没有自带的p4a配方，使用recipes目录中的配方
+p4a.local_recipes = ./recipes
 android.permissions = INTERNET,READ_EXTERNAL_STORAGE,WRITE_EXTERNAL_STORAGE
 orientation = portrait
 log_level = 2
@@ -0,0 +1,119 @@
+"""Harmony Player 控制服务器的测试客户端
+
+播放器需要以环境变量 HARMONY_CONTROL_PORT 启动（例如 8765）。
+
+用法：
+    python control_client.py state
+    python control_client.py toggle_play
+    python control_client.py set_volume 0.5
+    python control_client.py seek 30
+    python control_client.py watch --count 20
+    python control_client.py watch --clients 50 --seconds 10
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+from control_server import ACTIONS, OP_CLOSE, OP_TEXT, encode_frame, read_frame
+
+
+async def http_request(host, port, method, path, data=None):
+    """发送一个HTTP请求，返回 (状态码, JSON结果)"""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(data).encode('utf-8') if data is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\n"
+                 f"Host: {host}:{port}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ')[1])
+    return status, json.loads(body.decode('utf-8'))
+
+
+async def open_websocket(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write(f"GET /ws HTTP/1.1\r\n"
+                 f"Host: {host}:{port}\r\n"
+                 f"Upgrade: websocket\r\n"
+                 f"Connection: Upgrade\r\n"
+                 f"Sec-WebSocket-Key: {key}\r\n"
+                 f"Sec-WebSocket-Version: 13\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    if b' 101 ' not in head.split(b'\r\n')[0]:
+        raise ConnectionError(head.split(b'\r\n')[0].decode('latin-1'))
+    return reader, writer
+
+
+async def watch(host, port, count, clients, seconds):
+    """打开若干个WebSocket连接接收状态；只有一个连接时打印每条状态"""
+    connections = [await open_websocket(host, port) for i in range(clients)]
+    received = [0] * clients
+    started = time.perf_counter()
+
+    async def receive(i, reader):
+        while count is None or received[i] < count:
+            opcode, payload = await read_frame(reader)
+            if opcode == OP_CLOSE:
+                return
+            if opcode == OP_TEXT:
+                received[i] += 1
+                if clients == 1:
+                    print(payload.decode('utf-8'))
+
+    tasks = [receive(i, reader) for i, (reader, writer) in enumerate(connections)]
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), seconds)
+    except asyncio.TimeoutError:
+        pass
+    for reader, writer in connections:
+        writer.write(encode_frame(OP_CLOSE, b'', mask=True))
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    if clients > 1:
+        total = sum(received)
+        print(f"{clients} clients received {total} messages in {elapsed:.1f}s "
+              f"({total / clients / elapsed:.1f} per client per second)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Harmony Player control client")
+    parser.add_argument('command', choices=['state', 'watch'] + sorted(ACTIONS))
+    parser.add_argument('value', nargs='?', type=float, help="音量（0-1）或进度百分比（0-100）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('HARMONY_CONTROL_PORT', 8765)))
+    parser.add_argument('--count', type=int, default=None, help="收到这么多条状态后退出")
+    parser.add_argument('--clients', type=int, default=1, help="同时打开的WebSocket连接数")
+    parser.add_argument('--seconds', type=float, default=None, help="最多等待的秒数")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'watch':
+            asyncio.run(watch(args.host, args.port, args.count, args.clients, args.seconds))
+            return
+        if args.command == 'state':
+            status, result = asyncio.run(http_request(args.host, args.port, 'GET', '/state'))
+        else:
+            data = {'value': args.value} if args.value is not None else None
+            status, result = asyncio.run(http_request(args.host, args.port, 'POST',
+                                                      '/' + args.command, data))
+    except (OSError, asyncio.IncompleteReadError) as e:
+        print(f"Failed to reach control server: {e}")
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False))
+    if status >= 400:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
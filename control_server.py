@@ -0,0 +1,273 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+
+# 可以远程调用的操作，值为参数的有效范围（None表示没有参数）
+ACTIONS = {
+    'toggle_play': None,
+    'next_song': None,
+    'prev_song': None,
+    'set_volume': (0.0, 1.0),
+    'seek': (0.0, 100.0)  # 进度百分比
+}
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+# 客户端发来的消息不会很大
+MAX_MESSAGE = 64 * 1024
+
+LOCAL_ORIGINS = ('http://localhost', 'http://127.0.0.1')
+
+
+def encode_frame(opcode, payload, mask=False):
+    """编码一个完整（不分片）的WebSocket帧，客户端发出的帧需要掩码"""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header.extend(struct.pack('>H', length))
+    else:
+        header.append(mask_bit | 127)
+        header.extend(struct.pack('>Q', length))
+    if mask:
+        key = os.urandom(4)
+        header.extend(key)
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return bytes(header) + payload
+
+
+async def read_frame(reader):
+    """读取一个WebSocket帧，返回 (操作码, 数据)"""
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0f
+    length = head[1] & 0x7f
+    if length == 126:
+        length, = struct.unpack('>H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('>Q', await reader.readexactly(8))
+    if length > MAX_MESSAGE:
+        raise ValueError("WebSocket message too large")
+    key = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    if key:
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+def is_local_origin(origin):
+    """浏览器页面的来源是否为本机"""
+    for prefix in LOCAL_ORIGINS:
+        if origin == prefix or origin.startswith(prefix + ':'):
+            return True
+    return False
+
+
+def parse_action(message):
+    """检查操作名和参数，返回 (操作, 参数)；无效时抛出ValueError"""
+    action = message.get('action')
+    if action not in ACTIONS:
+        raise ValueError(f"unknown action: {action}")
+    limits = ACTIONS[action]
+    if limits is None:
+        return action, None
+    try:
+        value = float(message['value'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{action} needs a numeric value")
+    return action, min(max(value, limits[0]), limits[1])
+
+
+class _Client(object):
+    # 每个WebSocket连接只保留最新的一条状态，慢的客户端不会积压消息
+    def __init__(self, writer):
+        self.writer = writer
+        self.latest = None
+        self.wakeup = asyncio.Event()
+
+
+# 本机控制服务器
+class ControlServer(object):
+    """在本机提供HTTP和WebSocket控制接口，运行在独立线程的asyncio事件循环中
+
+    HTTP：GET /state 返回当前状态；POST /<操作> 执行操作，参数放在JSON的value中。
+    WebSocket：连接 /ws 后先收到当前状态，之后每次状态变化收到一条；
+    发送 {"action": ..., "value": ...} 执行操作。
+
+    操作通过 call_in_main 交给主线程的 dispatch(操作, 参数) 执行。
+    publish() 在主线程调用，只做比较和一次跨线程唤醒；应用每帧最多调用一次，
+    所以连接的客户端再多，界面线程的开销也不变。
+    """
+
+    def __init__(self, dispatch, call_in_main, host='127.0.0.1', port=8765):
+        self.dispatch = dispatch
+        self.call_in_main = call_in_main
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.stopped = None
+        self.clients = set()
+        self.state = {}
+        self.message = json.dumps(self.state)
+        self.ready = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait(5.0)
+
+    def stop(self):
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(2.0)
+
+    def publish(self, state):
+        """更新状态并通知所有WebSocket客户端（在主线程调用）"""
+        if state == self.state:
+            return
+        self.state = dict(state)
+        message = json.dumps(self.state)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._broadcast, message)
+        else:
+            self.message = message
+
+    def _broadcast(self, message):
+        self.message = message
+        for client in self.clients:
+            client.latest = message
+            client.wakeup.set()
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except OSError as e:
+            print(f"Control server failed to start: {e}")
+        finally:
+            self.ready.set()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Control server listening on http://{self.host}:{self.port}")
+        self.ready.set()
+        async with server:
+            await self.stopped.wait()
+        for client in list(self.clients):
+            client.writer.close()
+        self.loop = None
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            method, target = lines[0].split(' ')[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            # 拒绝其他网站的页面通过浏览器访问本机接口
+            origin = headers.get('origin')
+            if origin and not is_local_origin(origin):
+                await self._respond(writer, 403, {'error': 'forbidden origin'})
+                return
+
+            if target == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._websocket(reader, writer, headers)
+            elif method == 'GET' and target == '/state':
+                await self._respond(writer, 200, self.state)
+            elif method == 'POST':
+                length = int(headers.get('content-length', 0))
+                if length > MAX_MESSAGE:
+                    raise ValueError("request body too large")
+                body = await reader.readexactly(length) if length else b''
+                message = json.loads(body.decode('utf-8')) if body else {}
+                if not isinstance(message, dict):
+                    raise ValueError("request body must be a JSON object")
+                message['action'] = target.lstrip('/')
+                action, value = parse_action(message)
+                self.call_in_main(lambda: self.dispatch(action, value))
+                await self._respond(writer, 202, {'ok': True})
+            else:
+                await self._respond(writer, 404, {'error': 'not found'})
+        except ValueError as e:
+            await self._respond(writer, 400, {'error': str(e)})
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, data):
+        body = json.dumps(data).encode('utf-8')
+        reason = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 403: 'Forbidden',
+                  404: 'Not Found'}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key', '').encode('latin-1')
+        if not key:
+            raise ValueError("missing Sec-WebSocket-Key")
+        accept = base64.b64encode(hashlib.sha1(key + WS_GUID).digest()).decode('ascii')
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('latin-1'))
+
+        client = _Client(writer)
+        client.latest = self.message
+        client.wakeup.set()
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._send_states(client))
+        try:
+            while True:
+                try:
+                    opcode, payload = await read_frame(reader)
+                except ValueError:
+                    # 消息过大，直接断开
+                    break
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(OP_CLOSE, payload[:2]))
+                    break
+                if opcode == OP_PING:
+                    writer.write(encode_frame(OP_PONG, payload))
+                elif opcode == OP_TEXT:
+                    try:
+                        message = json.loads(payload.decode('utf-8'))
+                        if not isinstance(message, dict):
+                            raise ValueError("message must be a JSON object")
+                        action, value = parse_action(message)
+                    except ValueError as e:
+                        writer.write(encode_frame(OP_TEXT, json.dumps({'error': str(e)}).encode('utf-8')))
+                        continue
+                    self.call_in_main(lambda action=action, value=value: self.dispatch(action, value))
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    async def _send_states(self, client):
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                client.writer.write(encode_frame(OP_TEXT, client.latest.encode('utf-8')))
+                await client.writer.drain()
+        except ConnectionError:
+            pass
@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+import time
+
+from folder_snapshot import snapshot_from_walk
+
+
+# 后台文件夹导入
+class FolderImporter(object):
+    """在后台线程中遍历文件夹并解析MP3元数据，分批回调结果
+
+    回调均在工作线程中调用，调用方需要自行切换回UI线程。
+    遍历时顺便记录每个目录的快照（snapshot），供之后增量重新扫描使用。
+    """
+
+    # 路径队列的最大长度，遍历速度远快于解析时避免占用过多内存
+    QUEUE_SIZE = 256
+    # 每批最多包含的歌曲数
+    BATCH_SIZE = 50
+    # 即使批次未满，也至少每隔这么多秒推送一次
+    BATCH_INTERVAL = 0.25
+
+    def __init__(self, folder_path, parse_func, known_paths=None, workers=None,
+                 on_batch=None, on_progress=None, on_done=None):
+        self.folder_path = folder_path
+        self.parse_func = parse_func
+        self.known_paths = known_paths or set()
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.on_batch = on_batch
+        self.on_progress = on_progress
+        self.on_done = on_done
+
+        self.path_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.batch = []
+        self.last_emit = time.monotonic()
+        self.found_count = 0
+        self.parsed_count = 0
+        self.walk_done = False
+        self.snapshot = {}
+        self.threads = []
+
+    def start(self):
+        walker = threading.Thread(target=self._walk, daemon=True)
+        self.threads.append(walker)
+        for i in range(self.workers):
+            self.threads.append(threading.Thread(target=self._work, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+        # 等待所有线程结束后发出完成通知
+        threading.Thread(target=self._wait, daemon=True).start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _put(self, item):
+        # 队列已满时定期检查取消标志，避免遍历线程永久阻塞
+        while not self.cancel_event.is_set():
+            try:
+                self.path_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _walk(self):
+        try:
+            for root, dirs, files in os.walk(self.folder_path):
+                if self.cancel_event.is_set():
+                    break
+                try:
+                    self.snapshot[root] = snapshot_from_walk(root, dirs, files)
+                except OSError:
+                    pass
+                for file in files:
+                    if not file.lower().endswith('.mp3'):
+                        continue
+                    filepath = os.path.join(root, file)
+                    if filepath in self.known_paths:
+                        continue
+                    with self.lock:
+                        self.found_count += 1
+                    if not self._put(filepath):
+                        break
+        finally:
+            with self.lock:
+                self.walk_done = True
+            # 每个工作线程一个结束标记
+            for i in range(self.workers):
+                if not self._put(None):
+                    break
+
+    def _work(self):
+        while not self.cancel_event.is_set():
+            try:
+                filepath = self.path_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if filepath is None:
+                break
+
+            song_info = self.parse_func(filepath)
+            ready = None
+            with self.lock:
+                self.batch.append(song_info)
+                self.parsed_count += 1
+                now = time.monotonic()
+                if len(self.batch) >= self.BATCH_SIZE or now - self.last_emit >= self.BATCH_INTERVAL:
+                    ready = self.batch
+                    self.batch = []
+                    self.last_emit = now
+            if ready:
+                self._emit(ready)
+
+    def _emit(self, batch):
+        if self.on_batch and not self.cancel_event.is_set():
+            self.on_batch(batch)
+        if self.on_progress:
+            with self.lock:
+                parsed, found, walk_done = self.parsed_count, self.found_count, self.walk_done
+            self.on_progress(parsed, found, walk_done)
+
+    def _wait(self):
+        for thread in self.threads:
+            thread.join()
+
+        with self.lock:
+            ready = self.batch
+            self.batch = []
+        if ready:
+            self._emit(ready)
+
+        if self.on_done:
+            self.on_done(self.parsed_count, self.cancel_event.is_set())
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+
+
+def is_mp3(name):
+    return name.lower().endswith('.mp3')
+
+
+def is_within(path, root):
+    """path是否就是root或在root之下"""
+    path = os.path.normcase(os.path.abspath(path))
+    root = os.path.normcase(os.path.abspath(root))
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def scan_directory(path, old_entry=None, deep=False):
+    """读取一个目录的快照条目
+
+    目录的修改时间没有变化时，说明其中没有增删文件，直接沿用旧条目而不列目录；
+    deep为True时仍会检查每个文件的大小和修改时间，以发现原地修改的文件。
+    """
+    mtime = os.stat(path).st_mtime_ns
+    if old_entry is not None and old_entry['mtime'] == mtime and not deep:
+        return old_entry
+
+    files = {}
+    dirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirs.append(entry.name)
+            elif is_mp3(entry.name):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files[entry.name] = [st.st_size, st.st_mtime_ns]
+    return {'mtime': mtime, 'files': files, 'dirs': sorted(dirs)}
+
+
+def rescan_root(root, old_dirs, deep=False, cancel_event=None):
+    """与旧快照比较，返回 (新快照, 新增路径, 删除路径, 修改路径)
+
+    快照的结构为 {目录路径: {'mtime': ..., 'files': {文件名: [大小, 修改时间] 或 None}, 'dirs': [...]}}。
+    """
+    new_dirs = {}
+    added, removed, updated = [], [], []
+    stack = [root]
+    while stack:
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        path = stack.pop()
+        old_entry = old_dirs.get(path)
+        try:
+            entry = scan_directory(path, old_entry, deep)
+        except OSError:
+            # 暂时无法读取（没有权限或共享未挂载）时按未变化处理，沿用旧条目；
+            # 真正删除的子目录不会出现在上级目录重新列出的dirs中，仍按删除处理
+            if old_entry is None:
+                continue
+            entry = old_entry
+        new_dirs[path] = entry
+        stack.extend(os.path.join(path, name) for name in entry['dirs'])
+
+        if entry is old_entry:
+            continue
+        old_files = old_entry['files'] if old_entry else {}
+        for name, state in entry['files'].items():
+            if name not in old_files:
+                added.append(os.path.join(path, name))
+            elif old_files[name] is not None and state != old_files[name]:
+                updated.append(os.path.join(path, name))
+        for name in old_files:
+            if name not in entry['files']:
+                removed.append(os.path.join(path, name))
+
+    # 整个被删除的子目录
+    for path, old_entry in old_dirs.items():
+        if path not in new_dirs:
+            removed.extend(os.path.join(path, name) for name in old_entry['files'])
+
+    return new_dirs, added, removed, updated
+
+
+def snapshot_from_walk(root, dirs, files):
+    """由os.walk的一步生成快照条目（导入时使用，不stat文件）"""
+    return {'mtime': os.stat(root).st_mtime_ns,
+            'files': dict((name, None) for name in files if is_mp3(name)),
+            'dirs': sorted(dirs)}
+
+
+# 已导入文件夹的快照
+class FolderSnapshots(object):
+    """记录导入过的根文件夹及其目录快照，保存在folders.json中"""
+
+    def __init__(self, path="folders.json"):
+        self.path = path
+        self.lock = threading.Lock()
+        # 多个后台线程保存时按序列化的先后顺序写盘，旧的内容不会覆盖新的
+        self.save_lock = threading.Lock()
+        self.roots = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.roots = json.load(f)
+            except Exception as e:
+                print(f"Failed to load folder snapshots: {e}")
+
+    def set_root(self, root, dirs):
+        """保存一个根文件夹的快照；嵌套的根文件夹合并为最外层的一个"""
+        with self.lock:
+            for other in list(self.roots):
+                if other != root and is_within(root, other):
+                    # 新根在已有的根之内，更新已有根中对应的目录
+                    self.roots[other].update(dirs)
+                    return
+            for other in list(self.roots):
+                if other != root and is_within(other, root):
+                    del self.roots[other]
+            self.roots[root] = dirs
+
+    def get_roots(self):
+        with self.lock:
+            return dict(self.roots)
+
+    def clear(self):
+        with self.lock:
+            self.roots = {}
+
+    def save(self):
+        """原子地写入folders.json（可在后台线程调用）"""
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.roots, ensure_ascii=False)
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Failed to save folder snapshots: {e}")
@@ -0,0 +1,173 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.recorder.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+# 性能记录
+class Profiler(object):
+    """可选开启的性能记录：代码区间耗时、帧时间直方图，可导出为trace文件
+
+    未开启时 span() 返回共享的空上下文，timed() 包装的函数只多一次属性判断。
+    导出的文件是Chrome trace格式（chrome://tracing 或 Perfetto 可以打开）。
+    """
+
+    # 帧时间直方图的分界（毫秒）
+    FRAME_BUCKETS = (8.3, 16.7, 33.3, 50.0, 100.0)
+    # 最多保留这么多个事件用于导出
+    MAX_EVENTS = 50000
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.events = deque(maxlen=self.MAX_EVENTS)
+            self.stats = {}  # 名称 -> [次数, 总耗时, 最大耗时]
+            self.frame_histogram = [0] * (len(self.FRAME_BUCKETS) + 1)
+            self.frame_times = deque(maxlen=300)
+
+    def enable(self):
+        if not self.enabled:
+            self.reset()
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):
+        """用 with profiler.span(name): 记录一段代码的耗时"""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name):
+        """装饰器：记录函数每次调用的耗时"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, start, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def wrap(self, name, func):
+        return self.timed(name)(func)
+
+    def record(self, name, start, duration):
+        with self.lock:
+            self.events.append((name, start, duration, threading.get_ident()))
+            stat = self.stats.get(name)
+            if stat is None:
+                self.stats[name] = [1, duration, duration]
+            else:
+                stat[0] += 1
+                stat[1] += duration
+                if duration > stat[2]:
+                    stat[2] = duration
+
+    def record_frame(self, dt):
+        """记录一帧的时间（秒）"""
+        if not self.enabled:
+            return
+        ms = dt * 1000.0
+        with self.lock:
+            self.frame_histogram[bisect.bisect_left(self.FRAME_BUCKETS, ms)] += 1
+            self.frame_times.append(ms)
+        self.record('frame', time.perf_counter() - dt, dt)
+
+    def frame_summary(self):
+        """返回最近一段时间的 (帧率, 95百分位帧时间毫秒)"""
+        with self.lock:
+            times = sorted(self.frame_times)
+        if not times:
+            return 0.0, 0.0
+        fps = 1000.0 * len(times) / max(sum(times), 1e-9)
+        return fps, times[min(len(times) - 1, int(len(times) * 0.95))]
+
+    def slowest(self):
+        """返回平均耗时最长的区间 (名称, 平均毫秒)，不含帧"""
+        with self.lock:
+            items = [(stat[1] / stat[0], name) for name, stat in self.stats.items() if name != 'frame']
+        if not items:
+            return None, 0.0
+        average, name = max(items)
+        return name, average * 1000.0
+
+    def report(self):
+        """文字形式的统计，按总耗时排序"""
+        with self.lock:
+            stats = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+            histogram = list(self.frame_histogram)
+        lines = ["name                      count   total ms    avg ms    max ms"]
+        for name, (count, total, longest) in stats:
+            lines.append(f"{name:<24} {count:>6} {total * 1000:>10.1f} {total / count * 1000:>9.2f} "
+                         f"{longest * 1000:>9.2f}")
+        labels = [f"<{bound:g}ms" for bound in self.FRAME_BUCKETS] + [f">={self.FRAME_BUCKETS[-1]:g}ms"]
+        lines.append("frames: " + ", ".join(f"{label} {count}" for label, count in zip(labels, histogram)))
+        return "\n".join(lines)
+
+    def export_trace(self, path, extra=None):
+        """把记录的事件写成Chrome trace格式的JSON文件"""
+        with self.lock:
+            events = list(self.events)
+            histogram = list(self.frame_histogram)
+            origin = self.origin
+        pid = os.getpid()
+        trace = [{
+            'name': name,
+            'ph': 'X',
+            'ts': round((start - origin) * 1e6, 1),
+            'dur': round(duration * 1e6, 1),
+            'pid': pid,
+            'tid': tid
+        } for name, start, duration, tid in events]
+        data = {
+            'traceEvents': trace,
+            'displayTimeUnit': 'ms',
+            'otherData': dict(extra or {}, frame_buckets_ms=list(self.FRAME_BUCKETS),
+                              frame_histogram=histogram)
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        return len(trace)
+
+
+# 全局共享的记录器
+profiler = Profiler()
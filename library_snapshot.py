@@ -0,0 +1,157 @@
+import mmap
+import os
+import struct
+
+# 文件格式（小端）：
+#   文件头     HEADER
+#   偏移表     每首歌一条 RECORD：标题、艺术家、文件夹、文件名、指纹、索引键
+#              各是字符串池中的 (偏移, 字节数)，最后是时长（秒）
+#   字符串池   UTF-8字符串，相同的字符串（艺术家、文件夹等）只保存一份
+MAGIC = b'HPLIB\x00\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQqQQ')
+RECORD = struct.Struct('<12Id')
+
+
+def source_stamp(source_path):
+    """快照对应的playlist.json的 (大小, 修改时间)，文件不存在时为 (0, 0)"""
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return 0, 0
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_snapshot(path, songs, keys, source_path):
+    """把歌曲列表写成二进制快照（写临时文件后原子替换）
+
+    keys[i] 是第i首歌的路径索引键（见 track_index.path_key），一并保存，
+    加载时重建重复检测索引就不需要再访问文件系统。
+    """
+    pool = bytearray()
+    pool_offsets = {}
+
+    def intern(text):
+        offset = pool_offsets.get(text)
+        if offset is None:
+            data = text.encode('utf-8')
+            offset = pool_offsets[text] = (len(pool), len(data))
+            pool.extend(data)
+        return offset
+
+    table = bytearray(RECORD.size * len(songs))
+    for i, song in enumerate(songs):
+        song_path = song['path']
+        folder, name = os.path.split(song_path)
+        key = keys[i]
+        fields = []
+        for text in (song.get('title', name), song.get('artist', 'Unknown Artist'), folder, name,
+                     song.get('fingerprint') or '', '' if key == song_path else key):
+            fields.extend(intern(text))
+        RECORD.pack_into(table, i * RECORD.size, *fields, float(song.get('length', 180)))
+
+    size, mtime_ns = source_stamp(source_path)
+    table_offset = HEADER.size
+    header = HEADER.pack(MAGIC, VERSION, len(songs), size, mtime_ns,
+                         table_offset, table_offset + len(table))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(table)
+        f.write(pool)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# 内存映射的曲库快照
+class MappedSnapshot(object):
+    """用mmap打开的只读快照，按下标读取时才解码对应的歌曲
+
+    打开只需读取文件头，与歌曲数量无关；未访问的歌曲不会产生任何Python对象。
+    """
+
+    def __init__(self, path):
+        self.filename = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, size, mtime_ns, table_offset, pool_offset = \
+                HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a library snapshot")
+            if pool_offset != table_offset + count * RECORD.size or pool_offset > len(self.mm):
+                raise ValueError("truncated library snapshot")
+        except (ValueError, struct.error):
+            self.mm.close()
+            raise
+        self.count = count
+        self.stamp = (size, mtime_ns)
+        self.table_offset = table_offset
+        self.pool_offset = pool_offset
+
+    @classmethod
+    def open(cls, path, source_path):
+        """打开与source_path当前内容对应的快照；不存在、已过期或损坏时返回None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            snapshot = cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Ignoring library snapshot: {e}")
+            return None
+        if snapshot.stamp != source_stamp(source_path):
+            snapshot.close()
+            return None
+        return snapshot
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.mm.close()
+
+    def _record(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("track index out of range")
+        return RECORD.unpack_from(self.mm, self.table_offset + index * RECORD.size)
+
+    def _string(self, record, field):
+        start = self.pool_offset + record[field * 2]
+        return self.mm[start:start + record[field * 2 + 1]].decode('utf-8')
+
+    def song(self, index):
+        record = self._record(index)
+        folder, name = self._string(record, 2), self._string(record, 3)
+        song = {
+            'title': self._string(record, 0),
+            'artist': self._string(record, 1),
+            'path': os.path.join(folder, name),
+            'length': record[12]
+        }
+        fingerprint = self._string(record, 4)
+        if fingerprint:
+            song['fingerprint'] = fingerprint
+        return song
+
+    def title(self, index):
+        return self._string(self._record(index), 0)
+
+    def artist(self, index):
+        return self._string(self._record(index), 1)
+
+    def path(self, index):
+        record = self._record(index)
+        return os.path.join(self._string(record, 2), self._string(record, 3))
+
+    def length(self, index):
+        return self._record(index)[12]
+
+    def key(self, index):
+        """保存的索引键（与路径相同时没有单独保存）"""
+        record = self._record(index)
+        key = self._string(record, 5)
+        return key or os.path.join(self._string(record, 2), self._string(record, 3))
+
+    def fingerprint(self, index):
+        return self._string(self._record(index), 4) or None
@@ -0,0 +1,234 @@
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import threading
+
+from audio_decoder import HAS_NUMPY, can_decode, stream_pcm
+
+if HAS_NUMPY:
+    import numpy as np
+
+# 分析时的解码格式
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# 100ms一段计算能量，4段（400ms）组成一个门限块，块之间重叠75%
+SEGMENT = SAMPLE_RATE // 10
+# ReplayGain 2.0 的参考响度（LUFS）
+REFERENCE_LOUDNESS = -18.0
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# BS.1770 中48kHz的K加权滤波器系数（高架滤波 + 高通）
+K_SHELF = ((1.53512485958697, -2.69169618940638, 1.19839281085285),
+           (1.0, -1.69065929318241, 0.73248077421585))
+K_HIGHPASS = ((1.0, -2.0, 1.0),
+              (1.0, -1.99004745483398, 0.99007225036621))
+
+_weights_cache = {}
+
+
+def k_weights(n, sample_rate):
+    """每个rfft频点的K加权能量系数
+
+    滤波器的幅频响应只与实际频率有关，所以直接在48kHz滤波器上取对应频率的响应。
+    系数中已包含帕塞瓦尔定理的归一化，与 |X|² 相乘求和即得到加权后的均方值。
+    """
+    key = (n, sample_rate)
+    if key not in _weights_cache:
+        freqs = np.fft.rfftfreq(n, 1.0 / sample_rate)
+        z = np.exp(-2j * np.pi * freqs / 48000.0)
+        response = np.ones(len(freqs))
+        for b, a in (K_SHELF, K_HIGHPASS):
+            h = (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+            response *= np.abs(h) ** 2
+        scale = np.full(len(freqs), 2.0)
+        scale[0] = 1.0
+        if n % 2 == 0:
+            scale[-1] = 1.0
+        _weights_cache[key] = response * scale / float(n * n)
+    return _weights_cache[key]
+
+
+def measure_loudness(filepath):
+    """计算整体响度（LUFS，按BS.1770的门限方法）和采样峰值，静音时响度为None"""
+    weights = k_weights(SEGMENT, SAMPLE_RATE)
+    energies = []
+    peak = 0.0
+    carry = None
+    for block in stream_pcm(filepath, SAMPLE_RATE, CHANNELS, block_frames=SAMPLE_RATE):
+        if not len(block):
+            continue
+        peak = max(peak, float(np.abs(block).max()))
+        data = block if carry is None else np.concatenate((carry, block))
+        count = len(data) // SEGMENT
+        if count:
+            segments = data[:count * SEGMENT].reshape(count, SEGMENT, CHANNELS)
+            spectrum = np.fft.rfft(segments, axis=1)
+            power = spectrum.real ** 2 + spectrum.imag ** 2
+            # 各声道加权均方值之和
+            energies.append(np.einsum('sbc,b->s', power, weights))
+        carry = data[count * SEGMENT:]
+
+    if not energies:
+        return None, peak
+    z = np.concatenate(energies)
+    if len(z) >= 4:
+        blocks = (z[:-3] + z[1:-2] + z[2:-1] + z[3:]) / 4.0
+    else:
+        blocks = np.array([z.mean()])
+
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[block_loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return None, peak
+    threshold = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE
+    gated = gated[-0.691 + 10 * np.log10(gated) > threshold]
+    return -0.691 + 10 * math.log10(gated.mean()), peak
+
+
+def replay_gain(loudness, peak):
+    """把响度调整到参考值所需的增益（dB），并保证峰值不超过满幅"""
+    if loudness is None:
+        return 0.0
+    gain = REFERENCE_LOUDNESS - loudness
+    if peak > 0:
+        gain = min(gain, -20 * math.log10(peak))
+    return gain
+
+
+def analyze_file(filepath):
+    """在工作进程中分析一首歌，返回 (路径, 响度, 峰值, 增益)"""
+    try:
+        loudness, peak = measure_loudness(filepath)
+        return filepath, loudness, peak, replay_gain(loudness, peak)
+    except Exception as e:
+        print(f"Failed to analyze loudness {filepath}: {e}")
+        # 无法解码的文件记为不调整，下次不再重试
+        return filepath, None, None, 0.0
+
+
+def lower_priority():
+    # 工作进程以较低优先级运行，不与播放争抢CPU
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+# 批量响度分析
+class LoudnessAnalyzer(object):
+    """在进程池中批量分析歌曲响度，结果写入元数据缓存
+
+    已分析的结果都保存在缓存中，中断后再次调用 start() 只会分析剩下的歌曲。
+    进程池不可用时（例如Android缺少sem_open）退回单个后台线程。
+    """
+
+    # 每个工作进程最多同时排队这么多首歌，便于及时停止
+    QUEUE_PER_WORKER = 2
+    # 等待结果时每隔这么多秒检查一次是否已停止
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, metadata_cache, call_in_main, on_result=None, workers=None):
+        self.cache = metadata_cache
+        self.call_in_main = call_in_main
+        self.on_result = on_result
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.next_paths = None
+
+    @property
+    def available(self):
+        return self.cache is not None and can_decode()
+
+    def start(self, paths):
+        """分析paths中尚未分析的歌曲；正在运行时，本轮结束后再处理新的列表"""
+        if not self.available:
+            return
+        with self.lock:
+            if self.thread is not None:
+                self.next_paths = paths
+                return
+            self.cancel_event.clear()
+            self.thread = threading.Thread(target=self._run, args=(paths,), daemon=True)
+            self.thread.start()
+
+    def stop(self, wait=False):
+        """停止分析；wait为True时等待后台线程结束，之后才可以关闭元数据缓存"""
+        with self.lock:
+            self.cancel_event.set()
+            self.next_paths = None
+            thread = self.thread
+        if wait and thread is not None:
+            thread.join()
+
+    def _run(self, paths):
+        while paths is not None:
+            try:
+                self._analyze(paths)
+            except Exception as e:
+                print(f"Loudness analysis failed: {e}")
+            with self.lock:
+                paths, self.next_paths = self.next_paths, None
+                if paths is None or self.cancel_event.is_set():
+                    self.thread = None
+                    return
+
+    def _analyze(self, paths):
+        todo = self.cache.missing_loudness(paths)
+        if not todo:
+            return
+        print(f"Analyzing loudness of {len(todo)} songs...")
+
+        executor = self._make_executor()
+        pending = iter(todo)
+        in_flight = set()
+        done_count = 0
+        try:
+            while not self.cancel_event.is_set():
+                while len(in_flight) < self.workers * self.QUEUE_PER_WORKER:
+                    filepath = next(pending, None)
+                    if filepath is None:
+                        break
+                    in_flight.add(executor.submit(analyze_file, filepath))
+                if not in_flight:
+                    break
+
+                done, in_flight = concurrent.futures.wait(
+                    in_flight, timeout=self.POLL_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    filepath, loudness, peak, gain = future.result()
+                    self.cache.set_loudness(filepath, loudness, peak, gain)
+                    if self.on_result:
+                        self.call_in_main(lambda filepath=filepath, gain=gain: self.on_result(filepath, gain))
+                    done_count += 1
+                    if done_count % 100 == 0:
+                        print(f"Loudness analysis: {done_count}/{len(todo)}")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.cache.flush()
+        print(f"Loudness analysis finished: {done_count}/{len(todo)} songs")
+
+    def _make_executor(self):
+        # 不能从界面进程直接fork：这时已有GL上下文和多个线程，其他线程持有的锁
+        # 会原样复制到子进程中，可能导致死锁。forkserver先启动一个干净的单线程
+        # 服务进程，工作进程都从它fork；没有forkserver的平台（Windows）使用spawn。
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            # 服务进程预先导入主模块（只导入界面模块，不创建窗口）和本模块，
+            # 之后fork出的工作进程不需要再导入
+            context.set_forkserver_preload(['__main__', 'loudness'])
+        else:
+            context = multiprocessing.get_context('spawn')
+        try:
+            return concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=context, initializer=lower_priority)
+        except (ImportError, OSError, NotImplementedError) as e:
+            print(f"Process pool unavailable, analyzing in a thread: {e}")
+        return concurrent.futures.ThreadPoolExecutor(1)
+
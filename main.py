@@ -1,36 +1,57 @@
+import time
+
+# 记录进程开始导入的时间，用于统计各启动阶段的耗时
+STARTUP_TIME = time.perf_counter()
+
+# 这里只导入第一帧需要的界面模块；弹窗、文件选择器、列表视图、音频后端和
+# 音频分析（numpy）在第一次使用时才导入，窗口也在build中才创建。
+# 曲库、队列、元数据和持久化都在不依赖Kivy的player_engine中。
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.image import Image
 from kivy.uix.button import Button
 from kivy.uix.slider import Slider
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.modalview import ModalView
-from kivy.uix.filechooser import FileChooserListView
+from kivy.uix.recycleview.datamodel import RecycleDataModelBehavior
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.event import EventDispatcher
 from kivy.clock import Clock
-from kivy.core.audio import SoundLoader
-from kivy.graphics import Color, Rectangle
-from kivy.properties import StringProperty, NumericProperty, BooleanProperty, ListProperty
-from kivy.core.window import Window
+from kivy.graphics import Color, Mesh, Rectangle
+from kivy.properties import StringProperty, NumericProperty, BooleanProperty, ObjectProperty
 from kivy.uix.behaviors import ButtonBehavior
 import os
-import random
-import json
+import threading
+from collections import deque
+
+from album_art import ArtCache
+from folder_importer import FolderImporter
+from instrumentation import profiler
+from player_engine import PlayerEngine
+from playback_clock import PlaybackClock
+from sound_cache import SoundCache, read_through
+
+# 设置环境变量HARMONY_MIXER=1时用自带的混音器播放（支持交叉淡化），否则用SoundLoader
+USE_MIXER = bool(os.environ.get('HARMONY_MIXER'))
 
-# 设置窗口大小和背景颜色
-Window.size = (400, 700)
-Window.clearcolor = (0.1, 0.1, 0.18, 1)
 
-# 尝试导入ID3标签解析库
-try:
-    from mutagen.mp3 import MP3
+def prepare_sound(filepath):
+    # 在加载线程中运行：混音器播放时预先解码开头，否则把文件读入系统缓存
+    if USE_MIXER:
+        from mixer_sound import prepare_mixer_sound
+        prepared = prepare_mixer_sound(filepath)
+        if prepared is not None:
+            return prepared
+    read_through(filepath)
+    return None
 
-    HAS_MUTAGEN = True
-except ImportError:
-    HAS_MUTAGEN = False
-    print("Note: mutagen library not installed, MP3 metadata cannot be read")
-    print("Please install: pip install mutagen")
+
+def load_sound(filepath, prepared=None):
+    # 在主线程中创建音频对象；第一次加载音频时才导入音频后端
+    if prepared is not None:
+        from mixer_sound import load_mixer_sound
+        return load_mixer_sound(filepath, prepared)
+    from kivy.core.audio import SoundLoader
+    return SoundLoader.load(filepath)
 
 
 # 创建带背景颜色的BoxLayout
@@ -53,33 +74,168 @@ class AlbumArt(ButtonBehavior, Image):
     def __init__(self, **kwargs):
         super(AlbumArt, self).__init__(**kwargs)
 
+    def set_cover(self, texture, default_color=(0.15, 0.15, 0.35, 1)):
+        # 没有封面时显示纯色背景
+        self.texture = texture
+        self.color = (1, 1, 1, 1) if texture is not None else default_color
+
+
+class PlaylistButton(RecycleDataViewBehavior, Button):
+    """播放列表中的一行，由RecycleView按需创建并复用"""
 
-class PlaylistButton(Button):
-    def __init__(self, song_data, index, **kwargs):
+    def __init__(self, **kwargs):
         super(PlaylistButton, self).__init__(**kwargs)
-        self.song_data = song_data
-        self.index = index
-        title = song_data.get('title', 'Unknown Song')
-        artist = song_data.get('artist', 'Unknown Artist')
-        self.text = f"{title}\n{artist}"
+        self.index = 0
         self.font_size = 16
         self.halign = 'left'
         self.valign = 'center'
-        self.text_size = (self.width, None)
-        self.size_hint_y = None
-        self.height = 70
         self.background_normal = ''
         self.background_color = (0.2, 0.2, 0.3, 1)  # 更亮的背景
         self.color = (1, 1, 1, 1)  # 白色文字
         self.markup = False  # 禁用markup
 
+        # 左侧的封面缩略图，与AlbumArt共用缓存中的纹理
+        self.path = ''
+        self.padding_x = 70
+        self.thumb = Image(size_hint=(None, None), opacity=0)
+        self.add_widget(self.thumb)
+
+        self.bind(width=self.update_text_size)
+        self.bind(pos=self.update_thumb, size=self.update_thumb)
         self.bind(on_press=self.on_button_press)
+        self.update_thumb()
+
+    def refresh_view_attrs(self, rv, index, data):
+        # 复用时根据新的数据（文字、路径和歌曲下标）更新内容、封面和高亮状态
+        result = super(PlaylistButton, self).refresh_view_attrs(rv, index, data)
+        app = App.get_running_app()
+        self.update_highlight(app.engine.current_index if app else -1)
+        self.show_thumb(app.art_cache.get(self.path, self.on_art_loaded) if app else None)
+        return result
+
+    def on_art_loaded(self, path, texture):
+        # 行可能已被复用来显示别的歌曲
+        if path == self.path:
+            self.show_thumb(texture)
+
+    def show_thumb(self, texture):
+        self.thumb.texture = texture
+        self.thumb.opacity = 1 if texture is not None else 0
+
+    def update_thumb(self, *args):
+        side = self.height - 10
+        self.thumb.size = (side, side)
+        self.thumb.pos = (self.x + 5, self.y + 5)
+
+    def update_highlight(self, current_index):
+        # 如果是当前歌曲，高亮显示
+        if self.index == current_index:
+            self.background_color = (0.9, 0.35, 0, 0.7)
+        else:
+            self.background_color = (0.2, 0.2, 0.3, 1)
+
+    def update_text_size(self, instance, width):
+        self.text_size = (width, None)
 
     def on_button_press(self, instance):
         app = App.get_running_app()
         app.load_song(self.index)
 
 
+class PlaylistRow(object):
+    """列表视图中的一行，显示时才从播放列表读取标题、艺术家和路径
+
+    RecycleView只通过 get() 读取布局信息（都使用默认值）、通过 items() 读取
+    要设置到行控件上的属性，所以不需要为每首歌生成字典。
+    """
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def get(self, key, default=None):
+        if key not in ('text', 'path', 'index'):
+            return default
+        return dict(self.items())[key]
+
+    def __getitem__(self, key):
+        return dict(self.items())[key]
+
+    def items(self):
+        store, index = self.store, self.index
+        # 播放列表刚被删改、视图还没同步时，行可能已经超出范围
+        if index >= len(store):
+            return [('text', ''), ('path', ''), ('index', index)]
+        return [('text', f"{store.title(index)}\n{store.artist(index)}"),
+                ('path', store.path(index)),
+                ('index', index)]
+
+
+class PlaylistRows(object):
+    """列表视图的数据：整个播放列表或一组搜索结果，按下标生成 PlaylistRow
+
+    count 是视图当前知道的行数，播放列表追加歌曲后由 extend_to() 更新；
+    last_path 用于判断播放列表是否只是在末尾追加了歌曲。
+    """
+
+    def __init__(self, store, indices=None):
+        self.store = store
+        self.indices = indices
+        self.count = 0
+        self.last_path = None
+        self.extend_to(len(store) if indices is None else len(indices))
+
+    def extend_to(self, count):
+        self.count = count
+        if self.indices is None and count:
+            self.last_path = self.store.path(count - 1)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("row index out of range")
+        return PlaylistRow(self.store, i if self.indices is None else self.indices[i])
+
+    def __iter__(self):
+        # 计算布局时RecycleView会遍历所有行，这里只生成轻量的行对象
+        store = self.store
+        for index in (range(self.count) if self.indices is None else self.indices[:self.count]):
+            yield PlaylistRow(store, index)
+
+
+class PlaylistDataModel(RecycleDataModelBehavior, EventDispatcher):
+    """RecycleView的数据模型，data是 PlaylistRows 而不是字典列表"""
+    data = ObjectProperty(None)
+
+    def __init__(self, **kwargs):
+        self.fbind('data', self._on_data)
+        super(PlaylistDataModel, self).__init__(**kwargs)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def _on_data(self, instance, value):
+        # 换了一组行：重新计算全部布局（只读取默认的尺寸，不读取歌曲）
+        self.dispatch('on_data_changed')
+
+    def appended(self, count):
+        """播放列表在末尾追加了歌曲，只为新的行计算布局"""
+        start = len(self.data)
+        self.data.extend_to(count)
+        self.dispatch('on_data_changed', appended=slice(start, count))
+
+    def modified(self, indices):
+        """这些行的歌曲被原地替换，只重新读取这些行"""
+        for index in indices:
+            if index < len(self.data):
+                self.dispatch('on_data_changed', modified=slice(index, index + 1))
+
+
 class MusicPlayerApp(App):
     # 属性
     current_title = StringProperty("No Song Selected")
@@ -89,9 +245,14 @@ class MusicPlayerApp(App):
     progress_value = NumericProperty(0)
     is_playing = BooleanProperty(False)
     volume = NumericProperty(0.7)
-    playlist = ListProperty([])  # 播放列表数据
 
     def build(self):
+        from kivy.core.window import Window
+
+        # 设置窗口大小和背景颜色
+        Window.size = (400, 700)
+        Window.clearcolor = (0.1, 0.1, 0.18, 1)
+
         # 创建主布局
         self.layout = ColoredBoxLayout(orientation='vertical', padding=10, spacing=10)
 
@@ -120,8 +281,15 @@ class MusicPlayerApp(App):
                                         color=(1, 1, 1, 1))
         self.import_folder_btn.bind(on_press=self.import_music_folder)
 
+        self.rescan_btn = Button(text="Rescan", font_size=16,
+                                 background_normal='',
+                                 background_color=(0.3, 0.3, 0.4, 1),
+                                 color=(1, 1, 1, 1))
+        self.rescan_btn.bind(on_press=self.rescan_library)
+
         top_controls.add_widget(self.add_btn)
         top_controls.add_widget(self.import_folder_btn)
+        top_controls.add_widget(self.rescan_btn)
         self.layout.add_widget(top_controls)
 
         # 标题
@@ -146,12 +314,20 @@ class MusicPlayerApp(App):
         song_info.add_widget(self.song_title)
         song_info.add_widget(self.song_artist)
         self.layout.add_widget(song_info)
+        self.bind(current_title=self.song_title.setter('text'),
+                  current_artist=self.song_artist.setter('text'))
 
         # 进度条
         progress_box = BoxLayout(orientation='vertical', size_hint=(1, 0.08))
         self.progress_slider = Slider(min=0, max=100, value=self.progress_value,
                                       size_hint=(1, 0.7))
         self.progress_slider.bind(value=self.on_progress_change)
+        # 波形画在进度条后面，整条波形是一个Mesh
+        self.waveform_peaks = None
+        with self.progress_slider.canvas.before:
+            Color(1, 0.6, 0.2, 0.35)
+            self.waveform_mesh = Mesh(mode='triangles')
+        self.progress_slider.bind(pos=self.update_waveform_mesh, size=self.update_waveform_mesh)
 
         time_box = BoxLayout(size_hint=(1, 0.3))
         self.current_time_label = Label(text=self.current_time, font_size=14,
@@ -165,14 +341,24 @@ class MusicPlayerApp(App):
         progress_box.add_widget(time_box)
         self.layout.add_widget(progress_box)
 
+        # 把播放进度同步到进度条和时间标签
+        self.updating_progress = False
+        self.bind(progress_value=self.on_progress_value,
+                  current_time=self.current_time_label.setter('text'),
+                  total_time=self.total_time_label.setter('text'))
+
         # 可视化效果
         self.visualizer = BoxLayout(size_hint=(1, 0.08), spacing=5, padding=10)
         self.bars = []
+        self.bar_colors = []
+        self.bar_rects = []
+        self.bar_levels = [0.1] * 9
         for i in range(9):
-            bar = BoxLayout(size_hint=(0.1, None))
+            bar = BoxLayout(size_hint=(0.1, 1))
+            # 绘图指令只创建一次，之后每帧原地更新
             with bar.canvas:
-                Color(0.9, 0.55, 0.2, 1)
-                self.bar_rect = Rectangle(pos=bar.pos, size=bar.size)
+                self.bar_colors.append(Color(0.9, 0.7, 0.3, 1))
+                self.bar_rects.append(Rectangle(pos=bar.pos, size=(bar.width, bar.height * 0.1)))
             self.bars.append(bar)
             self.visualizer.add_widget(bar)
         self.layout.add_widget(self.visualizer)
@@ -223,69 +409,328 @@ class MusicPlayerApp(App):
         playlist_btn.bind(on_press=self.show_playlist)
         self.layout.add_widget(playlist_btn)
 
-        # 初始化音乐数据
-        self.current_index = 0
+        # 曲库、播放队列和元数据；playlist是引擎中的同一个列表对象
+        self.engine = PlayerEngine(lambda func: Clock.schedule_once(lambda dt: func()),
+                                   on_durations=self.on_durations_updated,
+                                   on_search_ready=self.on_search_ready)
+        self.playlist = self.engine.playlist
+        self.playlist.bind(self.on_playlist)
+        if self.engine.shuffle_mode:
+            self.shuffle_btn.background_color = (0.9, 0.35, 0, 1)
         self.sound = None
         self.song_length = 0
-        self.repeat_mode = False  # False: 不循环, True: 单曲循环
+        self.startup_timings = {}
+
+        # 播放时钟；进度更新频率随前台/后台状态调整
+        self.playback_clock = PlaybackClock()
+        self.progress_event = None
+        self.in_background = False
+        Window.bind(on_minimize=self.on_window_minimize, on_restore=self.on_window_restore)
+
+        # 预加载音频的缓存；load_song在后台加载，只保留最新的请求
+        self.sound_path = None
+        self.loading_path = None
+        self.play_when_ready = False
+        self.load_latencies = deque(maxlen=500)
+        self.sound_cache = SoundCache(profiler.wrap('SoundCache.prepare', prepare_sound),
+                                      profiler.wrap('SoundLoader.load', load_sound),
+                                      lambda func: Clock.schedule_once(lambda dt: func()))
+
+        # 波形峰值缓存（与解码库一起在第一帧之后创建）
+        self.waveform_cache = None
+
+        # 封面缩略图缓存（专辑封面和播放列表共用）
+        self.art_cache = ArtCache(lambda func: Clock.schedule_once(lambda dt: func()),
+                                  cache_dir="art_cache")
+
+        # 播放列表弹窗（首次打开时创建）
+        self.playlist_modal = None
+        self.playlist_rv = None
+        self.search_query = ""
+        self.playlist_view_trigger = Clock.create_trigger(self.sync_playlist_view)
+
+        # 后台导入状态
+        self.importer = None
+        self.import_modal = None
+        self.import_added = 0
+
+        # 后台增量重新扫描已导入的文件夹
+        self.rescanning = False
+
+        # 频谱和响度分析（回放增益）需要numpy，在第一帧之后再创建
+        self.spectrum = None
+        self.replay_gain = True
+        self.track_gain = 1.0
+        self.loudness_analyzer = None
 
         # 音量控制
         self.volume_slider = Slider(min=0, max=1, value=0.7, size_hint=(0.3, 1))
         self.volume_slider.bind(value=self.set_volume)
 
-        # 尝试从配置文件加载播放列表
-        self.load_playlist_from_config()
-
         # 启动可视化更新
-        Clock.schedule_interval(self.update_visualizer, 0.2)
+        Clock.schedule_interval(self.update_visualizer, 1 / 30.0)
 
         # 更新状态栏
         self.update_status_bar()
 
+        # 性能记录：设置环境变量HARMONY_PROFILE=1开启，F12切换，F11导出trace
+        self.profile_label = None
+        self.profile_events = []
+        self.profile_counts = {}
+        Window.bind(on_key_down=self.on_key_down)
+        if os.environ.get('HARMONY_PROFILE'):
+            self.enable_profiling()
+
+        # 本机控制服务器：设置环境变量HARMONY_CONTROL_PORT（例如8765）开启
+        self.control_server = None
+        if os.environ.get('HARMONY_CONTROL_PORT'):
+            self.start_control_server(int(os.environ['HARMONY_CONTROL_PORT']))
+
+        # 先显示第一帧，下一帧再在后台加载播放列表
+        self.mark_startup_stage('build')
+        Clock.schedule_once(self.on_first_frame)
+
         return self.layout
 
+    def on_key_down(self, window, key, scancode, codepoint, modifiers):
+        if key == 293:  # F12
+            self.toggle_profiling()
+            return True
+        if key == 292 and profiler.enabled:  # F11
+            self.export_profile_trace()
+            return True
+        return False
+
+    def toggle_profiling(self, *args):
+        if profiler.enabled:
+            self.disable_profiling()
+        else:
+            self.enable_profiling()
+
+    def enable_profiling(self):
+        """开启性能记录，并在状态栏显示帧率等信息"""
+        profiler.enable()
+        self.profile_label = Label(text="Profiling...", font_size=12, color=(0.6, 1, 0.6, 1))
+        # 放在状态栏最左侧，children[0]仍是音量标签
+        self.status_bar.add_widget(self.profile_label, index=len(self.status_bar.children))
+        self.profile_events = [Clock.schedule_interval(profiler.record_frame, 0),
+                               Clock.schedule_interval(self.update_profile_overlay, 1.0)]
+        print("Profiling enabled")
+
+    def disable_profiling(self):
+        for event in self.profile_events:
+            event.cancel()
+        self.profile_events = []
+        if self.profile_label is not None:
+            self.status_bar.remove_widget(self.profile_label)
+            self.profile_label = None
+        print(profiler.report())
+        profiler.disable()
+
+    def update_profile_overlay(self, dt):
+        fps, p95 = profiler.frame_summary()
+        self.profile_counts = {
+            'clock_events': len(Clock.get_events()),
+            'canvas_instructions': self.count_canvas_instructions()
+        }
+        name, average = profiler.slowest()
+        text = (f"{fps:.0f}fps p95 {p95:.0f}ms ev {self.profile_counts['clock_events']} "
+                f"ins {self.profile_counts['canvas_instructions']}")
+        if name:
+            text += f" | {name} {average:.1f}ms"
+        self.profile_label.text = text
+
+    def count_canvas_instructions(self):
+        """统计窗口画布（包括弹窗）中的绘图指令数量"""
+        from kivy.core.window import Window
+        canvas = getattr(Window, 'canvas', None)
+        if not hasattr(canvas, 'children'):
+            canvas = self.layout.canvas
+        count = 0
+        stack = [canvas]
+        while stack:
+            group = stack.pop()
+            for instruction in group.children:
+                count += 1
+                if hasattr(instruction, 'children'):
+                    stack.append(instruction)
+        return count
+
+    def export_profile_trace(self, show=True):
+        path = time.strftime("trace_%Y%m%d_%H%M%S.json")
+        try:
+            count = profiler.export_trace(path, extra=self.profile_counts)
+        except OSError as e:
+            print(f"Failed to save trace: {e}")
+            return
+        print(f"Saved {count} trace events to {path}")
+        if show:
+            self.show_message(f"Trace saved: {path}")
+
+    def start_control_server(self, port):
+        """开启本机控制服务器，同一帧内的多次状态变化合并为一次广播"""
+        from control_server import ControlServer
+
+        self.control_server = ControlServer(self.handle_control_action,
+                                            lambda func: Clock.schedule_once(lambda dt: func()),
+                                            port=port)
+        self.control_server.start()
+        self.control_trigger = Clock.create_trigger(self.publish_control_state)
+        self.bind(current_title=self.control_trigger, progress_value=self.control_trigger,
+                  is_playing=self.control_trigger, volume=self.control_trigger)
+        self.publish_control_state()
+
+    def publish_control_state(self, *args):
+        self.control_server.publish({
+            'current_title': self.current_title,
+            'progress_value': self.progress_value,
+            'is_playing': self.is_playing,
+            'volume': self.volume
+        })
+
+    def handle_control_action(self, action, value):
+        """执行控制服务器收到的操作（在主线程调用）"""
+        if action == 'toggle_play':
+            self.toggle_play(None)
+        elif action == 'next_song':
+            self.next_song()
+        elif action == 'prev_song':
+            self.prev_song()
+        elif action == 'set_volume':
+            # 通过滑块设置，界面与实际音量保持一致
+            self.volume_slider.value = value
+        elif action == 'seek':
+            self.progress_slider.value = value
+
+    def mark_startup_stage(self, stage):
+        """记录启动阶段的耗时（从进程开始导入算起）"""
+        if stage not in self.startup_timings:
+            self.startup_timings[stage] = time.perf_counter() - STARTUP_TIME
+            print(f"Startup: {stage} at {self.startup_timings[stage] * 1000:.0f} ms")
+
+    def on_first_frame(self, dt):
+        # 在第一帧之后才调度，确保窗口内容已经显示
+        Clock.schedule_once(lambda dt: self.mark_startup_stage('first_frame'))
+        Clock.schedule_once(lambda dt: self.init_audio_analysis())
+        Clock.schedule_once(lambda dt: self.load_playlist_from_config())
+
+    def init_audio_analysis(self):
+        """创建频谱和响度分析器（导入numpy和解码库较慢，不放在第一帧之前）"""
+        from loudness import LoudnessAnalyzer
+        from spectrum import SpectrumAnalyzer
+        from waveform import WaveformCache
+
+        self.spectrum = SpectrumAnalyzer(bands=len(self.bars))
+        self.loudness_analyzer = LoudnessAnalyzer(self.engine.metadata_cache,
+                                                  lambda func: Clock.schedule_once(lambda dt: func()),
+                                                  self.on_loudness_analyzed)
+        self.waveform_cache = WaveformCache(lambda func: Clock.schedule_once(lambda dt: func()),
+                                            cache_dir="waveform_cache")
+        path = self.engine.current_path()
+        if path:
+            self.set_waveform(self.waveform_cache.get(path, self.on_waveform_loaded))
+
     def create_default_album_art(self):
         # 设置默认颜色
-        self.album_art.color = (0.15, 0.15, 0.35, 1)
+        self.album_art.set_cover(None)
+
+    def on_album_art_loaded(self, path, texture):
+        # 封面加载完成时可能已经切到别的歌
+        if self.engine.current_path() == path:
+            self.album_art.set_cover(texture)
+
+    def on_waveform_loaded(self, path, peaks):
+        # 波形计算完成时可能已经切到别的歌
+        if self.engine.current_path() == path:
+            self.set_waveform(peaks)
+
+    def set_waveform(self, peaks):
+        self.waveform_peaks = peaks
+        self.update_waveform_mesh()
+
+    def update_waveform_mesh(self, *args):
+        """按进度条当前的位置和大小重新生成波形的顶点"""
+        if not self.waveform_peaks:
+            self.waveform_mesh.vertices = []
+            self.waveform_mesh.indices = []
+            return
+        from waveform import waveform_mesh
+
+        slider = self.progress_slider
+        # 与进度条的轨道对齐（两端各留padding）
+        vertices, indices = waveform_mesh(self.waveform_peaks,
+                                          slider.x + slider.padding, slider.y,
+                                          slider.width - 2 * slider.padding, slider.height)
+        self.waveform_mesh.vertices = vertices
+        self.waveform_mesh.indices = indices
 
     def set_volume(self, instance, value):
         self.volume = value
         if self.sound:
-            self.sound.volume = value
+            self.sound.volume = self.output_volume()
         self.update_status_bar()
 
+    def output_volume(self):
+        # 用户音量乘以当前歌曲的回放增益，音频后端不能放大，最大为1
+        return min(1.0, self.volume * self.track_gain)
+
+    def apply_track_gain(self, gain_db):
+        """设置当前歌曲的回放增益（dB），None表示尚未分析"""
+        if gain_db is None or not self.replay_gain:
+            self.track_gain = 1.0
+        else:
+            self.track_gain = 10 ** (gain_db / 20.0)
+        if self.sound:
+            self.sound.volume = self.output_volume()
+
+    def start_loudness_analysis(self):
+        """在后台分析尚未分析过响度的歌曲（已分析的结果保存在缓存中）"""
+        analyzer = self.loudness_analyzer
+        if self.replay_gain and self.playlist and analyzer is not None and analyzer.available:
+            analyzer.start(self.playlist.copy().paths())
+
+    def on_loudness_analyzed(self, path, gain_db):
+        # 当前歌曲刚分析完时立即应用增益
+        if self.engine.current_path() == path:
+            self.apply_track_gain(gain_db)
+
     def load_playlist_from_config(self):
-        # 尝试从配置文件加载播放列表
-        config_file = "playlist.json"
-        if os.path.exists(config_file):
+        """在后台线程中从配置文件（快照 + 修改日志）加载播放列表"""
+        def load():
             try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    self.playlist = json.load(f)
-                print(f"Loaded {len(self.playlist)} songs from config")
-                # 如果有歌曲，加载第一首
-                if self.playlist:
-                    self.load_song(0)
+                songs, track_index = self.engine.read_library()
+                error = None
             except Exception as e:
-                print(f"Failed to load config: {e}")
-                self.playlist = []
-        else:
-            self.playlist = []
+                songs, track_index, error = [], None, e
+            Clock.schedule_once(lambda dt: self.on_playlist_loaded(songs, track_index, error))
 
-    def save_playlist_to_config(self):
-        # 保存播放列表到配置文件
-        try:
-            with open("playlist.json", 'w', encoding='utf-8') as f:
-                json.dump(self.playlist, f, ensure_ascii=False, indent=2)
-            print("Playlist saved")
-        except Exception as e:
-            print(f"Failed to save playlist: {e}")
+        threading.Thread(target=load, daemon=True).start()
+
+    def on_playlist_loaded(self, songs, track_index, error):
+        """在UI线程中接收后台加载好的播放列表"""
+        if error is not None:
+            self.engine.load_failed(error)
+            return
+
+        index = self.engine.install_library(songs, track_index)
+        self.mark_startup_stage('library')
+
+        # 如果有歌曲，显示第一首（随机播放时显示上次播放的歌曲），音频等到播放时再加载
+        if index is not None:
+            self.load_song(index, load_audio=False)
+
+        # 检查上次运行之后导入文件夹中的变化
+        self.rescan_library()
+
+        # 继续上次未完成的响度分析
+        self.start_loudness_analysis()
 
     def update_status_bar(self):
         # 更新状态栏显示
         if hasattr(self, 'status_label'):
             status_text = f"Songs: {len(self.playlist)}"
-            if self.playlist and self.current_index < len(self.playlist):
-                status_text += f" | Current: {self.current_index + 1}/{len(self.playlist)}"
+            if self.engine.current_path() is not None:
+                status_text += f" | Current: {self.engine.current_index + 1}/{len(self.playlist)}"
             self.status_label.text = status_text
 
             # 更新音量显示
@@ -293,101 +738,44 @@ class MusicPlayerApp(App):
             if hasattr(self, 'status_bar') and len(self.status_bar.children) > 2:
                 self.status_bar.children[0].text = f"Volume: {volume_percent}%"
 
-    def get_mp3_info(self, filepath):
-        """获取MP3文件的元数据"""
-        try:
-            if HAS_MUTAGEN:
-                # 读取音频文件信息
-                audio = MP3(filepath)
-
-                # 获取时长
-                duration_sec = audio.info.length
-                minutes = int(duration_sec // 60)
-                seconds = int(duration_sec % 60)
-                duration = f"{minutes:02d}:{seconds:02d}"
-
-                # 尝试获取标题和艺术家信息
-                title = ""
-                artist = ""
-
-                # 从标签中获取信息
-                if hasattr(audio, 'tags'):
-                    tags = audio.tags
-                    if 'TIT2' in tags:
-                        title = str(tags['TIT2'])
-                    if 'TPE1' in tags:
-                        artist = str(tags['TPE1'])
-
-                # 如果没有获取到标题，使用文件名
-                if not title:
-                    title = os.path.basename(filepath).replace('.mp3', '').replace('.MP3', '')
-
-                return {
-                    'title': title,
-                    'artist': artist or 'Unknown Artist',
-                    'duration': duration,
-                    'path': filepath,
-                    'length': duration_sec
-                }
-            else:
-                # 如果没有mutagen，使用文件名作为标题
-                filename = os.path.basename(filepath)
-                title = filename.replace('.mp3', '').replace('.MP3', '')
-                return {
-                    'title': title,
-                    'artist': 'Unknown Artist',
-                    'duration': '03:00',
-                    'path': filepath,
-                    'length': 180  # 默认3分钟
-                }
-        except Exception as e:
-            print(f"Failed to read MP3 file info {filepath}: {e}")
-            filename = os.path.basename(filepath)
-            title = filename.replace('.mp3', '').replace('.MP3', '')
-            return {
-                'title': title,
-                'artist': 'Unknown Artist',
-                'duration': '03:00',
-                'path': filepath,
-                'length': 180  # 默认3分钟
-            }
-
-    def add_songs(self, filepaths):
-        """添加歌曲到播放列表"""
-        added_count = 0
-        for filepath in filepaths:
-            # 检查文件是否已经是MP3格式
-            if filepath.lower().endswith('.mp3'):
-                # 获取歌曲信息
-                song_info = self.get_mp3_info(filepath)
-
-                # 检查是否已在播放列表中
-                existing = False
-                for song in self.playlist:
-                    if song['path'] == filepath:
-                        existing = True
-                        break
-
-                if not existing:
-                    self.playlist.append(song_info)
-                    added_count += 1
-                    print(f"Added song: {song_info['title']} - {song_info['artist']}")
-
-        if added_count > 0:
-            # 保存播放列表
-            self.save_playlist_to_config()
-
-            # 更新状态栏
-            self.update_status_bar()
+    def on_durations_updated(self, indices):
+        # 当前歌曲的时长被修正时同步到进度显示
+        if self.engine.current_index in indices:
+            song = self.playlist[self.engine.current_index]
+            self.song_length = song['length']
+            self.total_time = song['duration']
+
+    def add_songs(self, filepaths, on_done=None):
+        """在后台解析歌曲并添加到播放列表，完成后调用 on_done(添加的数量)"""
+        def added(added_count):
+            if added_count:
+                self.on_songs_added()
+                self.start_loudness_analysis()
+            if on_done:
+                on_done(added_count)
+
+        self.engine.add_files(filepaths, added)
+
+    def add_song_infos(self, song_infos, verbose=True):
+        """把已解析的歌曲信息添加到播放列表"""
+        added_count = self.engine.add_song_infos(song_infos, verbose)
+        if added_count:
+            self.on_songs_added()
+        return added_count
 
-            # 如果当前没有播放歌曲，播放第一首
-            if not self.playlist or self.current_index >= len(self.playlist):
-                self.load_song(0)
+    def on_songs_added(self):
+        # 更新状态栏
+        self.update_status_bar()
 
-        return added_count
+        # 如果当前没有播放歌曲，播放第一首
+        if not self.playlist or self.engine.current_index >= len(self.playlist):
+            self.load_song(0)
 
     def show_file_chooser(self, instance):
         """显示文件选择器"""
+        from kivy.uix.filechooser import FileChooserListView
+        from kivy.uix.modalview import ModalView
+
         print("Showing file chooser...")
         modal = ModalView(size_hint=(0.9, 0.8), auto_dismiss=True)
 
@@ -423,11 +811,9 @@ class MusicPlayerApp(App):
         def add_selected_files(instance):
             selected = filechooser.selection
             if selected:
-                added = self.add_songs(selected)
+                # 解析完成后显示添加结果
+                self.add_songs(selected, lambda added: self.show_message(f"Added {added} songs"))
                 modal.dismiss()
-
-                # 显示添加结果
-                self.show_message(f"Added {added} songs")
             else:
                 self.show_message("Please select files first")
 
@@ -444,6 +830,9 @@ class MusicPlayerApp(App):
 
     def import_music_folder(self, instance):
         """导入整个文件夹的音乐文件"""
+        from kivy.uix.filechooser import FileChooserListView
+        from kivy.uix.modalview import ModalView
+
         print("Showing folder chooser...")
         modal = ModalView(size_hint=(0.9, 0.8), auto_dismiss=True)
 
@@ -478,21 +867,10 @@ class MusicPlayerApp(App):
         def import_folder_files(instance):
             selected = dirchooser.selection
             if selected and os.path.isdir(selected[0]):
-                folder_path = selected[0]
-
-                # 查找文件夹中的所有MP3文件
-                mp3_files = []
-                for root, dirs, files in os.walk(folder_path):
-                    for file in files:
-                        if file.lower().endswith('.mp3'):
-                            mp3_files.append(os.path.join(root, file))
-
-                if mp3_files:
-                    added = self.add_songs(mp3_files)
-                    modal.dismiss()
-                    self.show_message(f"Imported {added} songs from folder")
-                else:
-                    self.show_message("No MP3 files found in folder")
+                modal.dismiss()
+
+                # 在后台查找并解析文件夹中的所有MP3文件
+                self.start_folder_import(selected[0])
             else:
                 self.show_message("Please select a folder first")
 
@@ -507,8 +885,165 @@ class MusicPlayerApp(App):
         modal.add_widget(container)
         modal.open()
 
+    def start_folder_import(self, folder_path):
+        """启动后台文件夹导入"""
+        if self.importer:
+            self.show_message("An import is already running")
+            return
+
+        print(f"Importing folder: {folder_path}")
+        self.import_added = 0
+        known_paths = set(self.playlist.paths())
+        engine = self.engine
+
+        def on_batch(batch):
+            Clock.schedule_once(lambda dt: self.on_import_batch(batch))
+
+        def on_progress(parsed, found, walk_done):
+            Clock.schedule_once(lambda dt: self.on_import_progress(parsed, found, walk_done))
+
+        def on_done(parsed, cancelled):
+            # 在工作线程中提交缓存，避免阻塞UI；目录快照交给UI线程记录
+            if engine.metadata_cache:
+                engine.metadata_cache.flush()
+            snapshot = importer.snapshot
+            Clock.schedule_once(lambda dt: self.on_import_done(parsed, cancelled, folder_path, snapshot))
+
+        importer = self.importer = FolderImporter(folder_path, engine.parse_import_file,
+                                       known_paths=known_paths,
+                                       on_batch=on_batch,
+                                       on_progress=on_progress,
+                                       on_done=on_done)
+        self.show_import_progress()
+        self.importer.start()
+
+    def cancel_folder_import(self, instance=None):
+        """取消后台导入，已导入的歌曲会保留"""
+        if self.importer:
+            self.importer.cancel()
+            self.import_status_label.text = "Cancelling..."
+
+    def on_import_batch(self, batch):
+        # 在UI线程中把一批歌曲追加到播放列表
+        if self.importer and not self.importer.cancelled:
+            self.import_added += self.add_song_infos(batch, verbose=False)
+
+    def on_import_progress(self, parsed, found, walk_done):
+        if not self.import_modal:
+            return
+        self.import_progress_bar.max = max(found, 1)
+        self.import_progress_bar.value = parsed
+        if walk_done:
+            self.import_status_label.text = f"Importing {parsed}/{found} songs"
+        else:
+            self.import_status_label.text = f"Importing {parsed} songs, scanning..."
+
+    def on_import_done(self, parsed, cancelled, folder_path, snapshot):
+        self.importer = None
+        self.engine.flush_metadata()
+        if not cancelled:
+            self.engine.set_folder_snapshot(folder_path, snapshot)
+        if self.import_added:
+            self.start_loudness_analysis()
+        if self.import_modal:
+            self.import_modal.dismiss()
+            self.import_modal = None
+
+        if cancelled:
+            self.show_message(f"Import cancelled, added {self.import_added} songs")
+        elif parsed == 0:
+            self.show_message("No new MP3 files found in folder")
+        else:
+            self.show_message(f"Imported {self.import_added} songs from folder")
+
+    def rescan_library(self, instance=None, deep=False):
+        """在后台增量重新扫描已导入的文件夹
+
+        只列出修改时间有变化的目录，其余目录沿用快照；deep为True时
+        还会检查每个文件的大小和修改时间（可发现原地修改标签的文件）。
+        """
+        if self.importer or self.rescanning or not self.engine.library_loaded:
+            return
+        roots = self.engine.folder_snapshots.get_roots()
+        if not roots:
+            if instance is not None:
+                self.show_message("No imported folders to rescan")
+            return
+
+        self.rescanning = True
+        print(f"Rescanning {len(roots)} folders...")
+
+        def scan():
+            try:
+                result = self.engine.scan_roots(roots, deep)
+            except Exception as e:
+                print(f"Rescan failed: {e}")
+                result = {}, [], [], []
+            Clock.schedule_once(lambda dt: self.on_rescan_done(*result))
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def on_rescan_done(self, snapshots, added_infos, updated_infos, removed):
+        """在UI线程中把重新扫描的差异应用到播放列表"""
+        self.rescanning = False
+        added_count, updated, removed_count, current_removed = self.engine.apply_rescan(
+            snapshots, added_infos, updated_infos, removed)
+        updated_count = len(updated)
+        self.refresh_playlist_rows(updated)
+
+        if current_removed:
+            # 当前歌曲被删除时显示新的当前歌曲
+            if self.playlist:
+                self.load_song(self.engine.current_index, load_audio=False)
+            else:
+                self.reset_current_song()
+        elif removed_count:
+            self.update_playlist_highlight()
+        if updated_count and self.engine.current_path() is not None:
+            song = self.playlist[self.engine.current_index]
+            self.current_title = song['title']
+            self.current_artist = song['artist']
+        if added_count:
+            self.on_songs_added()
+        else:
+            self.update_status_bar()
+
+        if added_count or updated_count:
+            self.start_loudness_analysis()
+        if added_count or updated_count or removed_count:
+            self.show_message(f"Library updated: {added_count} added, "
+                              f"{updated_count} updated, {removed_count} removed")
+
+    def show_import_progress(self):
+        """显示导入进度和取消按钮"""
+        from kivy.uix.modalview import ModalView
+        from kivy.uix.progressbar import ProgressBar
+
+        modal = ModalView(size_hint=(0.8, 0.3), auto_dismiss=False)
+
+        container = ColoredBoxLayout(orientation='vertical', spacing=10, padding=20, bg_color=(0.1, 0.1, 0.18, 1))
+
+        self.import_status_label = Label(text="Scanning folder...", font_size=18, color=(1, 1, 1, 1))
+        self.import_progress_bar = ProgressBar(max=1, value=0)
+        cancel_btn = Button(text="Cancel", font_size=18,
+                            background_normal='',
+                            background_color=(0.3, 0.3, 0.4, 1),
+                            color=(1, 1, 1, 1),
+                            size_hint=(1, 0.4))
+        cancel_btn.bind(on_press=self.cancel_folder_import)
+
+        container.add_widget(self.import_status_label)
+        container.add_widget(self.import_progress_bar)
+        container.add_widget(cancel_btn)
+
+        modal.add_widget(container)
+        self.import_modal = modal
+        modal.open()
+
     def show_message(self, message):
         """显示消息提示"""
+        from kivy.uix.modalview import ModalView
+
         modal = ModalView(size_hint=(0.6, 0.3), auto_dismiss=True)
 
         container = ColoredBoxLayout(orientation='vertical', spacing=10, padding=20, bg_color=(0.1, 0.1, 0.18, 1))
@@ -531,182 +1066,341 @@ class MusicPlayerApp(App):
 
         modal.open()
 
-    def load_song(self, index):
+    @profiler.timed('load_song')
+    def load_song(self, index, load_audio=True):
         if not self.playlist or index < 0 or index >= len(self.playlist):
             return
 
-        self.current_index = index
+        # 没有播放完就切换的歌曲记为跳过
+        self.finish_track_stats(completed=False)
+
+        self.engine.current_index = index
         song = self.playlist[index]
+        self.update_playlist_highlight()
 
         # 停止当前播放
-        if self.sound:
-            self.sound.stop()
-            self.sound = None
+        self.release_sound()
+        if self.spectrum is not None:
+            self.spectrum.stop()
 
         # 更新UI
         self.current_title = song["title"]
         self.current_artist = song["artist"]
         self.total_time = song["duration"]
 
+        # 应用已分析好的回放增益
+        cache = self.engine.metadata_cache
+        self.apply_track_gain(cache.get_gain(song['path']) if cache else None)
+
+        # 封面在后台解码，已缓存时立即显示
+        self.album_art.set_cover(self.art_cache.get(song['path'], self.on_album_art_loaded))
+
+        # 波形在后台计算，已缓存时立即显示（不需要解码）
+        if self.waveform_cache is not None:
+            self.set_waveform(self.waveform_cache.get(song['path'], self.on_waveform_loaded))
+
         # 更新状态栏
         self.update_status_bar()
 
         # 重置进度
+        self.playback_clock.reset()
         self.progress_value = 0
         self.current_time = "00:00"
         self.song_length = song.get("length", 180)
 
-        # 尝试加载音频文件
-        try:
-            self.sound = SoundLoader.load(song['path'])
-            if self.sound:
-                self.sound.volume = self.volume
-                print(f"Audio loaded: {song['path']}")
+        # 更新播放按钮状态
+        self.play_btn.text = "Play"
+        self.is_playing = False
+        self.play_when_ready = False
+        self.reschedule_progress()
+
+        print(f"Loaded song: {song['title']} - {song['artist']}")
+
+        # 尝试加载音频文件：优先使用已预加载的音频，否则在后台加载
+        self.loading_path = None
+        if load_audio:
+            sound = self.sound_cache.take(song['path'])
+            if sound is not None:
+                self.on_sound_loaded(song['path'], sound, 0.0, cached=True)
             else:
-                print(f"Failed to load audio: {song['path']}")
-        except Exception as e:
-            print(f"Error loading audio: {e}")
-            self.sound = None
+                self.loading_path = song['path']
+                self.sound_cache.request(song['path'], self.on_sound_loaded)
+
+    def on_sound_loaded(self, path, sound, latency, cached=False):
+        """音频加载完成（在UI线程调用），已经切到别的歌时放入缓存"""
+        if not cached:
+            # 记录加载耗时，方便发现较慢的文件或存储
+            self.load_latencies.append((path, latency))
+            print(f"Audio load took {latency * 1000:.0f} ms: {path}")
+
+        if not cached and (path != self.loading_path or path != self.engine.current_path()):
+            if sound:
+                self.sound_cache.put(path, sound)
+            return
+        self.loading_path = None
 
-        # 更新播放按钮状态
+        if not sound:
+            print(f"Failed to load audio: {path}")
+            if self.play_when_ready:
+                self.play_when_ready = False
+                self.show_message("Failed to load audio file")
+            return
+
+        self.sound = sound
+        self.sound_path = path
+        self.sound.bind(on_stop=self.on_sound_stop)
+        self.sound.volume = self.output_volume()
+        # 音频后端给出的时长比元数据（或默认的3分钟）更可靠
+        if self.sound.length > 0:
+            self.song_length = self.sound.length
+        print(f"Audio loaded: {path}")
+        self.mark_startup_stage('first_audio')
+
+        # 在后台准备下一首
+        self.prefetch_next()
+
+        if self.play_when_ready:
+            self.play_when_ready = False
+            self.toggle_play(None)
+
+    def release_sound(self):
+        """停止当前音频并放回缓存，切回这首歌时无需重新加载"""
         if self.sound:
-            self.play_btn.text = "Play"
-            self.is_playing = False
-        else:
-            self.play_btn.text = "Play"
-            self.is_playing = False
+            self.sound.unbind(on_stop=self.on_sound_stop)
+            self.sound.stop()
+            self.sound_cache.put(self.sound_path, self.sound)
+            self.sound = None
+            self.sound_path = None
 
-        print(f"Loaded song: {song['title']} - {song['artist']}")
+    def prefetch_next(self):
+        if len(self.playlist) > 1:
+            self.sound_cache.prefetch(self.playlist.path(self.engine.peek_next_index()))
 
     def toggle_play(self, instance):
         if not self.playlist:
             self.show_message("Playlist is empty, please import songs first")
             return
 
-        if self.current_index >= len(self.playlist):
+        if self.engine.current_index >= len(self.playlist):
             self.load_song(0)
             return
 
         if not self.sound:
-            # 如果没有音频，重新加载
-            self.load_song(self.current_index)
+            # 如果没有音频，重新加载；在后台加载时等加载完成后再播放
+            if self.loading_path is None:
+                self.load_song(self.engine.current_index)
+            if self.loading_path is not None:
+                self.play_when_ready = True
+                return
 
         if not self.sound:
             self.show_message("Failed to load audio file")
             return
 
         if self.is_playing:
-            # 暂停播放
-            self.sound.stop()
+            # 暂停播放（先更新状态，避免on_stop被当作播放结束）
+            self.playback_clock.pause()
             self.is_playing = False
+            self.sound.stop()
             self.play_btn.text = "Play"
             print("Music paused")
         else:
-            # 开始播放
+            # 开始播放，从暂停（或拖动进度条）的位置继续
+            position = self.playback_clock.position()
             self.sound.play()
+            if position > 0:
+                try:
+                    self.sound.seek(position)
+                except Exception as e:
+                    print(f"Failed to seek: {e}")
+            self.playback_clock.start()
             self.is_playing = True
+            self.engine.record_play_started()
+
+            # 在后台分析当前歌曲的频谱
+            if self.spectrum is not None:
+                self.spectrum.start(self.engine.current_path(), position)
             self.play_btn.text = "Pause"
             print("Playing music")
 
-            # 开始更新进度
-            if hasattr(self, 'progress_event'):
-                Clock.unschedule(self.progress_event)
-            self.progress_event = Clock.schedule_interval(self.update_progress, 0.5)
+        # 开始（或停止）更新进度
+        self.reschedule_progress()
+
+    def reschedule_progress(self):
+        """根据播放状态调整进度更新频率：前台播放时快，后台时慢，暂停时停止"""
+        if self.progress_event is not None:
+            self.progress_event.cancel()
+            self.progress_event = None
+        if self.is_playing:
+            interval = 1.0 if self.in_background else 0.1
+            self.progress_event = Clock.schedule_interval(self.update_progress, interval)
+
+    def on_window_minimize(self, *args):
+        self.in_background = True
+        self.reschedule_progress()
+
+    def on_window_restore(self, *args):
+        self.in_background = False
+        self.reschedule_progress()
+        self.update_progress(0)
+
+    def on_pause(self):
+        # 切到后台时降低唤醒频率，返回True让应用保持运行
+        self.on_window_minimize()
+        return True
 
+    def on_resume(self):
+        self.on_window_restore()
+        # 切到后台期间文件夹可能有变化
+        self.rescan_library()
+
+    @profiler.timed('update_progress')
     def update_progress(self, dt):
-        if self.is_playing and self.sound:
-            # 获取当前播放位置（SoundLoader没有直接获取当前位置的方法）
-            # 所以我们模拟进度
-            if self.song_length > 0:
-                # 简单模拟：每0.5秒增加一定百分比
-                increment = 100 * dt / self.song_length
-                self.progress_value = min(self.progress_value + increment, 100)
-
-                # 更新时间显示
-                current_seconds = int(self.progress_value / 100 * self.song_length)
-                minutes = current_seconds // 60
-                seconds = current_seconds % 60
-                self.current_time = f"{minutes:02d}:{seconds:02d}"
-
-                # 如果到达结尾，根据循环模式处理
-                if self.progress_value >= 100:
-                    if self.repeat_mode:
-                        # 单曲循环
-                        self.progress_value = 0
-                        self.sound.seek(0)
-                        self.sound.play()
-                    else:
-                        # 播放下一首
-                        self.next_song()
+        if not (self.is_playing and self.sound):
+            return
 
-    def on_progress_change(self, instance, value):
-        # 在实际应用中，这里会设置音频的播放位置
-        current_seconds = int(value / 100 * self.song_length)
+        # 以音频后端报告的位置校正播放时钟
+        try:
+            backend_position = self.sound.get_pos()
+        except Exception:
+            backend_position = None
+        position = self.playback_clock.sync(backend_position)
+
+        # 后端停止即表示播放结束；后端不报告位置时才用时长判断
+        ended = self.sound.state == 'stop'
+        if not self.playback_clock.backend_seen and self.song_length > 0:
+            ended = ended or position >= self.song_length
+
+        if ended:
+            self.on_track_end()
+        elif not self.in_background:
+            self.set_progress(position)
+
+    def on_sound_stop(self, instance):
+        # 音频自然播放结束时立即切换，不必等下一次进度更新
+        if self.is_playing and instance is self.sound:
+            self.on_track_end()
+
+    def on_track_end(self):
+        self.finish_track_stats(completed=True)
+        if self.engine.repeat_mode:
+            # 单曲循环
+            self.set_progress(0)
+            self.sound.seek(0)
+            self.sound.play()
+            self.playback_clock.start(0)
+            self.engine.record_play_started()
+        else:
+            # 播放下一首（通常已经预加载好）
+            self.next_song()
+            self.toggle_play(None)
+
+    def finish_track_stats(self, completed):
+        # 记录正在播放的歌曲播放完成或被跳过
+        self.engine.finish_track(completed, self.playback_clock.position(), self.song_length)
+
+    def set_progress(self, position):
+        # 更新进度条和时间显示
+        if self.song_length > 0:
+            self.progress_value = min(100 * position / self.song_length, 100)
+        current_seconds = int(position)
         minutes = current_seconds // 60
         seconds = current_seconds % 60
         self.current_time = f"{minutes:02d}:{seconds:02d}"
 
-        # 如果正在播放，跳转到指定位置
-        if self.is_playing and self.sound and hasattr(self.sound, 'seek'):
+    def on_progress_value(self, instance, value):
+        # 程序更新进度时不触发跳转
+        self.updating_progress = True
+        self.progress_slider.value = value
+        self.updating_progress = False
+
+    def on_progress_change(self, instance, value):
+        if self.updating_progress:
+            return
+
+        # 用户拖动进度条：跳转到指定位置
+        position = value / 100 * self.song_length
+        self.playback_clock.seek(position)
+        self.set_progress(position)
+
+        # 如果正在播放，跳转到指定位置，频谱分析也从新位置继续
+        if self.is_playing and self.sound:
             try:
-                self.sound.seek(current_seconds)
-            except:
-                pass
+                self.sound.seek(position)
+            except Exception as e:
+                print(f"Failed to seek: {e}")
+            if self.spectrum is not None:
+                self.spectrum.seek(position)
 
     def prev_song(self, instance=None):
         if not self.playlist:
             return
 
-        new_index = (self.current_index - 1) % len(self.playlist)
-        self.load_song(new_index)
+        # 随机播放时沿随机顺序后退
+        self.load_song(self.engine.prev_index())
 
     def next_song(self, instance=None):
         if not self.playlist:
             return
 
-        new_index = (self.current_index + 1) % len(self.playlist)
-        self.load_song(new_index)
+        self.load_song(self.engine.next_index())
 
     def shuffle_playlist(self, instance):
-        # 随机播放
+        # 切换随机播放；开启时从随机顺序中的下一首开始
+        self.engine.set_shuffle(not self.engine.shuffle_mode)
+        if self.engine.shuffle_mode:
+            self.shuffle_btn.background_color = (0.9, 0.35, 0, 1)  # 橙色
+            print("Shuffle on")
+            if self.playlist:
+                self.next_song()
+        else:
+            self.shuffle_btn.background_color = (0.3, 0.3, 0.4, 1)  # 深蓝色
+            print("Shuffle off")
         if self.playlist:
-            new_index = random.randint(0, len(self.playlist) - 1)
-            self.load_song(new_index)
-            print("Shuffle play")
+            self.prefetch_next()
 
     def toggle_repeat(self, instance):
-        self.repeat_mode = not self.repeat_mode
-        if self.repeat_mode:
+        self.engine.repeat_mode = not self.engine.repeat_mode
+        if self.engine.repeat_mode:
             self.repeat_btn.background_color = (0.9, 0.35, 0, 1)  # 橙色
             print("Repeat on")
         else:
             self.repeat_btn.background_color = (0.3, 0.3, 0.4, 1)  # 深蓝色
             print("Repeat off")
 
+    def get_playback_position(self):
+        """当前播放位置（秒）"""
+        return self.playback_clock.position()
+
+    @profiler.timed('update_visualizer')
     def update_visualizer(self, dt):
+        # 取与播放位置对齐的频谱帧；暂停或尚未分析到时显示低高度
+        levels = None
+        if self.is_playing and self.spectrum is not None:
+            levels = self.spectrum.band_levels(self.get_playback_position())
+
         for i, bar in enumerate(self.bars):
-            # 如果正在播放，显示动态效果；否则显示静态效果
-            if self.is_playing:
-                # 使可视化效果更自然，根据位置有不同的基础高度
-                base_height = 0.1 + 0.3 * (i / 9)
-                variation = random.uniform(0, 0.6)
-                height = base_height + variation
+            if levels is not None:
+                # 上升立即跟随，下降时平滑回落
+                target = 0.1 + 0.9 * float(levels[i])
+                height = max(target, self.bar_levels[i] - 1.5 * dt)
             else:
                 height = 0.1  # 播放暂停时显示低高度
+            self.bar_levels[i] = height
+
+            # 根据高度设置颜色
+            color = self.bar_colors[i]
+            if height > 0.8:
+                color.rgb = (0.9, 0.35, 0)  # 橙色
+            elif height > 0.5:
+                color.rgb = (0.9, 0.55, 0.2)  # 黄色
+            else:
+                color.rgb = (0.9, 0.7, 0.3)  # 浅黄色
 
-            bar.size_hint_y = height
-            bar.canvas.before.clear()
-            with bar.canvas.before:
-                # 根据高度设置颜色
-                if height > 0.8:
-                    Color(0.9, 0.35, 0, 1)  # 橙色
-                elif height > 0.5:
-                    Color(0.9, 0.55, 0.2, 1)  # 黄色
-                else:
-                    Color(0.9, 0.7, 0.3, 1)  # 浅黄色
-
-                # 绘制矩形
-                Rectangle(pos=bar.pos, size=(bar.width, bar.height * height))
+            # 更新矩形
+            rect = self.bar_rects[i]
+            rect.pos = bar.pos
+            rect.size = (bar.width, bar.height * height)
 
     def show_playlist(self, instance):
         """显示播放列表"""
@@ -714,6 +1408,23 @@ class MusicPlayerApp(App):
             self.show_message("Playlist is empty, please import songs first")
             return
 
+        # 弹窗只创建一次，之后复用
+        if self.playlist_modal is None:
+            self.build_playlist_modal()
+        self.sync_playlist_view()
+
+        self.playlist_modal.open()
+
+        # 等布局完成后跳转到当前歌曲
+        Clock.schedule_once(self.scroll_playlist_to_current)
+
+    def build_playlist_modal(self):
+        """创建播放列表弹窗，列表只为可见的行创建控件"""
+        from kivy.uix.modalview import ModalView
+        from kivy.uix.recycleboxlayout import RecycleBoxLayout
+        from kivy.uix.recycleview import RecycleView
+        from kivy.uix.textinput import TextInput
+
         # 创建播放列表弹窗
         modal = ModalView(size_hint=(0.9, 0.8), auto_dismiss=True)
 
@@ -722,8 +1433,8 @@ class MusicPlayerApp(App):
 
         # 标题和统计信息
         title_box = BoxLayout(size_hint=(1, 0.1))
-        title = Label(text=f"Playlist ({len(self.playlist)} songs)", font_size=24, bold=True,
-                      color=(0.98, 0.82, 0.13, 1))
+        self.playlist_title = Label(text=f"Playlist ({len(self.playlist)} songs)", font_size=24, bold=True,
+                                    color=(0.98, 0.82, 0.13, 1))
 
         clear_btn = Button(text="Clear All", font_size=14,
                            background_normal='',
@@ -732,53 +1443,131 @@ class MusicPlayerApp(App):
                            size_hint=(0.3, 1))
         clear_btn.bind(on_press=self.clear_playlist)
 
-        title_box.add_widget(title)
+        title_box.add_widget(self.playlist_title)
         title_box.add_widget(clear_btn)
         container.add_widget(title_box)
 
-        # 滚动视图
-        scroll = ScrollView(size_hint=(1, 0.9))
-        playlist_layout = GridLayout(cols=1, spacing=5, size_hint_y=None)
-        playlist_layout.bind(minimum_height=playlist_layout.setter('height'))
-
-        # 添加播放列表项
-        for i, song in enumerate(self.playlist):
-            btn = PlaylistButton(song_data=song, index=i)
-
-            # 如果是当前歌曲，高亮显示
-            if i == self.current_index:
-                btn.background_color = (0.9, 0.35, 0, 0.7)
-
-            playlist_layout.add_widget(btn)
-
-        scroll.add_widget(playlist_layout)
-        container.add_widget(scroll)
+        # 搜索框，输入时即时过滤
+        search_input = TextInput(hint_text="Search title, artist or file name",
+                                 multiline=False, font_size=16,
+                                 size_hint=(1, 0.08))
+        search_input.bind(text=self.on_search_text)
+        container.add_widget(search_input)
+
+        # 可复用行的列表视图
+        self.playlist_rv = RecycleView(size_hint=(1, 0.82),
+                                       data_model=PlaylistDataModel(data=PlaylistRows(self.playlist, [])))
+        self.playlist_rv_layout = RecycleBoxLayout(orientation='vertical', spacing=5,
+                                                   default_size=(None, 70),
+                                                   default_size_hint=(1, None),
+                                                   size_hint_y=None)
+        self.playlist_rv_layout.bind(minimum_height=self.playlist_rv_layout.setter('height'))
+        self.playlist_rv.add_widget(self.playlist_rv_layout)
+        # viewclass 保存在布局中，必须在加入布局之后设置
+        self.playlist_rv.viewclass = PlaylistButton
+        container.add_widget(self.playlist_rv)
 
         modal.add_widget(container)
-        modal.open()
+        self.playlist_modal = modal
+
+    def on_search_text(self, instance, text):
+        self.search_query = text.strip()
+        self.sync_playlist_view()
+
+    def on_playlist(self, store):
+        # 播放列表变化时延迟同步列表视图，同一帧内的多次修改只处理一次
+        if self.playlist_rv is not None:
+            self.playlist_view_trigger()
+
+    def sync_playlist_view(self, *args):
+        """让列表视图与播放列表（或搜索结果）一致，追加歌曲时只添加新行
+
+        行在显示时才读取歌曲信息，打开或刷新列表不需要解码整个播放列表。
+        """
+        if self.search_query:
+            result = self.engine.search(self.search_query)
+            if result is None:
+                # 索引建立完成后 on_search_ready 会再次同步
+                self.playlist_rv.data = PlaylistRows(self.playlist, [])
+                self.playlist_title.text = "Indexing..."
+                return
+            matches, total = result
+            self.playlist_rv.data = PlaylistRows(self.playlist, matches)
+            if total > len(matches):
+                # 只显示了前一部分结果
+                self.playlist_title.text = f"Showing first {len(matches)} of {total} songs"
+            else:
+                self.playlist_title.text = f"Found {total} songs"
+            return
+
+        rows = self.playlist_rv.data
+        count = len(self.playlist)
+        if rows.indices is None and rows.count <= count and (
+                rows.count == 0 or rows.last_path == self.playlist.path(rows.count - 1)):
+            if rows.count < count:
+                self.playlist_rv.data_model.appended(count)
+        else:
+            self.playlist_rv.data = PlaylistRows(self.playlist)
+        self.playlist_title.text = f"Playlist ({count} songs)"
+
+    def refresh_playlist_rows(self, indices):
+        # 歌曲被原地替换时行数和最后一行不变，sync_playlist_view 看不出变化；
+        # 搜索结果在同步时会重新搜索，不需要处理
+        if self.playlist_rv is not None and indices and self.playlist_rv.data.indices is None:
+            self.playlist_rv.data_model.modified(indices)
+
+    def on_search_ready(self):
+        # 搜索索引建立完成，显示等待中的搜索结果
+        if self.playlist_rv is not None and self.search_query:
+            self.sync_playlist_view()
+
+    def update_playlist_highlight(self):
+        # 只更新当前可见的行
+        if self.playlist_rv is not None:
+            for view in self.playlist_rv_layout.children:
+                view.update_highlight(self.engine.current_index)
+
+    def scroll_playlist_to_current(self, *args):
+        """滚动列表使当前歌曲位于可见区域中间"""
+        rv = self.playlist_rv
+        scrollable = self.playlist_rv_layout.height - rv.height
+        if scrollable <= 0 or self.search_query:
+            return
+        row_height = 70 + self.playlist_rv_layout.spacing
+        offset = self.engine.current_index * row_height - (rv.height - row_height) / 2
+        rv.scroll_y = 1 - min(max(offset / scrollable, 0), 1)
 
     def clear_playlist(self, instance):
         """清空播放列表"""
-        self.playlist = []
-        self.save_playlist_to_config()
+        self.engine.clear()
         self.update_status_bar()
-        self.current_index = 0
+        self.reset_current_song()
+        self.sound_cache.clear()
+
+        # 关闭播放列表弹窗
+        if self.playlist_modal is not None:
+            self.playlist_modal.dismiss()
+
+        self.show_message("Playlist cleared")
+
+    def reset_current_song(self):
+        """没有可播放的歌曲时，停止播放并重置界面"""
+        self.finish_track_stats(completed=False)
+        self.engine.current_index = 0
         self.current_title = "No Song Selected"
         self.current_artist = ""
         self.total_time = "00:00"
         self.progress_value = 0
+        self.create_default_album_art()
 
         # 停止播放
-        if self.sound:
-            self.sound.stop()
-            self.sound = None
-
-        # 关闭播放列表弹窗
-        for child in self.layout.walk():
-            if isinstance(child, ModalView):
-                child.dismiss()
-
-        self.show_message("Playlist cleared")
+        self.is_playing = False
+        self.release_sound()
+        if self.spectrum is not None:
+            self.spectrum.stop()
+        self.playback_clock.reset()
+        self.play_btn.text = "Play"
+        self.reschedule_progress()
 
     def on_album_click(self, instance):
         # 点击专辑封面时切换播放/暂停
@@ -786,15 +1575,34 @@ class MusicPlayerApp(App):
 
     def on_stop(self):
         # 停止播放
-        if self.sound:
-            self.sound.stop()
+        self.is_playing = False
+        self.release_sound()
+        self.sound_cache.clear()
+
+        # 停止后台导入和响度分析
+        if self.importer:
+            self.importer.cancel()
+        if self.loudness_analyzer is not None:
+            # 等分析线程结束：它会写入马上要关闭的元数据缓存
+            self.loudness_analyzer.stop(wait=True)
 
-        # 保存播放列表
-        self.save_playlist_to_config()
+        # 把尚未写盘的播放列表、缓存和播放统计保存下来
+        self.engine.close()
 
         # 取消所有定时器
-        if hasattr(self, 'progress_event'):
-            Clock.unschedule(self.progress_event)
+        if self.progress_event is not None:
+            self.progress_event.cancel()
+
+        # 开启了性能记录时自动导出trace（移动端没有F11）
+        if profiler.enabled:
+            self.export_profile_trace(show=False)
+
+        if self.control_server is not None:
+            self.control_server.stop()
+
+        if USE_MIXER:
+            from mixer_sound import close_output
+            close_output()
 
         return super().on_stop()
 
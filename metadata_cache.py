@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+
+
+# MP3元数据磁盘缓存
+class MetadataCache(object):
+    """以 (路径, 文件大小, 修改时间) 为键的SQLite元数据缓存
+
+    estimated标记时长只是估计值（尚未完整扫描），读取时以 'estimated': True 返回。
+    loudness、peak、gain是响度分析的结果，gain为NULL表示尚未分析；
+    文件变化后这些结果随记录一起失效。
+    """
+
+    # 累积多少条写入后提交一次事务
+    COMMIT_EVERY = 200
+
+    def __init__(self, db_path="metadata_cache.db"):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pending_writes = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " title TEXT,"
+            " artist TEXT,"
+            " duration TEXT,"
+            " length REAL,"
+            " estimated INTEGER NOT NULL DEFAULT 0,"
+            " loudness REAL,"
+            " peak REAL,"
+            " gain REAL)"
+        )
+        # 旧版本创建的表缺少后来增加的列
+        for column in ("estimated INTEGER NOT NULL DEFAULT 0", "loudness REAL", "peak REAL", "gain REAL"):
+            try:
+                self.conn.execute("ALTER TABLE tracks ADD COLUMN " + column)
+            except sqlite3.OperationalError:
+                pass
+        self.conn.commit()
+
+    def get(self, filepath, stat=None):
+        """返回缓存的元数据；文件已变化或不存在时删除旧记录并返回None"""
+        if stat is None:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                self.invalidate(filepath)
+                return None
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, title, artist, duration, length, estimated"
+                " FROM tracks WHERE path = ?", (filepath,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            size, mtime_ns, title, artist, duration, length, estimated = row
+            if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+                # 文件已被修改，缓存失效
+                self.conn.execute("DELETE FROM tracks WHERE path = ?", (filepath,))
+                self._count_write()
+                return None
+
+        info = {
+            'title': title,
+            'artist': artist,
+            'duration': duration,
+            'path': filepath,
+            'length': length
+        }
+        if estimated:
+            info['estimated'] = True
+        return info
+
+    def put(self, filepath, info, stat=None, estimated=False):
+        """写入一条元数据记录"""
+        if stat is None:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                return
+
+        with self.lock:
+            # 文件未变化时保留已有的响度分析结果
+            self.conn.execute(
+                "INSERT INTO tracks"
+                " (path, size, mtime_ns, title, artist, duration, length, estimated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET"
+                " loudness = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN loudness END,"
+                " peak = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN peak END,"
+                " gain = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN gain END,"
+                " size = excluded.size, mtime_ns = excluded.mtime_ns, title = excluded.title,"
+                " artist = excluded.artist, duration = excluded.duration, length = excluded.length,"
+                " estimated = excluded.estimated",
+                (filepath, stat.st_size, stat.st_mtime_ns, info['title'],
+                 info['artist'], info['duration'], info['length'], int(estimated))
+            )
+            self._count_write()
+
+    def set_loudness(self, filepath, loudness, peak, gain):
+        """保存响度分析结果（只更新已有的记录）"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE tracks SET loudness = ?, peak = ?, gain = ? WHERE path = ?",
+                (loudness, peak, gain, filepath)
+            )
+            self._count_write()
+
+    def get_gain(self, filepath):
+        """返回回放增益（dB），尚未分析时返回None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT gain FROM tracks WHERE path = ?", (filepath,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def missing_loudness(self, paths):
+        """返回paths中有记录但尚未分析响度的路径（保持原顺序）"""
+        with self.lock:
+            missing = set(row[0] for row in self.conn.execute(
+                "SELECT path FROM tracks WHERE gain IS NULL"))
+        return [path for path in paths if path in missing]
+
+    def invalidate(self, filepath):
+        """删除某个文件的缓存记录"""
+        with self.lock:
+            self.conn.execute("DELETE FROM tracks WHERE path = ?", (filepath,))
+            self._count_write()
+
+    def prune(self):
+        """清理已不存在的文件对应的记录，返回删除的条数"""
+        with self.lock:
+            paths = [row[0] for row in self.conn.execute("SELECT path FROM tracks")]
+        missing = [(path,) for path in paths if not os.path.exists(path)]
+        if missing:
+            with self.lock:
+                self.conn.executemany("DELETE FROM tracks WHERE path = ?", missing)
+                self.conn.commit()
+                self.pending_writes = 0
+        return len(missing)
+
+    def flush(self):
+        """提交所有未写入的修改"""
+        with self.lock:
+            if self.pending_writes:
+                self.conn.commit()
+                self.pending_writes = 0
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+    def _count_write(self):
+        # 调用方需持有锁
+        self.pending_writes += 1
+        if self.pending_writes >= self.COMMIT_EVERY:
+            self.conn.commit()
+            self.pending_writes = 0
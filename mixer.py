@@ -0,0 +1,353 @@
+"""流式解码和混音引擎
+
+每首歌由后台线程逐块解码到固定容量的PCM环形缓冲区，混音时用NumPy
+把各个流按增益和淡入淡出曲线叠加，内存占用与歌曲长度无关。
+
+离线渲染（不需要声卡），用于检查交叉淡化和增益：
+    python mixer.py a.mp3 b.mp3 --crossfade 3 --output mix.wav
+"""
+import argparse
+import threading
+import time
+import wave
+
+from audio_decoder import HAS_NUMPY, can_decode, stream_pcm
+
+if HAS_NUMPY:
+    import numpy as np
+
+
+# PCM环形缓冲区
+class PcmRingBuffer(object):
+    """固定容量的float32环形缓冲区，形状为 (帧数, 声道数)，一个线程写、一个线程读
+
+    写满时写入方等待；读取方不等待（实时输出），offline时等到数据足够或写入结束。
+    """
+
+    def __init__(self, capacity, channels):
+        self.data = np.zeros((capacity, channels), dtype=np.float32)
+        self.capacity = capacity
+        self.read_total = 0
+        self.write_total = 0
+        self.cond = threading.Condition()
+        self.closed = False  # 写入方已经写完（或出错）
+        self.cancelled = False
+
+    def __len__(self):
+        return self.write_total - self.read_total
+
+    @property
+    def drained(self):
+        return self.closed and self.write_total == self.read_total
+
+    def write(self, block):
+        """写入一块数据（空间不足时等待），被取消时返回False"""
+        offset = 0
+        while offset < len(block):
+            with self.cond:
+                while self.write_total - self.read_total >= self.capacity and not self.cancelled:
+                    self.cond.wait()
+                if self.cancelled:
+                    return False
+                count = min(len(block) - offset, self.capacity - (self.write_total - self.read_total))
+                start = self.write_total % self.capacity
+                first = min(count, self.capacity - start)
+                self.data[start:start + first] = block[offset:offset + first]
+                self.data[:count - first] = block[offset + first:offset + count]
+                self.write_total += count
+                offset += count
+                self.cond.notify_all()
+        return True
+
+    def read_into(self, out, frames, wait=False):
+        """读取最多frames帧到out的开头，返回实际读取的帧数"""
+        with self.cond:
+            if wait:
+                while self.write_total - self.read_total < frames and not (self.closed or self.cancelled):
+                    self.cond.wait()
+            count = min(frames, self.write_total - self.read_total)
+            start = self.read_total % self.capacity
+            first = min(count, self.capacity - start)
+            out[:first] = self.data[start:start + first]
+            out[first:count] = self.data[:count - first]
+            self.read_total += count
+            self.cond.notify_all()
+        return count
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def cancel(self):
+        with self.cond:
+            self.cancelled = True
+            self.closed = True
+            self.cond.notify_all()
+
+
+# 一首歌的解码流
+class TrackStream(object):
+    """后台线程把一首歌从start_frame开始解码到环形缓冲区，缓冲区满时暂停解码"""
+
+    # 每次解码的帧数
+    DECODE_FRAMES = 4096
+
+    def __init__(self, path, sample_rate, channels, capacity, start_frame=0, gain=1.0):
+        self.path = path
+        self.channels = channels
+        self.buffer = PcmRingBuffer(capacity, channels)
+        # 已经混音输出的位置（帧），用于采样精确的播放位置
+        self.frame = start_frame
+        self.gain = gain
+        self.applied_gain = gain
+        # 淡入淡出：fade为1淡入、-1淡出、0不变
+        self.fade = 0
+        self.fade_pos = 0
+        self.fade_frames = 0
+        self.ending = False  # 已经通知过播放结束（可能仍在淡出）
+        self.on_end = None
+        self.error = None
+        self.thread = threading.Thread(target=self._decode, args=(sample_rate, start_frame), daemon=True)
+        self.thread.start()
+
+    def _decode(self, sample_rate, start_frame):
+        try:
+            for block in stream_pcm(self.path, sample_rate, self.channels,
+                                    self.DECODE_FRAMES, start_frame):
+                if not self.buffer.write(block.reshape(-1, self.channels)):
+                    return
+        except Exception as e:
+            self.error = e
+            print(f"Failed to decode {self.path}: {e}")
+        finally:
+            self.buffer.close()
+
+    def start_fade(self, direction, frames):
+        self.fade = direction
+        self.fade_pos = 0
+        self.fade_frames = max(1, frames)
+
+    def close(self):
+        self.buffer.cancel()
+
+
+# 混音器
+class Mixer(object):
+    """把正在播放的流（包括淡出中的流）混合成连续的PCM输出
+
+    render() 由声卡回调或离线渲染调用，每次返回 (帧数, 声道数) 的float32数组。
+    一首歌解码完、缓冲区中只剩交叉淡化长度的数据时开始淡出并调用 on_end，
+    这时开始的下一首会在同样的时间内淡入（等功率曲线）；手动停止只做很短的淡出
+    以免爆音。增益变化在一个块内线性过渡。
+
+    实时输出时解码跟不上就输出静音并记为欠载，on_underrun(欠载次数, 缺失帧数)
+    最多每秒调用一次；offline为True时等待解码，结果与机器速度无关。
+    """
+
+    # 开始和停止时防止爆音的淡入淡出时长（秒）
+    DECLICK = 0.01
+    # 欠载报告的最短间隔（秒）
+    REPORT_INTERVAL = 1.0
+
+    def __init__(self, sample_rate=44100, channels=2, crossfade=3.0, buffer_seconds=2.0, offline=False):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.crossfade_frames = int(crossfade * sample_rate)
+        # 缓冲区至少要能容纳整个交叉淡化，才能在解码结束时提前开始淡出
+        self.capacity = int(max(buffer_seconds, crossfade + 0.5) * sample_rate)
+        self.declick_frames = int(self.DECLICK * sample_rate)
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.streams = []
+        self.volume = 1.0
+        self.applied_volume = 1.0
+        self.frames_rendered = 0
+        self.underruns = 0
+        self.underrun_frames = 0
+        self.on_underrun = None
+        self.unreported = [0, 0]
+        self.last_report = time.monotonic()
+        self.scratch = np.zeros((0, channels), dtype=np.float32)
+
+    @property
+    def available(self):
+        return can_decode()
+
+    def open(self, path, position=0.0, gain=1.0):
+        """开始解码（预缓冲）一首歌，返回的流用 start() 播放，不用时要 close()"""
+        return TrackStream(path, self.sample_rate, self.channels, self.capacity,
+                           int(round(position * self.sample_rate)), gain)
+
+    def start(self, stream):
+        """开始播放一个流；有歌曲正在结尾淡出时用同样的时长淡入"""
+        with self.lock:
+            fading = [s for s in self.streams if s.fade < 0 and s.ending]
+            if fading:
+                remaining = max(s.fade_frames - s.fade_pos for s in fading)
+                stream.start_fade(1, max(remaining, self.declick_frames))
+            else:
+                stream.start_fade(1, self.declick_frames)
+            self.streams.append(stream)
+
+    def stop(self, stream):
+        """停止一个流（短暂淡出后关闭）"""
+        with self.lock:
+            if stream in self.streams and stream.fade >= 0:
+                stream.start_fade(-1, self.declick_frames)
+            elif stream not in self.streams:
+                stream.close()
+
+    def stop_all(self):
+        with self.lock:
+            for stream in self.streams:
+                stream.close()
+            self.streams = []
+
+    def position(self, stream):
+        """流的播放位置（秒），以已经输出的帧计算"""
+        return stream.frame / float(self.sample_rate)
+
+    def render(self, frames):
+        """混合下一段输出"""
+        out = np.zeros((frames, self.channels), dtype=np.float32)
+        if len(self.scratch) < frames:
+            self.scratch = np.zeros((frames, self.channels), dtype=np.float32)
+        ramp = np.arange(frames, dtype=np.float32) / frames
+        missing = 0
+        ended = []
+
+        with self.lock:
+            for stream in list(self.streams):
+                buffer = self.scratch[:frames]
+                count = stream.buffer.read_into(buffer, frames, wait=self.offline)
+                if count < frames:
+                    if not stream.buffer.closed:
+                        missing = max(missing, frames - count)
+                    buffer[count:] = 0.0
+
+                # 增益在这一块内从上次的值线性过渡到当前值
+                envelope = stream.applied_gain + (stream.gain - stream.applied_gain) * ramp
+                stream.applied_gain = stream.gain
+                if stream.fade:
+                    t = np.clip((stream.fade_pos + np.arange(frames)) / float(stream.fade_frames), 0.0, 1.0)
+                    if stream.fade > 0:
+                        envelope *= np.sin(t * (np.pi / 2))
+                    else:
+                        envelope *= np.cos(t * (np.pi / 2))
+                    stream.fade_pos += frames
+                    if stream.fade_pos >= stream.fade_frames:
+                        if stream.fade < 0:
+                            self.streams.remove(stream)
+                            stream.close()
+                        else:
+                            stream.fade = 0
+                out += buffer * envelope[:, None]
+                stream.frame += count
+
+                # 淡入完成之后才开始结尾的淡出（很短的歌曲会在淡入结束后立即淡出）
+                if stream.fade == 0 and not stream.ending and stream.buffer.closed and \
+                        len(stream.buffer) <= self.crossfade_frames:
+                    # 解码已结束，剩余的数据用来和下一首交叉淡化
+                    stream.ending = True
+                    stream.start_fade(-1, max(len(stream.buffer), self.declick_frames))
+                    ended.append(stream)
+                elif stream.buffer.drained and stream in self.streams:
+                    self.streams.remove(stream)
+                    stream.close()
+                    # 被停止的流淡出期间播放完不算播放结束
+                    if not stream.ending and stream.fade >= 0:
+                        stream.ending = True
+                        ended.append(stream)
+
+            volume = self.applied_volume + (self.volume - self.applied_volume) * ramp
+            self.applied_volume = self.volume
+        out *= volume[:, None]
+        np.clip(out, -1.0, 1.0, out=out)
+        self.frames_rendered += frames
+
+        if missing:
+            self._underrun(missing)
+        for stream in ended:
+            if stream.on_end is not None:
+                stream.on_end(stream)
+        return out
+
+    def _underrun(self, frames):
+        self.underruns += 1
+        self.underrun_frames += frames
+        self.unreported[0] += 1
+        self.unreported[1] += frames
+        now = time.monotonic()
+        if self.on_underrun is not None and now - self.last_report >= self.REPORT_INTERVAL:
+            self.last_report = now
+            count, missing = self.unreported
+            self.unreported = [0, 0]
+            self.on_underrun(count, missing)
+
+
+# 声卡输出
+class MixerOutput(object):
+    """用miniaudio的播放设备实时输出混音结果，声卡回调线程中调用 Mixer.render()"""
+
+    def __init__(self, mixer, buffer_msec=100):
+        import miniaudio
+
+        self.mixer = mixer
+        self.device = miniaudio.PlaybackDevice(output_format=miniaudio.SampleFormat.FLOAT32,
+                                               nchannels=mixer.channels,
+                                               sample_rate=mixer.sample_rate,
+                                               buffersize_msec=buffer_msec)
+        generator = self._generate()
+        next(generator)
+        self.device.start(generator)
+
+    def _generate(self):
+        frames = yield b''
+        while True:
+            frames = yield self.mixer.render(frames).tobytes()
+
+    def close(self):
+        self.device.close()
+
+
+def render_to_wav(paths, output, crossfade=3.0, sample_rate=44100, gains=None, block_frames=1024):
+    """离线依次播放一组文件（相邻两首交叉淡化），写成16位WAV，返回输出的秒数"""
+    mixer = Mixer(sample_rate=sample_rate, crossfade=crossfade, offline=True)
+    queue = list(zip(paths, gains or [1.0] * len(paths)))
+
+    def start_next(ended=None):
+        if queue:
+            path, gain = queue.pop(0)
+            stream = mixer.open(path, gain=gain)
+            stream.on_end = start_next
+            mixer.start(stream)
+
+    start_next()
+    with wave.open(output, 'wb') as f:
+        f.setnchannels(mixer.channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        while mixer.streams:
+            block = mixer.render(block_frames)
+            f.writeframes((block * 32767).astype('<i2').tobytes())
+    return mixer.frames_rendered / float(sample_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a crossfaded mix to a WAV file")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--output', default='mix.wav')
+    parser.add_argument('--crossfade', type=float, default=3.0)
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    args = parser.parse_args()
+
+    if not can_decode():
+        return
+    started = time.perf_counter()
+    seconds = render_to_wav(args.paths, args.output, args.crossfade, args.sample_rate)
+    print(f"Rendered {seconds:.1f}s to {args.output} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
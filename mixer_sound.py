@@ -0,0 +1,167 @@
+import os
+import threading
+
+from kivy.clock import Clock
+from kivy.core.audio import Sound
+
+from mixer import Mixer, MixerOutput
+from mp3_probe import probe_mp3
+
+# 交叉淡化的时长（秒），可以用环境变量HARMONY_CROSSFADE设置
+CROSSFADE = float(os.environ.get('HARMONY_CROSSFADE', 3.0))
+
+_lock = threading.Lock()
+_mixer = None
+_output = None
+
+
+def get_mixer():
+    """所有音频共享的混音器和声卡输出，第一次调用时创建；无法使用时返回None"""
+    global _mixer, _output
+    with _lock:
+        if _mixer is None:
+            _mixer = False
+            mixer = Mixer(crossfade=CROSSFADE)
+            if not mixer.available:
+                return None
+            try:
+                _output = MixerOutput(mixer)
+            except Exception as e:
+                print(f"Failed to open audio output: {e}")
+                return None
+            mixer.on_underrun = lambda count, frames: Clock.schedule_once(
+                lambda dt: print(f"Audio underrun: {count} times, "
+                                 f"{frames * 1000 / mixer.sample_rate:.0f} ms of silence"))
+            _mixer = mixer
+        return _mixer or None
+
+
+def close_output():
+    """关闭声卡输出（退出时调用，否则声卡线程会阻止进程退出）"""
+    global _output
+    with _lock:
+        if _output is not None:
+            _output.close()
+            _output = None
+        if _mixer:
+            _mixer.stop_all()
+
+
+def prepare_mixer_sound(filepath):
+    """在后台线程中探测时长并预先解码开头，返回 (时长, 预解码的流)；混音器不可用时返回None"""
+    mixer = get_mixer()
+    if mixer is None:
+        return None
+    info = probe_mp3(filepath) if filepath.lower().endswith('.mp3') else None
+    return (info['length'] if info else 0.0), mixer.open(filepath)
+
+
+def load_mixer_sound(filepath, prepared=None):
+    """用混音器播放的音频（在主线程创建），混音器不可用时返回None
+
+    prepared 为 prepare_mixer_sound() 的结果时直接使用，不在主线程解码。
+    """
+    mixer = get_mixer()
+    if mixer is None:
+        return None
+    return MixerSound(mixer, prepared=prepared, source=filepath)
+
+
+# 混音器音频
+class MixerSound(Sound):
+    """与SoundLoader加载的音频用法相同，由共享的混音器流式解码播放
+
+    加载时预先解码开头，播放时立即有数据；播放位置按已输出的采样计算，
+    跳转精确到采样。歌曲自然结束时提前交叉淡化的时长触发on_stop，
+    这时开始播放的下一首会与它交叉淡化。
+    """
+
+    # 与当前位置相差不到这么多秒的跳转忽略，避免暂停后继续播放时重新解码
+    SEEK_TOLERANCE = 0.05
+
+    def __init__(self, mixer, prepared=None, **kwargs):
+        self.mixer = mixer
+        self.prepared = prepared
+        self.stream = None
+        self.preroll = None
+        self.position = 0.0
+        self.seconds = 0.0
+        super(MixerSound, self).__init__(**kwargs)
+
+    def load(self):
+        self.unload()
+        self.position = 0.0
+        if self.prepared is not None:
+            # 已在后台线程中准备好
+            self.seconds, self.preroll = self.prepared
+            self.prepared = None
+            return
+        info = probe_mp3(self.source) if self.source.lower().endswith('.mp3') else None
+        self.seconds = info['length'] if info else 0.0
+        self.preroll = self.mixer.open(self.source)
+
+    def unload(self):
+        for stream in (self.stream, self.preroll):
+            if stream is not None:
+                self.mixer.stop(stream)
+        self.stream = None
+        self.preroll = None
+
+    def play(self):
+        if self.stream is not None:
+            return
+        stream = self.preroll
+        self.preroll = None
+        if stream is None or stream.frame != int(round(self.position * self.mixer.sample_rate)):
+            if stream is not None:
+                stream.close()
+            stream = self.mixer.open(self.source, self.position)
+        stream.gain = stream.applied_gain = self.volume
+        stream.on_end = self._on_stream_end
+        self.mixer.start(stream)
+        self.stream = stream
+        super(MixerSound, self).play()
+
+    def stop(self):
+        if self.stream is not None:
+            self.position = self.mixer.position(self.stream)
+            self.mixer.stop(self.stream)
+            self.stream = None
+        super(MixerSound, self).stop()
+
+    def seek(self, position):
+        position = max(0.0, position)
+        if self.stream is None:
+            self.position = position
+            return
+        if abs(position - self.mixer.position(self.stream)) < self.SEEK_TOLERANCE:
+            return
+        # 从新位置重新解码，旧的流短暂淡出
+        self.mixer.stop(self.stream)
+        self.stream = None
+        self.position = position
+        self.play()
+
+    def get_pos(self):
+        if self.stream is not None:
+            return self.mixer.position(self.stream)
+        return self.position
+
+    def _get_length(self):
+        return self.seconds
+
+    def on_volume(self, instance, volume):
+        if self.stream is not None:
+            self.stream.gain = volume
+
+    def _on_stream_end(self, stream):
+        # 在声卡线程中调用，交回主线程处理
+        Clock.schedule_once(lambda dt: self._ended(stream))
+
+    def _ended(self, stream):
+        if stream is not self.stream:
+            return
+        # 流仍在混音器中淡出，之后自行关闭
+        self.stream = None
+        self.position = 0.0
+        super(MixerSound, self).stop()
@@ -0,0 +1,399 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+from track_index import audio_data_range
+
+# 比特率表（kbps），按 (MPEG版本是否为1, 层) 索引
+BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# 采样率，按版本位索引（0: MPEG2.5, 2: MPEG2, 3: MPEG1）
+SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+# 读取第一帧时最多读这么多字节，用于跳过标签后的填充并找到帧同步
+HEAD_READ = 4096
+MAX_SYNC_SEARCH = 64 * 1024
+# 完整扫描时每次读取的大小
+SCAN_CHUNK = 256 * 1024
+
+# 需要的ID3v2帧：ID3v2.3/2.4 与 ID3v2.2 的帧名
+TEXT_FRAMES = {'TIT2': 'title', 'TPE1': 'artist', 'TT2': 'title', 'TP1': 'artist'}
+
+
+def parse_frame_header(data, pos=0):
+    """解析MPEG音频帧头，返回 (帧长度, 每帧采样数, 采样率, 比特率kbps, 单声道) 或None"""
+    if len(data) < pos + 4:
+        return None
+    b1, b2, b3, b4 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b1 != 0xFF or (b2 & 0xE0) != 0xE0:
+        return None
+    version = (b2 >> 3) & 3
+    layer = 4 - ((b2 >> 1) & 3)
+    bitrate_index = b3 >> 4
+    rate_index = (b3 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b3 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    return length, samples, sample_rate, bitrate, (b4 >> 6) == 3
+
+
+def synchsafe(data):
+    value = 0
+    for b in data:
+        value = (value << 7) | (b & 0x7f)
+    return value
+
+
+def decode_text_frame(body):
+    """解码ID3v2文本帧，多个值用/连接（与mutagen一致）"""
+    if not body:
+        return ''
+    encoding, data = body[0], body[1:]
+    codec = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be'}.get(encoding, 'utf-8')
+    if codec.startswith('utf-16') and len(data) % 2:
+        data = data[:-1]
+    text = data.decode(codec, errors='replace')
+    values = [value.strip('﻿') for value in text.split('\x00')]
+    return '/'.join(value for value in values if value)
+
+
+class CountingReader(object):
+    """记录实际读取字节数的文件读取器（无缓冲，读多少算多少）"""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes_read = 0
+
+    def read_at(self, offset, size):
+        self.f.seek(offset)
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def read_id3v2(reader):
+    """只读取ID3v2的帧头和需要的文本帧，返回 (字段字典, 音频起点)
+
+    标签无法按帧读取时（整个标签做过不同步处理，或v2.2的整个标签被压缩）
+    字段字典为None。
+    """
+    fields = {}
+    header = reader.read_at(0, 10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return fields, 0
+
+    major, flags = header[3], header[5]
+    tag_end = 10 + synchsafe(header[6:10])
+    # 只有v2.4有标签尾
+    audio_start = tag_end + (10 if major >= 4 and flags & 0x10 else 0)
+    if flags & 0x80 and major < 4:
+        # 整个标签做过不同步处理，帧边界不可靠，交给mutagen读取
+        return None, audio_start
+    if major == 2 and flags & 0x40:
+        # v2.2的0x40表示整个标签被压缩（v2.2没有扩展头），无法按帧读取
+        return None, audio_start
+
+    pos = 10
+    if major >= 3 and flags & 0x40:
+        # 扩展头：v2.3的长度不含自身，v2.4的长度是synchsafe且包含自身
+        ext = reader.read_at(pos, 4)
+        if len(ext) < 4:
+            return fields, audio_start
+        pos += synchsafe(ext) if major >= 4 else struct.unpack('>I', ext)[0] + 4
+
+    header_size = 6 if major == 2 else 10
+    while pos + header_size <= tag_end and len(fields) < 2:
+        frame_header = reader.read_at(pos, header_size)
+        if len(frame_header) < header_size or frame_header[0] == 0:
+            break  # 进入填充区
+        if major == 2:
+            frame_id = frame_header[:3]
+            size = int.from_bytes(frame_header[3:6], 'big')
+            format_flags = 0
+        else:
+            frame_id = frame_header[:4]
+            size = synchsafe(frame_header[4:8]) if major >= 4 else struct.unpack('>I', frame_header[4:8])[0]
+            format_flags = frame_header[9]
+
+        name = TEXT_FRAMES.get(frame_id.decode('latin-1'))
+        if name and name not in fields:
+            # 跳过压缩或加密的帧
+            compressed = format_flags & (0x0C if major >= 4 else 0xC0)
+            if not compressed:
+                body = reader.read_at(pos + header_size, size)
+                if major >= 4 and format_flags & 0x01:
+                    body = body[4:]  # 数据长度指示
+                if major >= 4 and format_flags & 0x02:
+                    body = body.replace(b'\xff\x00', b'\xff')
+                text = decode_text_frame(body)
+                if text:
+                    fields[name] = text
+        # 其余帧（例如封面）直接跳过，不读取内容
+        pos += header_size + size
+    return fields, audio_start
+
+
+def read_id3v1(reader, file_size):
+    """读取文件末尾的ID3v1标签，返回 (字段字典, 标签长度)"""
+    if file_size < 128:
+        return {}, 0
+    tail = reader.read_at(file_size - 128, 128)
+    if tail[:3] != b'TAG':
+        return {}, 0
+    fields = {}
+    for name, start in (('title', 3), ('artist', 33)):
+        text = tail[start:start + 30].split(b'\x00')[0].decode('latin-1').strip()
+        if text:
+            fields[name] = text
+    return fields, 128
+
+
+def find_first_frame(reader, audio_start, file_size):
+    """从标签之后开始寻找第一个有效帧，返回 (帧起点, 读到的数据, 数据起点)"""
+    offset = audio_start
+    while offset < min(file_size, audio_start + MAX_SYNC_SEARCH):
+        data = reader.read_at(offset, HEAD_READ)
+        if len(data) < 4:
+            break
+        pos = data.find(b'\xff')
+        while 0 <= pos <= len(data) - 4:
+            header = parse_frame_header(data, pos)
+            if header is not None:
+                # 下一帧也有效（或不在已读数据内）时才认为找到，避免误判
+                next_pos = pos + header[0]
+                if next_pos + 4 > len(data) or parse_frame_header(data, next_pos) is not None:
+                    return offset + pos, data, offset
+            pos = data.find(b'\xff', pos + 1)
+        offset += len(data) - 3
+    return None, None, None
+
+
+def read_vbr_frames(data, pos, header):
+    """从第一帧中的Xing/Info或VBRI头读取总帧数，没有时返回None"""
+    length, samples, sample_rate, bitrate, mono = header
+    mpeg1 = samples == 1152 and sample_rate >= 32000
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info') and len(data) >= xing + 12:
+        flags, = struct.unpack('>I', data[xing + 4:xing + 8])
+        if flags & 1:
+            return struct.unpack('>I', data[xing + 8:xing + 12])[0]
+    vbri = pos + 36
+    if data[vbri:vbri + 4] == b'VBRI' and len(data) >= vbri + 18:
+        return struct.unpack('>I', data[vbri + 14:vbri + 18])[0]
+    return None
+
+
+def frame_bitrates(data, pos):
+    """从pos开始连续解析帧头，返回已读数据中各帧的比特率"""
+    bitrates = []
+    while True:
+        header = parse_frame_header(data, pos)
+        if header is None:
+            return bitrates
+        bitrates.append(header[3])
+        pos += header[0]
+
+
+def sample_bitrates(reader, offset, sample_rate):
+    """在offset附近找到帧同步，返回之后连续几帧的比特率；找不到时返回None
+
+    音频数据中也会出现类似帧头的字节，所以要求连续至少3帧有效且采样率与第一帧相同。
+    """
+    data = reader.read_at(offset, HEAD_READ)
+    pos = data.find(b'\xff')
+    while 0 <= pos <= len(data) - 4:
+        header = parse_frame_header(data, pos)
+        if header is not None and header[2] == sample_rate:
+            bitrates = frame_bitrates(data, pos)
+            if len(bitrates) >= 3:
+                return bitrates
+        pos = data.find(b'\xff', pos + 1)
+    return None
+
+
+def probe_mp3(filepath):
+    """只读取少量数据获取MP3的标题、艺术家和时长
+
+    读取ID3v2帧头及需要的文本帧、第一帧附近的数据和末尾128字节。
+    时长来自Xing/VBRI头；没有时按比特率估计，只有开头几帧和文件中间
+    几帧的比特率全都相同时才按CBR处理（VBR编码器常在开头写入固定比特率的静音），
+    否则 exact 为False，需要完整扫描才能得到准确时长。
+    ID3v2标签做过不同步处理时 tags_complete 为False，标题和艺术家需要用mutagen读取。
+    返回 {'title', 'artist', 'length', 'exact', 'tags_complete', 'bytes_read'}，
+    不是有效MP3时返回None。
+    """
+    file_size = os.path.getsize(filepath)
+    with open(filepath, 'rb', buffering=0) as f:
+        reader = CountingReader(f)
+        fields, audio_start = read_id3v2(reader)
+        tags_complete = fields is not None
+        fields = fields or {}
+        v1_fields, v1_size = read_id3v1(reader, file_size)
+        for name, value in v1_fields.items():
+            fields.setdefault(name, value)
+
+        frame_start, data, data_start = find_first_frame(reader, audio_start, file_size)
+        if frame_start is None:
+            return None
+
+        pos = frame_start - data_start
+        header = parse_frame_header(data, pos)
+        length, samples, sample_rate, bitrate, mono = header
+        frames = read_vbr_frames(data, pos, header)
+        if frames:
+            seconds = frames * samples / float(sample_rate)
+            exact = True
+        else:
+            audio_end = file_size - v1_size
+            seconds = max(0, audio_end - frame_start) * 8 / (bitrate * 1000.0)
+            bitrates = set(frame_bitrates(data, pos))
+            middle = None
+            if audio_end - frame_start > 4 * HEAD_READ:
+                middle = sample_bitrates(reader, (frame_start + audio_end) // 2, sample_rate)
+            exact = middle is not None and bitrates == set(middle) == {bitrate}
+
+    return {
+        'title': fields.get('title', ''),
+        'artist': fields.get('artist', ''),
+        'length': seconds,
+        'exact': exact,
+        'tags_complete': tags_complete,
+        'bytes_read': reader.bytes_read
+    }
+
+
+def scan_duration(filepath):
+    """读取全部音频帧，累加得到准确时长（秒）"""
+    file_size = os.path.getsize(filepath)
+    seconds = 0.0
+    with open(filepath, 'rb') as f:
+        start, end = audio_data_range(f, file_size)
+        offset = start
+        chunk_start, data = start, b''
+        while offset + 4 <= end:
+            pos = offset - chunk_start
+            if pos + 4 > len(data):
+                f.seek(offset)
+                data = f.read(min(SCAN_CHUNK, end - offset))
+                chunk_start, pos = offset, 0
+                if len(data) < 4:
+                    break
+            header = parse_frame_header(data, pos)
+            if header is None:
+                # 失去同步，跳到下一个可能的帧头
+                next_pos = data.find(b'\xff', pos + 1)
+                offset = chunk_start + (next_pos if next_pos >= 0 else len(data))
+                continue
+            seconds += header[1] / float(header[2])
+            offset += header[0]
+    return seconds
+
+
+# 读取量统计
+class ReadStats(object):
+    """累计元数据读取的字节数，用于衡量快速路径节省的I/O"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.files = 0
+            self.bytes_read = 0
+            self.file_bytes = 0
+
+    def record(self, bytes_read, file_size):
+        with self.lock:
+            self.files += 1
+            self.bytes_read += bytes_read
+            self.file_bytes += file_size
+
+    def summary(self):
+        with self.lock:
+            if not self.files:
+                return "no files probed"
+            percent = 100.0 * self.bytes_read / max(self.file_bytes, 1)
+            return (f"{self.files} files, read {self.bytes_read / 1024:.0f} KB "
+                    f"of {self.file_bytes / 1048576:.1f} MB ({percent:.2f}%), "
+                    f"{self.bytes_read / self.files / 1024:.1f} KB per file")
+
+
+# 延迟的完整时长扫描
+class DurationScanner(object):
+    """在后台逐个扫描时长只是估计值的文件，结果分批在主线程回调
+
+    第一次加入文件后先等待一段时间再开始，避免与正在进行的导入争抢I/O。
+    """
+
+    # 开始扫描前的等待时间（秒）
+    DELAY = 2.0
+    # 每批最多包含的结果数
+    BATCH_SIZE = 50
+
+    def __init__(self, scan_func, call_in_main, on_results):
+        self.scan_func = scan_func
+        self.call_in_main = call_in_main
+        self.on_results = on_results
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.thread = None
+
+    def add(self, filepath):
+        """加入待扫描的文件（可在任意线程调用）"""
+        with self.lock:
+            if filepath in self.pending:
+                return
+            self.pending.add(filepath)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.queue.put(filepath)
+
+    def _run(self):
+        while True:
+            filepath = self.queue.get()
+            time.sleep(self.DELAY)
+            results = []
+            while filepath is not None:
+                try:
+                    result = self.scan_func(filepath)
+                except Exception as e:
+                    print(f"Failed to scan duration {filepath}: {e}")
+                    result = None
+                with self.lock:
+                    self.pending.discard(filepath)
+                if result is not None:
+                    results.append(result)
+                if len(results) >= self.BATCH_SIZE:
+                    self._deliver(results)
+                    results = []
+                try:
+                    filepath = self.queue.get_nowait()
+                except queue.Empty:
+                    filepath = None
+            if results:
+                self._deliver(results)
+
+    def _deliver(self, results):
+        self.call_in_main(lambda: self.on_results(results))
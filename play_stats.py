@@ -0,0 +1,235 @@
+import sqlite3
+import threading
+import time
+
+from instrumentation import profiler
+
+PLAY = 'play'
+SKIP = 'skip'
+COMPLETE = 'complete'
+
+
+# 播放统计
+class PlayStats(object):
+    """记录播放、跳过、播放完成事件，并维护每首歌的汇总统计
+
+    事件先缓存在内存中，由后台线程批量写入SQLite：原始事件追加到events表，
+    同一批事件先在内存中按歌曲合并，再一次性更新track_stats汇总表。
+    “播放最多”和“最近播放”直接按汇总表的索引查询，不需要扫描历史记录；
+    尚未写盘的事件在查询时叠加到结果上。
+    """
+
+    # 缓存这么多条事件后立即写盘
+    BATCH_SIZE = 50
+    # 第一条事件之后最多等待这么久再写盘
+    FLUSH_INTERVAL = 30.0
+
+    def __init__(self, db_path="play_stats.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " event TEXT NOT NULL,"
+            " time REAL NOT NULL,"
+            " position REAL NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS track_stats ("
+            " path TEXT PRIMARY KEY,"
+            " plays INTEGER NOT NULL DEFAULT 0,"
+            " skips INTEGER NOT NULL DEFAULT 0,"
+            " completions INTEGER NOT NULL DEFAULT 0,"
+            " listened REAL NOT NULL DEFAULT 0,"
+            " last_played REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS track_stats_plays ON track_stats (plays)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS track_stats_last_played ON track_stats (last_played)")
+        self.conn.commit()
+
+        # db_lock保护数据库连接，cond保护内存中的事件缓存
+        self.db_lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.pending = []
+        self.busy = False
+        self.closing = False
+        self.flushing = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # 记录事件（在UI线程调用，只做内存操作）
+    def record(self, path, event, position=0.0):
+        with self.cond:
+            self.pending.append((path, event, time.time(), float(position)))
+            # 第一条事件唤醒写入线程开始计时，缓存满时立即写盘
+            if len(self.pending) == 1 or len(self.pending) >= self.BATCH_SIZE:
+                self.cond.notify()
+
+    def play(self, path):
+        self.record(path, PLAY)
+
+    def skip(self, path, position):
+        self.record(path, SKIP, position)
+
+    def complete(self, path, position):
+        self.record(path, COMPLETE, position)
+
+    # 查询
+    def get(self, path):
+        """返回一首歌的统计，没有记录时各项为0"""
+        with self.db_lock:
+            row = self.conn.execute(
+                "SELECT path, plays, skips, completions, listened, last_played"
+                " FROM track_stats WHERE path = ?", (path,)).fetchone()
+        stats = self._row_to_stats(row) if row else self._empty_stats(path)
+        delta = self._pending_deltas().get(path)
+        if delta:
+            self._apply_delta(stats, delta)
+        return stats
+
+    def most_played(self, limit=20):
+        """播放次数最多的歌曲（次数相同时最近播放的在前）"""
+        return self._top("plays DESC, last_played DESC", limit,
+                         lambda stats: (stats['plays'], stats['last_played'] or 0))
+
+    def recently_played(self, limit=20):
+        """最近播放的歌曲"""
+        return self._top("last_played DESC", limit,
+                         lambda stats: stats['last_played'] or 0,
+                         where="WHERE last_played IS NOT NULL")
+
+    def _top(self, order, limit, key, where=""):
+        deltas = self._pending_deltas()
+        with self.db_lock:
+            # 多取出待写入的歌曲数量的记录，这些歌曲的排名可能变化
+            rows = self.conn.execute(
+                "SELECT path, plays, skips, completions, listened, last_played"
+                " FROM track_stats " + where + " ORDER BY " + order + " LIMIT ?",
+                (limit + len(deltas),)).fetchall()
+            results = dict((row[0], self._row_to_stats(row)) for row in rows)
+            for path in deltas:
+                if path not in results:
+                    row = self.conn.execute(
+                        "SELECT path, plays, skips, completions, listened, last_played"
+                        " FROM track_stats WHERE path = ?", (path,)).fetchone()
+                    results[path] = self._row_to_stats(row) if row else self._empty_stats(path)
+        for path, delta in deltas.items():
+            self._apply_delta(results[path], delta)
+        stats = [item for item in results.values() if key(item)]
+        stats.sort(key=key, reverse=True)
+        return stats[:limit]
+
+    @staticmethod
+    def _row_to_stats(row):
+        path, plays, skips, completions, listened, last_played = row
+        return {'path': path, 'plays': plays, 'skips': skips, 'completions': completions,
+                'listened': listened, 'last_played': last_played}
+
+    @staticmethod
+    def _empty_stats(path):
+        return {'path': path, 'plays': 0, 'skips': 0, 'completions': 0,
+                'listened': 0.0, 'last_played': None}
+
+    @staticmethod
+    def _apply_delta(stats, delta):
+        plays, skips, completions, listened, last_played = delta
+        stats['plays'] += plays
+        stats['skips'] += skips
+        stats['completions'] += completions
+        stats['listened'] += listened
+        if last_played is not None:
+            stats['last_played'] = max(stats['last_played'] or 0, last_played)
+
+    @staticmethod
+    def aggregate(events):
+        """把一批事件按歌曲合并为 {路径: [播放, 跳过, 完成, 收听秒数, 最后播放时间]}"""
+        deltas = {}
+        for path, event, at, position in events:
+            delta = deltas.get(path)
+            if delta is None:
+                delta = deltas[path] = [0, 0, 0, 0.0, None]
+            if event == PLAY:
+                delta[0] += 1
+                delta[4] = at
+            elif event == SKIP:
+                delta[1] += 1
+                delta[3] += position
+            elif event == COMPLETE:
+                delta[2] += 1
+                delta[3] += position
+        return deltas
+
+    def _pending_deltas(self):
+        with self.cond:
+            events = list(self.pending)
+        return self.aggregate(events)
+
+    # 写盘
+    def flush(self):
+        """阻塞直到所有事件都已写盘"""
+        with self.cond:
+            self.flushing = True
+            self.cond.notify()
+            try:
+                while self.pending or self.busy:
+                    self.cond.wait(0.05)
+            finally:
+                self.flushing = False
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+        with self.db_lock:
+            self.conn.close()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                # 等待凑满一批，或者到了最长等待时间
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+                while (len(self.pending) < self.BATCH_SIZE and not (self.closing or self.flushing)
+                       and time.monotonic() < deadline):
+                    self.cond.wait(deadline - time.monotonic())
+                events, self.pending = self.pending, []
+                closing = self.closing
+                self.busy = True
+
+            try:
+                if events:
+                    self._write_events(events)
+            except Exception as e:
+                print(f"Failed to save play statistics: {e}")
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+            if closing:
+                with self.cond:
+                    if not self.pending:
+                        return
+
+    @profiler.timed('play_stats.write')
+    def _write_events(self, events):
+        deltas = self.aggregate(events)
+        with self.db_lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO events (path, event, time, position) VALUES (?, ?, ?, ?)", events)
+                self.conn.executemany(
+                    "INSERT INTO track_stats (path, plays, skips, completions, listened, last_played)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(path) DO UPDATE SET"
+                    " plays = plays + excluded.plays, skips = skips + excluded.skips,"
+                    " completions = completions + excluded.completions,"
+                    " listened = listened + excluded.listened,"
+                    " last_played = COALESCE(MAX(last_played, excluded.last_played),"
+                    " last_played, excluded.last_played)",
+                    [(path,) + tuple(delta) for path, delta in deltas.items()])
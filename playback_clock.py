@@ -0,0 +1,62 @@
+import time
+
+
+# 播放时钟
+class PlaybackClock(object):
+    """用单调时钟推算播放位置，并用音频后端报告的位置校正漂移
+
+    有些音频后端不支持 get_pos()（始终返回0），这时只使用单调时钟。
+    """
+
+    # 与后端位置相差超过这么多秒时直接跳到后端位置
+    SNAP_THRESHOLD = 0.5
+    # 偏差较小时每次只校正一部分，避免进度条抖动
+    CORRECTION = 0.25
+
+    def __init__(self):
+        self.playing = False
+        self.base_position = 0.0
+        self.base_time = time.monotonic()
+        self.backend_seen = False
+
+    def reset(self):
+        self.playing = False
+        self.base_position = 0.0
+        self.base_time = time.monotonic()
+        self.backend_seen = False
+
+    def start(self, position=None):
+        """开始（或继续）计时，可以指定起始位置"""
+        if position is not None:
+            self.base_position = position
+        self.base_time = time.monotonic()
+        self.playing = True
+
+    def pause(self):
+        self.base_position = self.position()
+        self.base_time = time.monotonic()
+        self.playing = False
+
+    def seek(self, position):
+        self.base_position = max(0.0, position)
+        self.base_time = time.monotonic()
+
+    def position(self):
+        if self.playing:
+            return self.base_position + time.monotonic() - self.base_time
+        return self.base_position
+
+    def sync(self, backend_position):
+        """用后端报告的位置校正，返回校正后的位置"""
+        estimate = self.position()
+        if not backend_position or backend_position < 0:
+            # 后端从未报告过有效位置，说明不支持get_pos
+            return estimate
+        self.backend_seen = True
+
+        error = backend_position - estimate
+        if abs(error) > self.SNAP_THRESHOLD:
+            self.seek(backend_position)
+        else:
+            self.seek(estimate + error * self.CORRECTION)
+        return self.position()
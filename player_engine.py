@@ -0,0 +1,567 @@
+import bisect
+import os
+import threading
+
+from folder_snapshot import FolderSnapshots, rescan_root
+from metadata_cache import MetadataCache
+from mp3_probe import DurationScanner, ReadStats, probe_mp3, scan_duration
+from play_stats import PlayStats
+from playlist_store import PlaylistStore
+from search_index import SearchIndex
+from shuffle_order import ShuffleOrder, ShuffleStateWriter, load_shuffle_state
+from track_index import TrackIndex, audio_fingerprint
+from track_store import TrackStore, format_duration
+
+_mutagen_mp3 = None
+
+
+def load_mutagen():
+    """第一次需要时才导入mutagen（大多数文件走快速路径用不到），未安装时返回None"""
+    global _mutagen_mp3
+    if _mutagen_mp3 is None:
+        try:
+            from mutagen.mp3 import MP3
+            _mutagen_mp3 = MP3
+        except ImportError:
+            _mutagen_mp3 = False
+            print("Note: mutagen library not installed, MP3 metadata cannot be read")
+            print("Please install: pip install mutagen")
+    return _mutagen_mp3 or None
+
+
+def fallback_info(filepath):
+    """无法读取元数据时，用文件名作为标题"""
+    filename = os.path.basename(filepath)
+    title = filename.replace('.mp3', '').replace('.MP3', '')
+    return {
+        'title': title,
+        'artist': 'Unknown Artist',
+        'duration': '03:00',
+        'path': filepath,
+        'length': 180  # 默认3分钟
+    }
+
+
+# 播放器核心
+class PlayerEngine(object):
+    """曲库、播放队列、元数据和持久化，不依赖Kivy，可以在没有显示器时使用
+
+    数据文件都使用相对于当前目录的路径。修改曲库和队列的方法都在主线程中调用，
+    call_in_main(func) 把后台线程的结果交回主线程（应用中用Clock实现）；
+    on_durations(下标列表) 在后台扫描出的准确时长更新到播放列表之后调用，
+    on_search_ready() 在后台建立好搜索索引之后调用。
+    """
+
+    def __init__(self, call_in_main, on_durations=None, on_search_ready=None):
+        self.call_in_main = call_in_main
+        self.on_durations = on_durations
+        self.on_search_ready = on_search_ready
+
+        # 按列存储的播放列表；加载和清空都原地修改，界面可以一直持有同一个对象
+        self.playlist = TrackStore()
+        self.current_index = 0
+        self.library_loaded = False
+
+        # 播放列表持久化（快照 + 修改日志）
+        self.playlist_store = PlaylistStore("playlist.json")
+
+        # 重复检测索引；开启内容去重时导入会额外计算音频指纹
+        self.track_index = TrackIndex()
+        self.content_dedupe = True
+
+        # 搜索索引需要解码每首歌，加载曲库后在后台建立；
+        # search_generation 用于丢弃播放列表被删改之前开始的结果
+        self.search_index = SearchIndex()
+        self.search_ready = True
+        self.search_generation = 0
+
+        # 已导入文件夹的目录快照，用于增量重新扫描
+        self.folder_snapshots = FolderSnapshots("folders.json")
+
+        # 随机播放顺序（每首歌播放一遍之前不重复），重启后继续上次的顺序
+        self.repeat_mode = False  # False: 不循环, True: 单曲循环
+        self.shuffle_path = "shuffle.json"
+        self.shuffle_mode, self.shuffle_order = load_shuffle_state(self.shuffle_path)
+        if self.shuffle_order is None:
+            self.shuffle_order = ShuffleOrder()
+        self.shuffle_writer = ShuffleStateWriter(self.shuffle_path)
+
+        # 元数据缓存（与playlist.json放在同一目录）
+        try:
+            self.metadata_cache = MetadataCache("metadata_cache.db")
+        except Exception as e:
+            print(f"Failed to open metadata cache: {e}")
+            self.metadata_cache = None
+
+        # 播放统计（播放、跳过、播放完成）；stats_path是已记录开始播放、尚未结束的歌曲
+        try:
+            self.play_stats = PlayStats("play_stats.db")
+        except Exception as e:
+            print(f"Failed to open play statistics: {e}")
+            self.play_stats = None
+        self.stats_path = None
+
+        # 元数据读取量统计，以及时长只是估计值时的后台完整扫描
+        self.read_stats = ReadStats()
+        self.duration_scanner = DurationScanner(self.scan_track_duration, call_in_main,
+                                                self.on_durations_scanned)
+
+    def current_path(self):
+        """当前歌曲的路径，没有当前歌曲时返回None"""
+        if self.current_index < len(self.playlist):
+            return self.playlist.path(self.current_index)
+        return None
+
+    # 曲库加载和保存
+    def read_library(self):
+        """读取快照和日志并建立重复索引（在后台线程调用），返回 (歌曲, 重复索引)"""
+        songs = self.playlist_store.load_tracks()
+        track_index = TrackIndex()
+        track_index.rebuild(songs)
+        return songs, track_index
+
+    def install_library(self, songs, track_index):
+        """换上后台读取好的曲库，返回应该显示的歌曲下标（没有歌曲时为None）"""
+        self.library_loaded = True
+        if songs:
+            print(f"Loaded {len(songs)} songs from config")
+
+        # 加载期间已经添加的歌曲保留在列表末尾
+        for song in self.playlist:
+            if not track_index.is_duplicate(song):
+                songs.append(song)
+                track_index.add(song)
+        self.track_index = track_index
+        self.playlist.swap(songs)
+        self.rebuild_search_index()
+
+        # 日志已经很长时在后台压缩成新的快照
+        self.compact_if_needed()
+
+        # 播放列表在上次运行之后被改动过时，随机顺序重新开始
+        if len(self.shuffle_order) != len(self.playlist):
+            self.shuffle_order.reset(len(self.playlist))
+            self.save_shuffle_state()
+
+        if not self.playlist:
+            return None
+        # 随机播放时显示上次播放的歌曲
+        index = self.shuffle_order.current() if self.shuffle_mode else None
+        return index or 0
+
+    def load_failed(self, error):
+        # 配置文件损坏时保留当前（可能为空的）列表，并写成新快照
+        self.library_loaded = True
+        print(f"Failed to load config: {error}")
+        self.save_playlist()
+
+    def save_playlist(self):
+        # 在后台把完整播放列表写成新快照（原子替换playlist.json）
+        self.playlist_store.compact(self.playlist)
+
+    def compact_if_needed(self):
+        # 每次记录修改之后检查，日志累积到一定规模时压缩
+        if self.playlist_store.needs_compaction:
+            self.save_playlist()
+
+    # 搜索
+    def rebuild_search_index(self):
+        """在后台线程中为当前播放列表建立搜索索引"""
+        self.search_generation += 1
+        generation = self.search_generation
+        self.search_ready = False
+        # 建立期间追加的歌曲先加到临时索引里（不会被使用），完成后再补上
+        self.search_index = SearchIndex()
+        songs = self.playlist.copy()
+
+        def build():
+            search_index = SearchIndex()
+            search_index.rebuild(songs)
+            self.call_in_main(lambda: self.install_search_index(generation, search_index, len(songs)))
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def install_search_index(self, generation, search_index, count):
+        # 期间播放列表被删改过时，已经有新的建立任务
+        if generation != self.search_generation:
+            return
+        for i in range(count, len(self.playlist)):
+            search_index.add(i, self.playlist[i])
+        self.search_index = search_index
+        self.search_ready = True
+        if self.on_search_ready:
+            self.on_search_ready()
+
+    def search(self, query):
+        """返回 (匹配的歌曲下标, 匹配的总数)；索引仍在后台建立时返回None"""
+        if not self.search_ready:
+            return None
+        return self.search_index.search(query)
+
+    # 元数据
+    def get_mp3_info(self, filepath):
+        """获取MP3文件的元数据
+
+        先走只读取少量数据的快速路径（标签区域、开头几帧和ID3v1），
+        时长只是估计值时再交给后台做完整扫描。
+        """
+        try:
+            # 先查缓存，文件未变化时无需重新解析
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                stat = None
+            cache = self.metadata_cache
+            if cache and stat:
+                cached = cache.get(filepath, stat)
+                if cached:
+                    if cached.pop('estimated', False):
+                        self.duration_scanner.add(filepath)
+                    return cached
+
+            # 快速路径：只读取需要的字节
+            probe = probe_mp3(filepath)
+            if probe is not None:
+                self.read_stats.record(probe['bytes_read'], stat.st_size if stat else 0)
+                duration_sec = probe['length']
+                title = probe['title']
+                artist = probe['artist']
+                estimated = not probe['exact']
+                if not probe['tags_complete']:
+                    # 不同步处理过的ID3v2标签快速路径读不了，交给mutagen
+                    MP3 = load_mutagen()
+                    tags = MP3(filepath).tags if MP3 is not None else None
+                    if tags:
+                        if 'TIT2' in tags:
+                            title = str(tags['TIT2'])
+                        if 'TPE1' in tags:
+                            artist = str(tags['TPE1'])
+            else:
+                MP3 = load_mutagen()
+                if MP3 is None:
+                    # 如果没有mutagen，使用文件名作为标题
+                    return fallback_info(filepath)
+
+                # 读取音频文件信息
+                audio = MP3(filepath)
+
+                # 获取时长
+                duration_sec = audio.info.length
+
+                # 尝试获取标题和艺术家信息
+                title = ""
+                artist = ""
+
+                # 从标签中获取信息
+                if hasattr(audio, 'tags'):
+                    tags = audio.tags
+                    if 'TIT2' in tags:
+                        title = str(tags['TIT2'])
+                    if 'TPE1' in tags:
+                        artist = str(tags['TPE1'])
+                estimated = False
+
+            # 如果没有获取到标题，使用文件名
+            if not title:
+                title = os.path.basename(filepath).replace('.mp3', '').replace('.MP3', '')
+
+            info = {
+                'title': title,
+                'artist': artist or 'Unknown Artist',
+                'duration': format_duration(duration_sec),
+                'path': filepath,
+                'length': duration_sec
+            }
+
+            # 写入缓存
+            if cache and stat:
+                cache.put(filepath, info, stat, estimated=estimated)
+            if estimated:
+                self.duration_scanner.add(filepath)
+
+            return info
+        except Exception as e:
+            print(f"Failed to read MP3 file info {filepath}: {e}")
+            return fallback_info(filepath)
+
+    def parse_import_file(self, filepath):
+        """在导入线程中解析歌曲信息，并按需计算音频指纹"""
+        song_info = self.get_mp3_info(filepath)
+        if self.content_dedupe:
+            fingerprint = audio_fingerprint(filepath)
+            if fingerprint:
+                song_info['fingerprint'] = fingerprint
+        return song_info
+
+    def scan_track_duration(self, filepath):
+        """在后台线程中完整扫描时长，并更新缓存中的估计值"""
+        length = scan_duration(filepath)
+        cache = self.metadata_cache
+        if cache:
+            info = cache.get(filepath)
+            if info:
+                info.pop('estimated', None)
+                info['length'] = length
+                info['duration'] = format_duration(length)
+                cache.put(filepath, info)
+                cache.flush()
+        return filepath, length
+
+    def on_durations_scanned(self, results):
+        """把完整扫描得到的准确时长更新到播放列表（主线程）"""
+        updated = []
+        indices = []
+        with self.playlist.batch():
+            # 只改动扫描到的几行，不遍历整个播放列表
+            for path, length in results:
+                i = self.playlist.index_of(path)
+                if i is None:
+                    continue
+                song = self.playlist[i]
+                song['length'] = length
+                song['duration'] = format_duration(length)
+                self.playlist[i] = song
+                updated.append(song)
+                indices.append(i)
+        if updated:
+            self.playlist_store.update(updated)
+            self.compact_if_needed()
+            print(f"Refined duration of {len(updated)} songs")
+            if self.on_durations:
+                self.on_durations(indices)
+
+    def flush_metadata(self):
+        # 提交一批解析产生的缓存记录，并输出读取量统计
+        if self.metadata_cache:
+            self.metadata_cache.flush()
+        print(f"Metadata I/O: {self.read_stats.summary()}")
+        self.read_stats.reset()
+
+    # 修改曲库（主线程）
+    def parse_files(self, filepaths):
+        """在后台线程中解析一组文件（与文件夹导入相同，含音频指纹），返回歌曲信息列表"""
+        # 只解析MP3文件
+        song_infos = [self.parse_import_file(filepath) for filepath in filepaths
+                      if filepath.lower().endswith('.mp3')]
+        if self.metadata_cache:
+            self.metadata_cache.flush()
+        return song_infos
+
+    def add_files(self, filepaths, on_done=None):
+        """在后台线程中解析一组文件，再在主线程中添加，完成后调用 on_done(添加的数量)"""
+        def parse():
+            song_infos = self.parse_files(filepaths)
+            self.call_in_main(lambda: self.files_parsed(song_infos, on_done))
+
+        threading.Thread(target=parse, daemon=True).start()
+
+    def files_parsed(self, song_infos, on_done=None):
+        # 提交本次导入产生的缓存记录，再按路径和内容去重后添加
+        self.flush_metadata()
+        added_count = self.add_song_infos(song_infos)
+        if on_done:
+            on_done(added_count)
+        return added_count
+
+    def add_song_infos(self, song_infos, verbose=True):
+        """把已解析的歌曲信息添加到播放列表，返回添加的数量"""
+        added_songs = []
+        # 批量追加，列表视图只收到一次通知
+        with self.playlist.batch():
+            for song_info in song_infos:
+                # 检查是否已在播放列表中（同一路径或相同的音频内容）
+                if not self.track_index.is_duplicate(song_info):
+                    self.playlist.append(song_info)
+                    self.track_index.add(song_info)
+                    self.search_index.add(len(self.playlist) - 1, song_info)
+                    added_songs.append(song_info)
+                    if verbose:
+                        print(f"Added song: {song_info['title']} - {song_info['artist']}")
+
+        if added_songs:
+            self.shuffle_order.added(len(added_songs))
+            self.save_shuffle_state()
+
+            # 记录到修改日志，由后台线程写盘
+            self.playlist_store.append(added_songs)
+            self.compact_if_needed()
+        return len(added_songs)
+
+    def remove_paths(self, paths):
+        """从播放列表删除一组路径，返回 (删除的数量, 当前歌曲是否被删除)"""
+        removed = set(paths)
+        if not removed or not self.playlist:
+            return 0, False
+        indices = sorted(i for i in map(self.playlist.index_of, removed) if i is not None)
+        if not indices:
+            return 0, False
+
+        current_removed = self.current_index in set(indices)
+        for i in indices:
+            self.track_index.discard(self.playlist[i])
+        self.search_index.remove_indices(indices)
+        self.shuffle_order.removed_indices(indices)
+        self.save_shuffle_state()
+        self.playlist.remove_indices(indices)
+        self.playlist_store.remove(removed)
+        self.compact_if_needed()
+        if not self.search_ready:
+            # 正在建立的索引中的下标已经失效
+            self.rebuild_search_index()
+        if self.metadata_cache:
+            for path in removed:
+                self.metadata_cache.invalidate(path)
+
+        # 当前歌曲之前的歌曲被删除时，当前下标随之前移
+        self.current_index -= bisect.bisect_left(indices, self.current_index)
+        if current_removed and self.playlist:
+            self.current_index = min(self.current_index, len(self.playlist) - 1)
+        return len(indices), current_removed
+
+    def update_song_infos(self, song_infos):
+        """用重新解析的信息替换播放列表中相同路径的歌曲，返回被替换的下标列表"""
+        infos = dict((info['path'], info) for info in song_infos)
+        if not infos:
+            return []
+
+        updated = []
+        indices = []
+        with self.playlist.batch():
+            for path, info in infos.items():
+                i = self.playlist.index_of(path)
+                if i is None:
+                    continue
+                old_song = self.playlist[i]
+                self.track_index.discard(old_song)
+                self.search_index.discard(i, old_song)
+                self.playlist[i] = info
+                self.track_index.add(info)
+                self.search_index.add(i, info)
+                updated.append(info)
+                indices.append(i)
+
+        if updated:
+            self.playlist_store.update(updated)
+            self.compact_if_needed()
+            if not self.search_ready:
+                self.rebuild_search_index()
+        return sorted(indices)
+
+    def clear(self):
+        """清空播放列表"""
+        self.playlist.clear()
+        self.track_index.clear()
+        self.search_index.clear()
+        # 正在后台建立的索引已经没有用了
+        self.search_generation += 1
+        self.search_ready = True
+        self.playlist_store.clear()
+        self.current_index = 0
+        # 清空后不再重新扫描之前导入的文件夹
+        self.folder_snapshots.clear()
+        threading.Thread(target=self.folder_snapshots.save, daemon=True).start()
+        self.shuffle_order.reset(0)
+        self.save_shuffle_state()
+
+    def set_folder_snapshot(self, root, dirs):
+        """记录导入完成的文件夹快照（主线程，与清空等修改顺序一致），在后台写盘"""
+        self.folder_snapshots.set_root(root, dirs)
+        threading.Thread(target=self.folder_snapshots.save, daemon=True).start()
+
+    # 重新扫描
+    def scan_roots(self, roots, deep=False):
+        """在后台线程中增量扫描已导入的文件夹，返回 (新快照, 新增歌曲, 修改的歌曲, 删除的路径)"""
+        snapshots = {}
+        added, removed, updated = [], [], []
+        for root, dirs in roots.items():
+            # 根文件夹不可用（例如存储卡未挂载）时跳过，不当作全部删除
+            if not os.path.isdir(root):
+                print(f"Skipping unavailable folder: {root}")
+                continue
+            new_dirs, root_added, root_removed, root_updated = rescan_root(root, dirs, deep)
+            snapshots[root] = new_dirs
+            added.extend(root_added)
+            removed.extend(root_removed)
+            updated.extend(root_updated)
+
+        added_infos = [self.parse_import_file(path) for path in added]
+        updated_infos = [self.parse_import_file(path) for path in updated]
+        if self.metadata_cache:
+            self.metadata_cache.flush()
+        return snapshots, added_infos, updated_infos, removed
+
+    def apply_rescan(self, snapshots, added_infos, updated_infos, removed):
+        """把重新扫描的差异应用到播放列表
+
+        返回 (添加的数量, 被修改的下标列表, 删除的数量, 当前歌曲是否被删除)。
+        """
+        removed_count, current_removed = self.remove_paths(removed)
+        updated = self.update_song_infos(updated_infos)
+        added_count = self.add_song_infos(added_infos, verbose=False)
+
+        # 差异已应用，再保存新的快照
+        for root, dirs in snapshots.items():
+            self.folder_snapshots.set_root(root, dirs)
+        if snapshots:
+            threading.Thread(target=self.folder_snapshots.save, daemon=True).start()
+        print(f"Rescan: {added_count} added, {len(updated)} updated, {removed_count} removed")
+        return added_count, updated, removed_count, current_removed
+
+    # 播放队列
+    def peek_next_index(self):
+        """下一首将要播放的歌曲"""
+        if self.shuffle_mode:
+            return self.shuffle_order.peek()
+        return (self.current_index + 1) % len(self.playlist)
+
+    def next_index(self):
+        """前进到下一首并返回其下标（随机播放时沿随机顺序）"""
+        if self.shuffle_mode:
+            index = self.shuffle_order.next()
+            self.save_shuffle_state()
+            return index
+        return (self.current_index + 1) % len(self.playlist)
+
+    def prev_index(self):
+        """后退到上一首并返回其下标；随机播放已是本轮第一首时返回当前歌曲"""
+        if self.shuffle_mode:
+            index = self.shuffle_order.prev()
+            self.save_shuffle_state()
+            return self.current_index if index is None else index
+        return (self.current_index - 1) % len(self.playlist)
+
+    def set_shuffle(self, enabled):
+        self.shuffle_mode = enabled
+        self.save_shuffle_state()
+
+    def save_shuffle_state(self):
+        # 状态很小，复制后由写入线程按顺序原子写入
+        self.shuffle_writer.save(self.shuffle_mode, self.shuffle_order.to_dict())
+
+    # 播放统计
+    def record_play_started(self):
+        # 暂停后继续播放不算新的一次播放
+        path = self.current_path()
+        if self.play_stats and path is not None and path != self.stats_path:
+            self.play_stats.play(path)
+        self.stats_path = path
+
+    def finish_track(self, completed, position, length=0):
+        """记录正在播放的歌曲结束：播放完成或被跳过"""
+        if self.stats_path is None:
+            return
+        if self.play_stats:
+            if completed:
+                self.play_stats.complete(self.stats_path, max(position, length))
+            else:
+                self.play_stats.skip(self.stats_path, position)
+        self.stats_path = None
+
+    def close(self):
+        """保存尚未写盘的修改并关闭数据库（退出时正在播放的歌曲不算跳过）"""
+        self.playlist_store.close()
+        self.shuffle_writer.close()
+        if self.metadata_cache:
+            self.metadata_cache.close()
+        if self.play_stats:
+            self.play_stats.close()
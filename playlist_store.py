@@ -0,0 +1,293 @@
+import json
+import os
+import threading
+
+from instrumentation import profiler
+from library_snapshot import MappedSnapshot, write_snapshot
+from track_store import TrackStore
+
+
+# 播放列表持久化
+class PlaylistStore(object):
+    """playlist.json快照 + 追加式修改日志，由后台线程延迟写入
+
+    每次修改只追加一行日志（O(修改量)），日志累积到一定规模后
+    再把完整列表写成新快照（写临时文件后原子替换）并清空日志。
+    日志中的操作都以路径为键，并且可以重复应用，所以即使在替换快照后、
+    清空日志前崩溃，重放日志也会得到同样的结果。
+
+    写快照时还会生成同样内容的二进制快照（playlist.bin），启动时直接
+    映射它而不解析JSON；它记录了对应的playlist.json的大小和修改时间，
+    不一致（例如手动替换了playlist.json）时回退到读取JSON并重新生成。
+    playlist.json仍然是权威的数据，也可以用作导入导出格式。
+    """
+
+    # 第一次修改后等待多久再写盘，期间的修改合并为一次写入
+    DEBOUNCE = 1.0
+    # 日志中的歌曲条目至少累积这么多才会压缩
+    COMPACT_MIN = 2000
+    # 日志中的操作条数达到这么多时也压缩（例如大量只修改几首歌的更新）
+    COMPACT_OPS = 1000
+
+    def __init__(self, path="playlist.json"):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.binary_path = os.path.splitext(path)[0] + ".bin"
+        # 二进制快照缺失或过期，下次压缩时重新生成
+        self.binary_stale = False
+        self.cond = threading.Condition()
+        self.pending = []
+        self.snapshot = None
+        # 被待写快照包含而从日志中去掉的修改和计数，快照写盘失败时补写回日志
+        self.superseded = []
+        self.superseded_counts = (0, 0)
+        self.busy = False
+        self.closing = False
+        self.flushing = False
+        self.journal_entries = 0
+        self.journal_ops = 0
+        self.base_count = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def load_tracks(self):
+        """读取播放列表并重放日志，返回TrackStore
+
+        二进制快照有效时只映射文件，歌曲在读取时才解码；否则读取JSON快照，
+        并在下次压缩时重新生成二进制快照。
+        """
+        snapshot = MappedSnapshot.open(self.binary_path, self.path)
+        if snapshot is None:
+            songs = []
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    songs = json.load(f)
+            songs = TrackStore(songs)
+        else:
+            songs = TrackStore.from_snapshot(snapshot)
+        self.base_count = len(songs)
+
+        # 二进制快照在清空日志之后才写入，有效的二进制快照之后的日志不会
+        # 重复快照中已有的歌曲；JSON快照则可能已包含日志中追加的歌曲
+        self.replay(songs, self._read_journal(), dedupe=snapshot is None)
+        # 重放移动操作时快照中的歌曲已全部解码，也需要重新生成快照
+        self.binary_stale = snapshot is None or songs.base is None
+        return songs
+
+    def _read_journal(self):
+        self.journal_entries = 0
+        self.journal_ops = 0
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    # 最后一行可能因崩溃只写了一半
+                    print("Ignoring truncated playlist journal entry")
+                    break
+                self.journal_entries += self.op_size(op)
+                self.journal_ops += 1
+                yield op
+
+    @staticmethod
+    def replay(songs, ops, dedupe=False):
+        """把一组日志操作依次应用到TrackStore上
+
+        路径到下标的映射在第一次需要时建立一次，之后随操作增量维护；删除只先
+        记下下标，到最后（或移动、清空之前）再一起删除，这样其他下标都不会变。
+        所以重放的开销是 O(歌曲数 + 日志)，而不是每条操作都遍历一遍播放列表。
+        dedupe 为True时追加的歌曲按路径去重。
+        """
+        rows = None  # 路径 -> 下标，不包括已记下要删除的歌曲
+        removed = set()
+        for op in ops:
+            kind = op['op']
+            if kind == 'clear':
+                songs.clear()
+                rows = {}
+                removed = set()
+                continue
+            if kind == 'move' and removed:
+                songs.remove_indices(removed)
+                removed = set()
+                rows = None
+            if rows is None and (kind != 'append' or dedupe):
+                rows = dict((path, i) for i, path in enumerate(songs.paths()) if i not in removed)
+
+            if kind == 'append':
+                for song in op['songs']:
+                    if rows is not None:
+                        if dedupe and song['path'] in rows:
+                            continue
+                        rows[song['path']] = len(songs)
+                    songs.append(song)
+            elif kind == 'remove':
+                for path in op['paths']:
+                    i = rows.pop(path, None)
+                    if i is not None:
+                        removed.add(i)
+            elif kind == 'update':
+                for song in op['songs']:
+                    i = rows.get(song['path'])
+                    if i is not None:
+                        songs[i] = song
+            elif kind == 'move':
+                i = rows.get(op['path'])
+                if i is not None:
+                    songs.move(i, op['to'])
+                    # 移动改变了中间所有歌曲的下标
+                    rows = None
+        if removed:
+            songs.remove_indices(removed)
+
+    @staticmethod
+    def op_size(op):
+        if op['op'] in ('append', 'update'):
+            return len(op['songs'])
+        if op['op'] == 'remove':
+            return len(op['paths'])
+        return 1
+
+    # 记录修改（在UI线程调用，只做内存操作）
+    def append(self, songs):
+        self._record({'op': 'append', 'songs': list(songs)})
+
+    def update(self, songs):
+        """替换列表中相同路径的歌曲信息"""
+        self._record({'op': 'update', 'songs': list(songs)})
+
+    def remove(self, paths):
+        self._record({'op': 'remove', 'paths': list(paths)})
+
+    def move(self, path, to_index):
+        self._record({'op': 'move', 'path': path, 'to': to_index})
+
+    def clear(self):
+        self._record({'op': 'clear'})
+
+    @property
+    def needs_compaction(self):
+        # 日志规模与快照大小成比例时才压缩，摊还后每次修改仍是O(1)；
+        # 操作条数单独限制，避免大量小的修改让启动时的重放变慢
+        return (self.binary_stale or self.journal_ops >= self.COMPACT_OPS
+                or self.journal_entries >= max(self.COMPACT_MIN, self.base_count))
+
+    def compact(self, songs):
+        """在后台把完整列表写成新快照，之前的所有日志都会被丢弃"""
+        with self.cond:
+            # 只复制引用（或列），转换成JSON的工作在写入线程中进行
+            self.snapshot = songs.copy()
+            # 快照已包含尚未写入的修改，但要等快照写盘成功后才能丢弃
+            self.superseded.extend(self.pending)
+            entries, ops = self.superseded_counts
+            self.superseded_counts = (entries + self.journal_entries, ops + self.journal_ops)
+            self.pending = []
+            self.journal_entries = 0
+            self.journal_ops = 0
+            self.base_count = len(self.snapshot)
+            self.binary_stale = False
+            self.cond.notify()
+
+    def flush(self):
+        """阻塞直到所有修改都已写盘"""
+        with self.cond:
+            # 写入线程看到flushing时跳过防抖等待
+            self.flushing = True
+            self.cond.notify()
+            try:
+                while self.pending or self.snapshot is not None or self.busy:
+                    self.cond.wait(0.05)
+            finally:
+                self.flushing = False
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _record(self, op):
+        with self.cond:
+            self.pending.append(op)
+            self.journal_entries += self.op_size(op)
+            self.journal_ops += 1
+            # 只在第一条修改时唤醒写入线程，之后的修改在防抖期间合并
+            if len(self.pending) == 1:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and self.snapshot is None and not self.closing:
+                    self.cond.wait()
+                if not (self.closing or self.flushing):
+                    # 防抖：合并接下来一段时间内的修改
+                    self.cond.wait(self.DEBOUNCE)
+                ops, self.pending = self.pending, []
+                snapshot, self.snapshot = self.snapshot, None
+                superseded, self.superseded = self.superseded, []
+                superseded_counts, self.superseded_counts = self.superseded_counts, (0, 0)
+                closing = self.closing
+                self.busy = True
+
+            try:
+                # 先写快照再写日志：快照之后的修改要写进新的日志
+                if snapshot is not None:
+                    try:
+                        self._write_snapshot(snapshot)
+                    except Exception as e:
+                        print(f"Failed to save playlist snapshot: {e}")
+                        # 快照没有写成，它包含的修改补写到日志（日志操作可以重复应用），
+                        # 并恢复计数、标记二进制快照过期，下次修改时重新压缩
+                        ops = superseded + ops
+                        with self.cond:
+                            self.journal_entries += superseded_counts[0]
+                            self.journal_ops += superseded_counts[1]
+                            self.binary_stale = True
+                if ops:
+                    self._append_journal(ops)
+            except Exception as e:
+                print(f"Failed to save playlist: {e}")
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+            if closing:
+                with self.cond:
+                    if not self.pending and self.snapshot is None:
+                        return
+
+    @profiler.timed('playlist.append_journal')
+    def _append_journal(self, ops):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @profiler.timed('playlist.write_snapshot')
+    def _write_snapshot(self, songs):
+        song_list = list(songs)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(song_list, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        # 快照已落盘，旧日志可以清空
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+
+        # 最后写二进制快照并记录新的playlist.json的大小和修改时间；
+        # 在这之前崩溃的话，下次启动时它与playlist.json不一致，会被忽略
+        try:
+            write_snapshot(self.binary_path, song_list,
+                           [songs.key(i) for i in range(len(songs))], self.path)
+        except OSError as e:
+            # 例如在Windows上旧的快照仍被映射，无法替换
+            print(f"Failed to write library snapshot: {e}")
+        print("Playlist saved")
@@ -0,0 +1,29 @@
+import os
+
+from pythonforandroid.recipe import CompiledComponentsPythonRecipe
+
+
+# miniaudio 的 python-for-android 配方
+class MiniaudioRecipe(CompiledComponentsPythonRecipe):
+    """miniaudio 是cffi扩展，p4a没有自带配方；音频分析（频谱、响度、波形）和混音器都依赖它"""
+
+    version = '1.61'
+    url = 'https://files.pythonhosted.org/packages/source/m/miniaudio/miniaudio-{version}.tar.gz'
+    depends = ['setuptools', 'cffi']
+    # 构建时在宿主Python中运行cffi生成扩展的源码
+    hostpython_prerequisites = ['cffi']
+    call_hostpython_via_targetpython = False
+    site_packages_name = 'miniaudio'
+
+    def prebuild_arch(self, arch):
+        super(MiniaudioRecipe, self).prebuild_arch(arch)
+        # Android的pthread在libc中，NDK没有单独的libpthread可以链接
+        path = os.path.join(self.get_build_dir(arch.arch), 'build_ffi_module.py')
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        source = source.replace('libraries = ["m", "pthread", "dl"]', 'libraries = ["m", "dl"]')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+
+
+recipe = MiniaudioRecipe()
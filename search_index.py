@@ -0,0 +1,110 @@
+import bisect
+import heapq
+import os
+import re
+
+# 连续的字母数字作为一个词；中日韩文字没有空格分隔，每个字单独作为一个词
+TOKEN_RE = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]|[^\W_]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def text_tokens(title, artist, path):
+    """标题、艺术家和文件名中的所有词"""
+    filename = os.path.splitext(os.path.basename(path))[0]
+    return set(tokenize(' '.join((title, artist, filename))))
+
+
+def song_tokens(song):
+    return text_tokens(song.get('title', ''), song.get('artist', ''), song.get('path', ''))
+
+
+# 播放列表搜索索引
+class SearchIndex(object):
+    """词 -> 歌曲下标 的倒排索引，支持前缀匹配
+
+    下标就是歌曲在播放列表中的位置；追加、删除和修改歌曲时增量更新，
+    重新排序后需要调用 rebuild()。
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []  # 有序的词表，用于前缀查找
+
+    def clear(self):
+        self.postings = {}
+        self.vocabulary = []
+
+    def rebuild(self, playlist):
+        """从TrackStore重建索引，只读取需要的列，不为每首歌生成字典"""
+        postings = {}
+        for index in range(len(playlist)):
+            tokens = text_tokens(playlist.title(index), playlist.artist(index), playlist.path(index))
+            for token in tokens:
+                postings.setdefault(token, set()).add(index)
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+
+    def add(self, index, song):
+        for token in song_tokens(song):
+            posting = self.postings.get(token)
+            if posting is None:
+                self.postings[token] = posting = set()
+                bisect.insort(self.vocabulary, token)
+            posting.add(index)
+
+    def discard(self, index, song):
+        """把下标从歌曲（旧信息）的所有词中移除"""
+        for token in song_tokens(song):
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.discard(index)
+
+    def remove_indices(self, indices):
+        """删除一组下标，后面的下标依次前移（不需要重新分词）"""
+        removed = sorted(set(indices))
+        if not removed:
+            return
+        removed_set = set(removed)
+        first = removed[0]
+        postings = {}
+        for token, posting in self.postings.items():
+            if max(posting, default=-1) >= first:
+                posting = set(i - bisect.bisect_left(removed, i) for i in posting if i not in removed_set)
+            if posting:
+                postings[token] = posting
+        if len(postings) != len(self.postings):
+            self.vocabulary = sorted(postings)
+        self.postings = postings
+
+    def prefix_matches(self, prefix):
+        """返回以prefix开头的所有词的歌曲下标集合"""
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        result = set()
+        for i in range(start, len(self.vocabulary)):
+            token = self.vocabulary[i]
+            if not token.startswith(prefix):
+                break
+            result |= self.postings[token]
+        return result
+
+    def search(self, query, limit=200):
+        """查询中的每个词都要以前缀的方式匹配
+
+        返回 (按下标排序的前limit个结果, 匹配的总数)。
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return [], 0
+
+        # 较长的词通常更有区分度，先匹配以尽早缩小范围
+        tokens.sort(key=len, reverse=True)
+        result = None
+        for token in tokens:
+            matches = self.prefix_matches(token)
+            result = matches if result is None else result & matches
+            if not result:
+                return [], 0
+        return heapq.nsmallest(limit, result), len(result)
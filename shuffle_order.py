@@ -0,0 +1,254 @@
+import bisect
+import json
+import os
+import random
+import threading
+
+
+def _mix(x, key):
+    # 32位整数混合函数，作为Feistel网络的轮函数
+    x = ((x ^ key) * 0x45d9f3b) & 0xffffffff
+    x = ((x ^ (x >> 16)) * 0x45d9f3b) & 0xffffffff
+    return x ^ (x >> 16)
+
+
+# 随机播放顺序
+class ShuffleOrder(object):
+    """不重复的随机播放顺序，按需逐个生成，内存占用与歌曲数量无关
+
+    每一轮用Feistel网络在 [0, 4^h) 上做一个伪随机排列，第step步取排列的
+    第step个值，超出歌曲数量的值直接跳过，一轮之内每首歌只出现一次。
+
+    排列的是歌曲的“序号”（本轮开始时的下标，之后添加的歌曲依次编号），
+    删除的歌曲记录在有序列表中：序号减去之前被删除的数量就是当前下标，
+    所以添加和删除都不需要重建排列。添加时如果超出了本轮的范围，
+    新歌曲从下一轮开始参与。
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, count=0, seed=None):
+        self.next_seed = random.getrandbits(32)
+        self.reset(count, seed)
+
+    def reset(self, count, seed=None):
+        """以count首歌开始新的一轮"""
+        self.seed = self.next_seed if seed is None else seed
+        self.next_seed = random.getrandbits(32)
+        self.total = count
+        self.removed = []
+        self.removed_set = set()
+        self.step = 0
+        self._fit_domain()
+        rng = random.Random(self.seed)
+        self.keys = [rng.getrandbits(32) for i in range(self.ROUNDS)]
+
+    def _fit_domain(self):
+        # 能容纳全部序号的最小的 4^h
+        self.half_bits = 1
+        while 4 ** self.half_bits < self.total:
+            self.half_bits += 1
+
+    def __len__(self):
+        return self.total - len(self.removed)
+
+    @property
+    def domain(self):
+        return 4 ** self.half_bits
+
+    def _permute(self, value):
+        mask = (1 << self.half_bits) - 1
+        left, right = value >> self.half_bits, value & mask
+        for key in self.keys:
+            left, right = right, left ^ (_mix(right, key) & mask)
+        return (left << self.half_bits) | right
+
+    def _index_at(self, step):
+        """第step步对应的当前下标，该位置无效（超出范围或已删除）时返回None"""
+        ordinal = self._permute(step)
+        if ordinal >= self.total or ordinal in self.removed_set:
+            return None
+        return ordinal - bisect.bisect_left(self.removed, ordinal)
+
+    def next(self):
+        """返回下一首的下标（并前进），没有歌曲时返回None"""
+        if not len(self):
+            return None
+        while True:
+            if self.step >= self.domain:
+                # 本轮已经全部播放，用当前的歌曲数开始新的一轮
+                self.reset(len(self))
+            index = self._index_at(self.step)
+            self.step += 1
+            if index is not None:
+                return index
+
+    def peek(self):
+        """返回下一首的下标，但不前进"""
+        if not len(self):
+            return None
+        step = self.step
+        while step < self.domain:
+            index = self._index_at(step)
+            if index is not None:
+                return index
+            step += 1
+        # 下一轮的第一首：下一轮的种子已经确定
+        upcoming = ShuffleOrder(len(self), self.next_seed)
+        return upcoming.next()
+
+    def current(self):
+        """最近一次返回的歌曲下标，已被删除或本轮尚未开始时返回None"""
+        if self.step == 0:
+            return None
+        return self._index_at(self.step - 1)
+
+    def prev(self):
+        """回到上一首，返回其下标；已经是本轮第一首时返回None"""
+        step = self.step - 2
+        while step >= 0:
+            index = self._index_at(step)
+            if index is not None:
+                self.step = step + 1
+                return index
+            step -= 1
+        return None
+
+    def added(self, count):
+        """在末尾添加了count首歌"""
+        self.total += count
+        if self.step == 0:
+            # 本轮还没有开始，可以直接扩大范围
+            self._fit_domain()
+
+    def removed_indices(self, indices):
+        """删除了一组（删除前的）下标，O(删除数量 + 已删除数量)"""
+        # 下标 -> 序号：跳过之前已删除的序号。下标从小到大处理，已删除的
+        # 序号只需要从前往后扫描一遍
+        removed = self.removed
+        ordinals = []
+        skipped = 0
+        for index in sorted(set(indices)):
+            while skipped < len(removed) and removed[skipped] <= index + skipped:
+                skipped += 1
+            ordinal = index + skipped
+            if ordinal < self.total:
+                ordinals.append(ordinal)
+        if ordinals:
+            # 新的序号都不在已删除的序号中，合并两个有序列表
+            self.removed = sorted(removed + ordinals)
+            self.removed_set.update(ordinals)
+
+    # 持久化
+    def to_dict(self):
+        # 复制删除列表：结果会交给写入线程，之后的删除不能影响它
+        return {'seed': self.seed, 'next_seed': self.next_seed, 'total': self.total,
+                'removed': list(self.removed), 'step': self.step, 'half_bits': self.half_bits}
+
+    @classmethod
+    def from_dict(cls, data):
+        order = cls(0, data['seed'])
+        order.next_seed = data['next_seed']
+        order.total = data['total']
+        order.removed = sorted(data['removed'])
+        order.removed_set = set(order.removed)
+        order.step = data['step']
+        order.half_bits = data['half_bits']
+        return order
+
+
+def load_shuffle_state(path):
+    """读取 (是否开启随机播放, ShuffleOrder)，文件不存在或损坏时返回 (False, None)"""
+    if not os.path.exists(path):
+        return False, None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return bool(data.get('enabled')), ShuffleOrder.from_dict(data['order'])
+    except Exception as e:
+        print(f"Failed to load shuffle state: {e}")
+        return False, None
+
+
+def save_shuffle_state(path, enabled, state):
+    """原子地保存随机播放状态，state为 ShuffleOrder.to_dict() 的结果"""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'enabled': enabled, 'order': state}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Failed to save shuffle state: {e}")
+
+
+# 随机播放状态的写入
+class ShuffleStateWriter(object):
+    """由一个后台线程按顺序写入随机播放状态
+
+    只保留最新的状态，防抖期间的多次保存合并为一次写入，所以旧的状态
+    不会覆盖新的状态。save() 在主线程调用，只做内存操作。
+    """
+
+    # 第一次保存后等待多久再写盘
+    DEBOUNCE = 0.5
+
+    def __init__(self, path):
+        self.path = path
+        self.cond = threading.Condition()
+        self.pending = None
+        self.busy = False
+        self.closing = False
+        self.flushing = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, enabled, state):
+        """记录最新的状态，state为 ShuffleOrder.to_dict() 的结果（已是副本）"""
+        with self.cond:
+            first = self.pending is None
+            self.pending = (enabled, state)
+            if first:
+                self.cond.notify()
+
+    def flush(self):
+        """阻塞直到最新的状态已写盘"""
+        with self.cond:
+            self.flushing = True
+            self.cond.notify()
+            try:
+                while self.pending is not None or self.busy:
+                    self.cond.wait(0.05)
+            finally:
+                self.flushing = False
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closing:
+                    self.cond.wait()
+                if not (self.closing or self.flushing):
+                    # 防抖：连续切歌时只写最后的状态
+                    self.cond.wait(self.DEBOUNCE)
+                pending, self.pending = self.pending, None
+                closing = self.closing
+                self.busy = True
+
+            try:
+                if pending is not None:
+                    save_shuffle_state(self.path, *pending)
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+            if closing:
+                with self.cond:
+                    if self.pending is None:
+                        return
+
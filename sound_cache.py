@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def read_through(path, chunk_size=1024 * 1024):
+    """把整个文件读一遍，让之后在主线程中的加载从系统缓存读取"""
+    try:
+        with open(path, 'rb') as f:
+            while f.read(chunk_size):
+                pass
+    except OSError:
+        pass
+
+
+# 预加载音频缓存
+class SoundCache(object):
+    """按最近使用顺序保存已加载的音频对象，总大小和数量都有上限
+
+    加载分两步：prepare_func(路径) 在后台线程中做耗时的读取和解码，
+    create_func(路径, 准备结果) 通过 call_in_main 在主线程中创建音频对象
+    （Kivy的音频对象是EventDispatcher，不能在其他线程创建）。
+
+    prefetch() 加载完成后放入缓存。request() 用于马上要播放的歌曲，优先于
+    预加载，并且只保留最新的一个请求；请求的歌曲正在预加载时不会再加载
+    一次，而是等这次加载完成后回调。正在播放的音频应当用 take() 取出，
+    不再归缓存管理，停止后可以用 put() 放回。
+
+    大小按解码后的PCM估计（音频后端会把整首歌解码到内存中），而不是压缩的文件大小。
+    """
+
+    # 解码后每秒占用的字节数（44.1kHz、16位、立体声）
+    DECODED_BYTES_PER_SECOND = 44100 * 2 * 2
+    # 不知道时长时，按文件大小的这么多倍估计解码后的大小（128kbps的MP3约为11倍）
+    DECOMPRESSION_FACTOR = 10
+
+    def __init__(self, prepare_func, create_func, call_in_main,
+                 max_bytes=64 * 1024 * 1024, max_items=4):
+        self.prepare_func = prepare_func
+        self.create_func = create_func
+        self.call_in_main = call_in_main
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.entries = OrderedDict()  # 路径 -> (音频对象, 估计大小)
+        self.total_bytes = 0
+        # 排队或正在加载的路径 -> 等待的 (回调, 请求时间)，预加载时为空列表；只在主线程访问
+        self.loading = {}
+        self.cond = threading.Condition()
+        self.prefetch_queue = deque()
+        self.urgent = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def take(self, path):
+        """取出已加载的音频，没有时返回None"""
+        entry = self.entries.pop(path, None)
+        if entry is None:
+            return None
+        self.total_bytes -= entry[1]
+        return entry[0]
+
+    def put(self, path, sound):
+        """放入（或放回）一个已停止的音频，超出上限时卸载最久未用的"""
+        if path in self.entries:
+            self._unload(self.take(path))
+        size = self._estimate_size(path, sound)
+        self.entries[path] = (sound, size)
+        self.total_bytes += size
+        while self.entries and (len(self.entries) > self.max_items or self.total_bytes > self.max_bytes):
+            old_path, (old_sound, old_size) = self.entries.popitem(last=False)
+            self.total_bytes -= old_size
+            self._unload(old_sound)
+
+    def prefetch(self, path):
+        """在后台预加载，已缓存或正在加载时忽略"""
+        if path in self.entries or path in self.loading:
+            return
+        self.loading[path] = []
+        with self.cond:
+            self.prefetch_queue.append(path)
+            self.cond.notify()
+
+    def request(self, path, callback):
+        """尽快加载，callback(路径, 音频, 耗时秒数) 在主线程调用
+
+        尚未开始的旧请求会被新请求替换，已经开始的加载完成后照常回调。
+        """
+        waiters = self.loading.get(path)
+        if waiters is not None:
+            # 已经在加载：等这次加载完成，还在排队的预加载提前
+            waiters.append((callback, time.monotonic()))
+            with self.cond:
+                if path not in self.prefetch_queue:
+                    return
+                self.prefetch_queue.remove(path)
+                replaced, self.urgent = self.urgent, path
+                self.cond.notify()
+        else:
+            self.loading[path] = [(callback, time.monotonic())]
+            with self.cond:
+                replaced, self.urgent = self.urgent, path
+                self.cond.notify()
+        if replaced is not None:
+            # 被替换的请求不会再加载
+            self.loading.pop(replaced, None)
+
+    def clear(self):
+        while self.entries:
+            path, (sound, size) = self.entries.popitem()
+            self._unload(sound)
+        self.total_bytes = 0
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.urgent is None and not self.prefetch_queue:
+                    self.cond.wait()
+                if self.urgent is not None:
+                    path, self.urgent = self.urgent, None
+                else:
+                    path = self.prefetch_queue.popleft()
+
+            try:
+                prepared = self.prepare_func(path)
+            except Exception as e:
+                print(f"Failed to load audio {path}: {e}")
+                prepared = None
+            self.call_in_main(lambda path=path, prepared=prepared: self._loaded(path, prepared))
+
+    def _loaded(self, path, prepared):
+        waiters = self.loading.pop(path, [])
+        try:
+            sound = self.create_func(path, prepared)
+        except Exception as e:
+            print(f"Failed to load audio {path}: {e}")
+            sound = None
+        if waiters:
+            # 同一首歌被请求了多次时只回调最新的请求
+            callback, started = waiters[-1]
+            callback(path, sound, time.monotonic() - started)
+            return
+        if sound is None:
+            return
+        if path in self.entries:
+            self._unload(sound)
+            return
+        self.put(path, sound)
+        print(f"Prefetched audio: {path}")
+
+    def _estimate_size(self, path, sound):
+        # 用时长估计解码后占用的内存，时长未知时按文件大小估计
+        try:
+            length = sound.length
+        except Exception:
+            length = 0
+        if length and length > 0:
+            return int(length * self.DECODED_BYTES_PER_SECOND)
+        try:
+            return os.path.getsize(path) * self.DECOMPRESSION_FACTOR
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _unload(sound):
+        try:
+            sound.unload()
+        except Exception:
+            pass
@@ -0,0 +1,148 @@
+import threading
+
+from audio_decoder import can_decode, stream_pcm
+
+if can_decode():
+    import numpy as np
+
+
+# 频谱分析
+class SpectrumAnalyzer(object):
+    """在后台线程中解码当前歌曲，按固定步长计算各频段的能量
+
+    结果按帧保存，band_levels(秒) 返回与播放位置对齐的一帧，
+    每个频段的值在0到1之间。跳转到尚未分析到（或已分析部分之前）的位置时，
+    从新位置重新开始分析，base_frame 是已保存的第一帧的帧号。
+    """
+
+    SAMPLE_RATE = 22050
+    # FFT窗口长度和帧步长（22050 / 512 约每秒43帧）
+    WINDOW = 1024
+    HOP = 512
+    # 每次解码并批量计算的帧数
+    CHUNK_HOPS = 64
+    # 能量映射到0~1时使用的分贝范围
+    MIN_DB = -60.0
+    MAX_DB = 0.0
+    # 跳转目标在已分析部分之后不超过这么多秒时，等分析自然追上
+    SEEK_AHEAD = 2.0
+
+    def __init__(self, bands=9, min_freq=40.0, max_freq=10000.0):
+        self.bands = bands
+        self.lock = threading.Lock()
+        self.cancel_event = None
+        self.path = None
+        self.chunks = []
+        self.base_frame = 0
+
+        if can_decode():
+            self.window = np.hanning(self.WINDOW).astype(np.float32)
+            # 对数分布的频段边界，映射到FFT的bin下标
+            freqs = np.fft.rfftfreq(self.WINDOW, 1.0 / self.SAMPLE_RATE)
+            edges = np.geomspace(min_freq, max_freq, bands + 1)
+            self.band_bins = np.searchsorted(freqs, edges)
+            self.band_bins[1:] = np.maximum(self.band_bins[1:], self.band_bins[:-1] + 1)
+            self.norm = float(self.window.sum()) / 2
+
+    @property
+    def available(self):
+        return can_decode()
+
+    def start(self, filepath, position=0.0):
+        """从position（秒）开始分析一首歌曲，之前的分析会被取消；同一首歌时相当于seek()"""
+        if not self.available:
+            return
+        if filepath == self.path:
+            self.seek(position)
+            return
+        self.stop()
+        self.path = filepath
+        self._launch(self._frame(position))
+
+    def seek(self, position):
+        """播放位置跳转：目标不在已分析（或即将分析到）的范围内时从目标位置重新分析"""
+        if self.path is None:
+            return
+        frame = self._frame(position)
+        with self.lock:
+            analyzed = self.base_frame + sum(len(chunk) for chunk in self.chunks)
+        ahead = int(self.SEEK_AHEAD * self.SAMPLE_RATE / self.HOP)
+        if not self.base_frame <= frame <= analyzed + ahead:
+            self._launch(frame)
+
+    def _frame(self, position):
+        return max(0, int(position * self.SAMPLE_RATE / self.HOP))
+
+    def _launch(self, frame):
+        if self.cancel_event:
+            self.cancel_event.set()
+        cancel_event = threading.Event()
+        self.cancel_event = cancel_event
+        with self.lock:
+            self.chunks = []
+            self.base_frame = frame
+        threading.Thread(target=self._analyze, args=(self.path, cancel_event, frame * self.HOP),
+                         daemon=True).start()
+
+    def stop(self):
+        if self.cancel_event:
+            self.cancel_event.set()
+            self.cancel_event = None
+        self.path = None
+        with self.lock:
+            self.chunks = []
+
+    def band_levels(self, position):
+        """返回播放位置（秒）对应的各频段能量，尚未分析到时返回None"""
+        with self.lock:
+            frame = int(position * self.SAMPLE_RATE / self.HOP) - self.base_frame
+            if frame < 0:
+                return None
+            chunk, offset = divmod(frame, self.CHUNK_HOPS)
+            if chunk >= len(self.chunks) or offset >= len(self.chunks[chunk]):
+                return None
+            return self.chunks[chunk][offset]
+
+    def _analyze(self, filepath, cancel_event, start_frame):
+        hop, window = self.HOP, self.WINDOW
+        block_frames = hop * self.CHUNK_HOPS
+        # 上一块末尾未用完的样本，保证跨块的帧连续
+        tail = np.zeros(window - hop, dtype=np.float32)
+        try:
+            for samples in stream_pcm(filepath, self.SAMPLE_RATE, 1, block_frames, start_frame):
+                if cancel_event.is_set():
+                    return
+                data = np.concatenate((tail, samples))
+                count = (len(data) - window) // hop + 1
+                if count <= 0:
+                    tail = data
+                    continue
+                levels = self._compute(data, count)
+                tail = data[count * hop:]
+                with self.lock:
+                    if cancel_event.is_set():
+                        return
+                    self._store(levels)
+        except Exception as e:
+            print(f"Spectrum analysis failed for {filepath}: {e}")
+
+    def _compute(self, data, count):
+        # 用步长视图一次性切出所有帧，批量做加窗和FFT
+        frames = np.lib.stride_tricks.as_strided(
+            data, shape=(count, self.WINDOW),
+            strides=(data.strides[0] * self.HOP, data.strides[0]))
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) / self.norm
+        power = power[:, :self.band_bins[-1]] ** 2
+        energies = np.add.reduceat(power, self.band_bins[:-1], axis=1)
+        db = 10 * np.log10(energies + 1e-10)
+        levels = (db - self.MIN_DB) / (self.MAX_DB - self.MIN_DB)
+        return np.clip(levels, 0.0, 1.0).astype(np.float32)
+
+    def _store(self, levels):
+        # 调用方需持有锁；每个块固定存CHUNK_HOPS帧，便于按帧号定位
+        if self.chunks and len(self.chunks[-1]) < self.CHUNK_HOPS:
+            room = self.CHUNK_HOPS - len(self.chunks[-1])
+            self.chunks[-1] = np.concatenate((self.chunks[-1], levels[:room]))
+            levels = levels[room:]
+        for start in range(0, len(levels), self.CHUNK_HOPS):
+            self.chunks.append(levels[start:start + self.CHUNK_HOPS])
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import folder_snapshot
+from folder_snapshot import rescan_root
+
+
+def touch(path, data=b'mp3'):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+# 重新扫描文件夹
+class RescanRootTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sub = os.path.join(self.root, "album")
+        self.gone = os.path.join(self.root, "gone")
+        os.mkdir(self.sub)
+        os.mkdir(self.gone)
+        touch(os.path.join(self.root, "a.mp3"))
+        touch(os.path.join(self.sub, "b.mp3"))
+        touch(os.path.join(self.gone, "c.mp3"))
+        self.dirs, added, removed, updated = rescan_root(self.root, {})
+        self.assertEqual(len(added), 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_unchanged(self):
+        self.assertEqual(rescan_root(self.root, self.dirs), (self.dirs, [], [], []))
+
+    def test_added_removed_and_deleted_folder(self):
+        touch(os.path.join(self.sub, "d.mp3"))
+        os.remove(os.path.join(self.root, "a.mp3"))
+        shutil.rmtree(self.gone)
+        new_dirs, added, removed, updated = rescan_root(self.root, self.dirs)
+        self.assertEqual(added, [os.path.join(self.sub, "d.mp3")])
+        self.assertEqual(sorted(removed), [os.path.join(self.root, "a.mp3"), os.path.join(self.gone, "c.mp3")])
+        self.assertNotIn(self.gone, new_dirs)
+
+    def test_unreadable_folder_is_kept(self):
+        # 目录有变化但列目录失败（没有权限或共享未挂载），不能当作删除
+        touch(os.path.join(self.sub, "d.mp3"))
+        scandir = os.scandir
+
+        def failing_scandir(path):
+            if path == self.sub:
+                raise PermissionError(13, "Permission denied", path)
+            return scandir(path)
+
+        with mock.patch.object(folder_snapshot.os, 'scandir', failing_scandir):
+            new_dirs, added, removed, updated = rescan_root(self.root, self.dirs)
+        self.assertEqual((added, removed, updated), ([], [], []))
+        self.assertIs(new_dirs[self.sub], self.dirs[self.sub])
+
+        # 恢复可读后照常发现新文件
+        new_dirs, added, removed, updated = rescan_root(self.root, new_dirs)
+        self.assertEqual(added, [os.path.join(self.sub, "d.mp3")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+
+from audio_decoder import can_decode
+from mixer import render_to_wav
+
+if can_decode():
+    import numpy as np
+
+RATE = 44100
+
+
+def write_wav(path, samples):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes((samples * 32767).astype('<i2').tobytes())
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as f:
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+        return data.reshape(-1, f.getnchannels()) / 32767.0, f.getframerate()
+
+
+def rms(samples, start, end):
+    return float(np.sqrt(np.mean(samples[int(start * RATE):int(end * RATE)] ** 2)))
+
+
+# 离线混音
+@unittest.skipUnless(can_decode(), "needs miniaudio and numpy")
+class RenderToWavTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        seconds = np.arange(2 * RATE) / float(RATE)
+        self.tone = os.path.join(self.dir, "tone.wav")
+        self.silence = os.path.join(self.dir, "silence.wav")
+        self.output = os.path.join(self.dir, "mix.wav")
+        write_wav(self.tone, 0.5 * np.sin(2 * np.pi * 440 * seconds))
+        write_wav(self.silence, np.zeros(2 * RATE))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_single_file(self):
+        seconds = render_to_wav([self.tone], self.output, crossfade=0.5)
+        samples, rate = read_wav(self.output)
+        self.assertEqual(rate, RATE)
+        self.assertEqual(samples.shape[1], 2)
+        self.assertAlmostEqual(seconds, 2.0, delta=0.05)
+        self.assertAlmostEqual(len(samples) / float(RATE), seconds, places=3)
+        self.assertAlmostEqual(rms(samples, 0.2, 1.0), 0.5 / np.sqrt(2), delta=0.01)
+
+    def test_crossfade_overlaps_tracks(self):
+        seconds = render_to_wav([self.tone, self.silence], self.output, crossfade=0.5)
+        samples, rate = read_wav(self.output)
+        # 第二首在第一首结束前0.5秒开始
+        self.assertAlmostEqual(seconds, 3.5, delta=0.05)
+        loud = rms(samples, 0.2, 1.0)
+        self.assertLess(rms(samples, 1.9, 2.0), loud / 2)
+        self.assertGreater(rms(samples, 1.5, 1.6), loud / 2)
+        self.assertEqual(rms(samples, 2.1, 3.4), 0.0)
+
+    def test_gain(self):
+        render_to_wav([self.tone], self.output, crossfade=0.5, gains=[0.5])
+        samples, rate = read_wav(self.output)
+        self.assertAlmostEqual(rms(samples, 0.2, 1.0), 0.25 / np.sqrt(2), delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import queue
+import shutil
+import tempfile
+import time
+import unittest
+
+from player_engine import PlayerEngine
+
+
+def make_song(i, **fields):
+    song = {'title': f"Title {i}", 'artist': f"Artist {i % 3}",
+            'path': f"/music/{i}.mp3", 'length': 100.0 + i}
+    song.update(fields)
+    return song
+
+
+# 播放器核心（不依赖Kivy）
+class PlayerEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        # 引擎的数据文件都相对于当前目录
+        self.old_cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.main_calls = queue.Queue()
+        self.durations = []
+        self.engine = self.open_engine()
+
+    def tearDown(self):
+        self.engine.close()
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.dir)
+
+    def open_engine(self):
+        engine = PlayerEngine(self.main_calls.put, on_durations=self.durations.append)
+        songs, track_index = engine.read_library()
+        engine.install_library(songs, track_index)
+        self.run_main(lambda: engine.search_ready)
+        return engine
+
+    def reopen(self):
+        self.engine.close()
+        self.engine = self.open_engine()
+        return self.engine
+
+    def run_main(self, done, timeout=5.0):
+        # 在测试线程中执行后台线程交回主线程的调用
+        deadline = time.monotonic() + timeout
+        while not done():
+            try:
+                self.main_calls.get(timeout=max(deadline - time.monotonic(), 0.01))()
+            except queue.Empty:
+                self.fail("timed out waiting for the engine")
+
+    def add(self, count):
+        return self.engine.add_song_infos([make_song(i) for i in range(count)], verbose=False)
+
+    def test_add_skips_duplicates_and_persists(self):
+        self.assertEqual(self.add(5), 5)
+        self.assertEqual(self.engine.add_song_infos([make_song(2), make_song(5)], verbose=False), 1)
+        engine = self.reopen()
+        self.assertEqual(list(engine.playlist.paths()), [make_song(i)['path'] for i in range(6)])
+        self.assertEqual(engine.search("title 5"), ([5], 1))
+
+    def test_add_files_dedupes_by_content(self):
+        # 同一段音频复制到另一个文件夹，标签之外的内容相同
+        os.mkdir("copy")
+        audio = bytes(range(256)) * 64
+        for path in ("song.mp3", os.path.join("copy", "song.mp3")):
+            with open(path, 'wb') as f:
+                f.write(audio)
+        added = []
+        self.engine.add_files(["song.mp3", os.path.join("copy", "song.mp3"), "cover.jpg"], added.append)
+        self.run_main(lambda: added)
+        self.assertEqual(added, [1])
+        self.assertEqual(list(self.engine.playlist.paths()), ["song.mp3"])
+        self.assertTrue(self.engine.playlist.fingerprint(0))
+
+        # 之后的导入也能按内容匹配
+        self.assertTrue(self.engine.track_index.is_duplicate(
+            self.engine.parse_import_file(os.path.join("copy", "song.mp3"))))
+
+    def test_remove_paths_moves_current_index(self):
+        self.add(6)
+        self.engine.current_index = 4
+        removed = self.engine.remove_paths([make_song(1)['path'], make_song(2)['path'], "/missing.mp3"])
+        self.assertEqual(removed, (2, False))
+        self.assertEqual(self.engine.current_index, 2)
+        self.assertEqual(self.engine.current_path(), make_song(4)['path'])
+        self.assertEqual(self.engine.playlist.index_of(make_song(5)['path']), 3)
+
+        self.assertEqual(self.engine.remove_paths([make_song(4)['path']]), (1, True))
+        self.assertEqual(self.engine.search("title 4"), ([], 0))
+        self.assertEqual(len(self.reopen().playlist), 3)
+
+    def test_update_song_infos_reports_indices(self):
+        self.add(4)
+        updated = self.engine.update_song_infos([make_song(2, title="Renamed"), make_song(9)])
+        self.assertEqual(updated, [2])
+        self.assertEqual(self.engine.playlist.title(2), "Renamed")
+        self.assertEqual(self.engine.search("renamed"), ([2], 1))
+        self.assertEqual(self.engine.search("title"), ([0, 1, 3], 3))
+        self.assertEqual(self.reopen().playlist.title(2), "Renamed")
+
+    def test_durations_scanned_updates_rows(self):
+        self.add(5)
+        self.engine.on_durations_scanned([(make_song(3)['path'], 42.0), ("/missing.mp3", 1.0)])
+        self.assertEqual(self.engine.playlist.length(3), 42.0)
+        self.assertEqual(self.engine.playlist[3]['duration'], "00:42")
+        self.assertEqual(self.durations, [[3]])
+
+    def test_clear(self):
+        self.add(3)
+        self.engine.clear()
+        self.assertEqual(len(self.engine.playlist), 0)
+        self.assertEqual(len(self.engine.shuffle_order), 0)
+        self.assertIsNone(self.engine.current_path())
+        self.assertEqual(len(self.reopen().playlist), 0)
+
+    def test_queue_order(self):
+        self.add(3)
+        self.engine.current_index = 2
+        self.assertEqual(self.engine.peek_next_index(), 0)
+        self.assertEqual(self.engine.next_index(), 0)
+        self.engine.current_index = 0
+        self.assertEqual(self.engine.prev_index(), 2)
+
+    def test_shuffle_plays_each_song_and_resumes(self):
+        self.add(10)
+        self.engine.set_shuffle(True)
+        played = []
+        for i in range(6):
+            self.assertEqual(self.engine.peek_next_index(), self.engine.peek_next_index())
+            played.append(self.engine.next_index())
+        engine = self.reopen()
+        self.assertTrue(engine.shuffle_mode)
+        self.assertEqual(engine.shuffle_order.current(), played[-1])
+        played.extend(engine.next_index() for i in range(4))
+        self.assertEqual(sorted(played), list(range(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
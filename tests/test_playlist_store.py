@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from playlist_store import PlaylistStore
+from track_store import TrackStore
+
+
+def make_song(i, **fields):
+    song = {'title': f"Title {i}", 'artist': f"Artist {i % 3}",
+            'path': f"/music/{i}.mp3", 'length': 100.0 + i}
+    song.update(fields)
+    return song
+
+
+def rows(store):
+    return [(store.path(i), store.title(i), store.artist(i), store.length(i)) for i in range(len(store))]
+
+
+def song_rows(songs):
+    return [(s['path'], s['title'], s['artist'], s['length']) for s in songs]
+
+
+def apply_naive(songs, ops, dedupe=False):
+    """逐条操作、每次都遍历列表的参考实现"""
+    songs = list(songs)
+    for op in ops:
+        kind = op['op']
+        if kind == 'clear':
+            songs = []
+        elif kind == 'append':
+            for song in op['songs']:
+                if not (dedupe and any(s['path'] == song['path'] for s in songs)):
+                    songs.append(song)
+        elif kind == 'remove':
+            paths = set(op['paths'])
+            songs = [s for s in songs if s['path'] not in paths]
+        elif kind == 'update':
+            for song in op['songs']:
+                songs = [song if s['path'] == song['path'] else s for s in songs]
+        elif kind == 'move':
+            paths = [s['path'] for s in songs]
+            if op['path'] in paths:
+                songs.insert(op['to'], songs.pop(paths.index(op['path'])))
+    return songs
+
+
+def random_ops(rng, songs, count, next_id):
+    """生成一组对当前列表有效的随机操作"""
+    songs = list(songs)
+    ops = []
+    for i in range(count):
+        kind = 'clear' if rng.random() < 0.05 else rng.choice(('append', 'remove', 'update', 'move'))
+        if kind == 'append':
+            op = {'op': 'append', 'songs': [make_song(next_id + n) for n in range(rng.randint(1, 4))]}
+            next_id += len(op['songs'])
+        elif kind == 'clear':
+            op = {'op': 'clear'}
+        elif not songs:
+            continue
+        elif kind == 'remove':
+            op = {'op': 'remove', 'paths': [s['path'] for s in rng.sample(songs, min(len(songs), 3))]}
+        elif kind == 'update':
+            op = {'op': 'update', 'songs': [dict(s, title=s['title'] + "'")
+                                            for s in rng.sample(songs, min(len(songs), 2))]}
+        else:
+            op = {'op': 'move', 'path': rng.choice(songs)['path'], 'to': rng.randrange(len(songs))}
+        ops.append(op)
+        songs = apply_naive(songs, [op])
+    return ops
+
+
+# 播放列表持久化
+class PlaylistStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "playlist.json")
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.dir)
+
+    def open_store(self):
+        store = PlaylistStore(self.path)
+        self.stores.append(store)
+        return store
+
+    def record(self, store, ops):
+        for op in ops:
+            if op['op'] == 'append':
+                store.append(op['songs'])
+            elif op['op'] == 'update':
+                store.update(op['songs'])
+            elif op['op'] == 'remove':
+                store.remove(op['paths'])
+            elif op['op'] == 'move':
+                store.move(op['path'], op['to'])
+            else:
+                store.clear()
+        store.flush()
+
+    def write_json(self, songs):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(songs, f)
+
+    def test_empty(self):
+        songs = self.open_store().load_tracks()
+        self.assertEqual(len(songs), 0)
+
+    def test_json_snapshot_with_journal(self):
+        base = [make_song(i) for i in range(20)]
+        self.write_json(base)
+        ops = [{'op': 'append', 'songs': [make_song(20), make_song(3)]},
+               {'op': 'update', 'songs': [make_song(5, title="New")]},
+               {'op': 'remove', 'paths': [make_song(0)['path'], make_song(7)['path']]},
+               {'op': 'move', 'path': make_song(20)['path'], 'to': 0},
+               {'op': 'remove', 'paths': [make_song(1)['path']]}]
+        self.record(self.open_store(), ops)
+
+        store = self.open_store()
+        songs = store.load_tracks()
+        # JSON快照中已有的路径不会被日志中的追加重复添加
+        self.assertEqual(rows(songs), song_rows(apply_naive(base, ops, dedupe=True)))
+        self.assertTrue(store.binary_stale)
+        self.assertTrue(store.needs_compaction)
+
+    def test_binary_snapshot_with_journal(self):
+        base = [make_song(i) for i in range(20)]
+        store = self.open_store()
+        store.compact(TrackStore(base))
+        store.flush()
+        self.assertTrue(os.path.exists(store.binary_path))
+        ops = [{'op': 'append', 'songs': [make_song(20)]},
+               {'op': 'update', 'songs': [make_song(5, title="New"), make_song(20, artist="Other")]},
+               {'op': 'remove', 'paths': [make_song(0)['path'], make_song(20)['path']]}]
+        self.record(store, ops)
+
+        store = self.open_store()
+        songs = store.load_tracks()
+        # 没有移动操作时快照中的歌曲保持映射、不解码
+        self.assertIsNotNone(songs.base)
+        self.assertFalse(store.binary_stale)
+        self.assertEqual(rows(songs), song_rows(apply_naive(base, ops)))
+
+    def test_replay_matches_reference(self):
+        rng = random.Random(1)
+        for trial in range(20):
+            base = [make_song(i) for i in range(rng.randint(0, 30))]
+            ops = random_ops(rng, base, 40, 1000)
+            for binary in (False, True):
+                with self.subTest(trial=trial, binary=binary):
+                    shutil.rmtree(self.dir)
+                    os.mkdir(self.dir)
+                    store = self.open_store()
+                    if binary:
+                        store.compact(TrackStore(base))
+                        store.flush()
+                    else:
+                        self.write_json(base)
+                    self.record(store, ops)
+                    songs = self.open_store().load_tracks()
+                    self.assertEqual(rows(songs), song_rows(apply_naive(base, ops, dedupe=not binary)))
+                    for store in self.stores:
+                        store.close()
+                    self.stores = []
+
+    def test_compaction_clears_journal(self):
+        store = self.open_store()
+        songs = TrackStore([make_song(i) for i in range(5)])
+        self.record(store, [{'op': 'append', 'songs': [make_song(i) for i in range(5)]}])
+        store.compact(songs)
+        store.flush()
+        self.assertEqual(os.path.getsize(store.journal_path), 0)
+        self.assertEqual(rows(self.open_store().load_tracks()), rows(songs))
+
+    def test_failed_compaction_keeps_changes(self):
+        base = [make_song(i) for i in range(5)]
+        self.write_json(base)
+        store = self.open_store()
+        songs = store.load_tracks()
+        self.record(store, [{'op': 'append', 'songs': [make_song(5)]}])
+
+        def fail(songs):
+            raise OSError("disk full")
+        store._write_snapshot = fail
+        ops = [{'op': 'remove', 'paths': [make_song(0)['path']]},
+               {'op': 'update', 'songs': [make_song(1, title="New")]}]
+        songs.append(make_song(5))
+        for op in ops:
+            if op['op'] == 'remove':
+                store.remove(op['paths'])
+                songs.remove_indices([0])
+            else:
+                store.update(op['songs'])
+                songs[0] = op['songs'][0]
+        # 修改还在等待写盘时就压缩
+        store.compact(songs)
+        store.flush()
+        self.assertTrue(store.needs_compaction)
+
+        expected = apply_naive(base, [{'op': 'append', 'songs': [make_song(5)]}] + ops)
+        self.assertEqual(rows(songs), song_rows(expected))
+        self.assertEqual(rows(self.open_store().load_tracks()), song_rows(expected))
+
+        # 之后的压缩成功时正常写入
+        del store._write_snapshot
+        store.compact(songs)
+        store.flush()
+        self.assertEqual(os.path.getsize(store.journal_path), 0)
+        self.assertEqual(rows(self.open_store().load_tracks()), song_rows(expected))
+
+    def test_compacts_on_operation_count(self):
+        self.write_json([make_song(i) for i in range(5)])
+        store = self.open_store()
+        store.compact(store.load_tracks())
+        store.flush()
+        for i in range(PlaylistStore.COMPACT_OPS - 1):
+            store.update([make_song(i % 5, title=str(i))])
+        self.assertFalse(store.needs_compaction)
+        store.update([make_song(0)])
+        self.assertTrue(store.needs_compaction)
+
+    def test_truncated_journal_entry_is_ignored(self):
+        self.write_json([make_song(0)])
+        self.record(self.open_store(), [{'op': 'append', 'songs': [make_song(1)]}])
+        with open(self.path + ".journal", 'a', encoding='utf-8') as f:
+            f.write('{"op": "append", "songs": [{"pa')
+        songs = self.open_store().load_tracks()
+        self.assertEqual(rows(songs), song_rows([make_song(0), make_song(1)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
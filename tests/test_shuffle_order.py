@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from shuffle_order import ShuffleOrder, ShuffleStateWriter, load_shuffle_state
+
+
+# 随机播放顺序
+class ShuffleOrderTest(unittest.TestCase):
+
+    def test_round_plays_every_song_once(self):
+        for count in (1, 2, 5, 17, 100):
+            order = ShuffleOrder(count, seed=count)
+            played = [order.next() for i in range(count)]
+            self.assertEqual(sorted(played), list(range(count)))
+
+    def test_peek_matches_next_across_rounds(self):
+        order = ShuffleOrder(7, seed=1)
+        for i in range(30):
+            upcoming = order.peek()
+            self.assertEqual(order.next(), upcoming)
+
+    def test_prev_walks_back(self):
+        order = ShuffleOrder(6, seed=2)
+        played = [order.next() for i in range(3)]
+        self.assertEqual(order.prev(), played[1])
+        self.assertEqual(order.current(), played[1])
+        self.assertEqual(order.prev(), played[0])
+        self.assertIsNone(order.prev())
+        self.assertEqual(order.next(), played[1])
+
+    def test_removed_songs_are_skipped(self):
+        order = ShuffleOrder(10, seed=3)
+        played = set(order.next() for i in range(3))
+        removed = {1, 4, 8} | set(list(played)[:1])
+        order.removed_indices(removed)
+        self.assertEqual(len(order), 10 - len(removed))
+
+        # 剩下的歌曲按删除后的下标各播放一次
+        new_index = lambda i: i - sum(1 for r in removed if r < i)
+        expected = sorted(new_index(i) for i in range(10) if i not in removed and i not in played)
+        rest = [order.next() for i in range(len(expected))]
+        self.assertEqual(sorted(rest), expected)
+
+    def test_removed_in_batches(self):
+        order = ShuffleOrder(1000, seed=9)
+        songs = list(range(1000))
+        for batch in (range(0, 1000, 3), range(0, 600, 2), [0, 5, 300, 5000]):
+            # 每批都是删除前的当前下标
+            order.removed_indices(batch)
+            batch = set(batch)
+            songs = [song for i, song in enumerate(songs) if i not in batch]
+        self.assertEqual(len(order), len(songs))
+        self.assertEqual(sorted(set(range(1000)) - set(order.removed)), songs)
+
+    def test_added_before_round_starts(self):
+        order = ShuffleOrder(0, seed=4)
+        order.added(5)
+        self.assertEqual(sorted(order.next() for i in range(5)), list(range(5)))
+
+    def test_dict_round_trip_continues_order(self):
+        order = ShuffleOrder(20, seed=5)
+        for i in range(4):
+            order.next()
+        order.removed_indices([3, 11])
+        state = order.to_dict()
+        restored = ShuffleOrder.from_dict(json.loads(json.dumps(state)))
+        self.assertEqual([restored.next() for i in range(30)], [order.next() for i in range(30)])
+
+    def test_to_dict_copies_removed(self):
+        order = ShuffleOrder(10, seed=6)
+        state = order.to_dict()
+        order.removed_indices([2])
+        self.assertEqual(state['removed'], [])
+
+
+# 随机播放状态的写入
+class ShuffleStateWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "shuffle.json")
+        self.writer = ShuffleStateWriter(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.dir)
+
+    def test_latest_state_wins(self):
+        order = ShuffleOrder(50, seed=7)
+        for i in range(20):
+            order.next()
+            self.writer.save(i % 2 == 0, order.to_dict())
+        self.writer.flush()
+        enabled, restored = load_shuffle_state(self.path)
+        self.assertFalse(enabled)
+        self.assertEqual(restored.step, order.step)
+        self.assertEqual(restored.current(), order.current())
+
+    def test_close_writes_pending_state(self):
+        self.writer.save(True, ShuffleOrder(3, seed=8).to_dict())
+        self.writer.close()
+        enabled, restored = load_shuffle_state(self.path)
+        self.assertTrue(enabled)
+        self.assertEqual(len(restored), 3)
+
+    def test_missing_file(self):
+        self.assertEqual(load_shuffle_state(self.path), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
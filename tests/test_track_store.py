@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from library_snapshot import MappedSnapshot, write_snapshot
+from track_index import path_key
+from track_store import TrackStore
+
+
+def make_song(i, **fields):
+    song = {'title': f"Title {i}", 'artist': f"Artist {i % 3}",
+            'path': f"/music/{i % 4}/{i}.mp3", 'length': 100.0 + i}
+    song.update(fields)
+    return song
+
+
+def rows(store):
+    return [(store.path(i), store.title(i), store.artist(i), store.length(i)) for i in range(len(store))]
+
+
+def song_rows(songs):
+    return [(s['path'], s['title'], s['artist'], s['length']) for s in songs]
+
+
+# 按列存储
+class TrackStoreTest(unittest.TestCase):
+
+    def test_reads_back_song_dicts(self):
+        store = TrackStore([make_song(0), make_song(1, fingerprint='abc')])
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store[0], {'title': "Title 0", 'artist': "Artist 0", 'duration': "01:40",
+                                    'path': "/music/0/0.mp3", 'length': 100.0})
+        self.assertNotIn('fingerprint', store[0])
+        self.assertEqual(store[-1]['fingerprint'], 'abc')
+        self.assertEqual(store[1:], [store[1]])
+        with self.assertRaises(IndexError):
+            store[2]
+
+    def test_interns_artists_and_folders(self):
+        store = TrackStore([make_song(i) for i in range(12)])
+        self.assertEqual(len(store.artist_table), 3)
+        self.assertEqual(len(store.folder_table), 4)
+
+    def test_remove_and_move_keep_columns_aligned(self):
+        songs = [make_song(i) for i in range(8)]
+        store = TrackStore(songs)
+        store.remove_indices([1, 4, 4, 7])
+        del songs[7], songs[4], songs[1]
+        self.assertEqual(rows(store), song_rows(songs))
+
+        store.move(0, 3)
+        songs.insert(3, songs.pop(0))
+        self.assertEqual(rows(store), song_rows(songs))
+
+    def test_index_of_follows_changes(self):
+        store = TrackStore([make_song(i) for i in range(6)])
+        self.assertEqual(store.index_of(make_song(4)['path']), 4)
+        self.assertIsNone(store.index_of("/missing.mp3"))
+
+        store.append(make_song(6))
+        store[2] = make_song(20)
+        self.assertEqual(store.index_of(make_song(6)['path']), 6)
+        self.assertEqual(store.index_of(make_song(20)['path']), 2)
+        self.assertIsNone(store.index_of(make_song(2)['path']))
+
+        store.remove_indices([0])
+        store.move(0, 4)
+        for i in range(len(store)):
+            self.assertEqual(store.index_of(store.path(i)), i)
+
+        store.clear()
+        self.assertIsNone(store.index_of(make_song(6)['path']))
+
+    def test_batch_notifies_once(self):
+        store = TrackStore()
+        notified = []
+        store.bind(notified.append)
+        with store.batch():
+            store.append(make_song(0))
+            store.extend([make_song(1), make_song(2)])
+        self.assertEqual(notified, [store])
+        store.remove_indices([0])
+        self.assertEqual(len(notified), 2)
+
+    def test_copy_is_independent(self):
+        store = TrackStore([make_song(i) for i in range(3)])
+        other = store.copy()
+        store.append(make_song(3))
+        store[0] = make_song(9)
+        self.assertEqual(rows(other), song_rows([make_song(i) for i in range(3)]))
+
+
+# 以二进制快照为前面的歌曲
+class SnapshotTrackStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.songs = [make_song(i) for i in range(10)]
+        json_path = os.path.join(self.dir, "playlist.json")
+        binary_path = os.path.join(self.dir, "playlist.bin")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.songs, f)
+        write_snapshot(binary_path, self.songs, [path_key(s['path']) for s in self.songs], json_path)
+        self.snapshot = MappedSnapshot.open(binary_path, json_path)
+        self.assertIsNotNone(self.snapshot)
+        self.store = TrackStore.from_snapshot(self.snapshot)
+
+    def tearDown(self):
+        self.snapshot.close()
+        shutil.rmtree(self.dir)
+
+    def test_reads_mapped_songs(self):
+        self.assertEqual(rows(self.store), song_rows(self.songs))
+        self.assertEqual(self.store[3]['duration'], "01:43")
+        self.assertEqual(self.store.key(3), path_key(self.songs[3]['path']))
+
+    def test_changes_without_materializing(self):
+        store, songs = self.store, self.songs
+        store[2] = make_song(2, title="Changed")
+        store.remove_indices([0, 5])
+        store.append(make_song(10))
+        songs[2] = make_song(2, title="Changed")
+        del songs[5], songs[0]
+        songs.append(make_song(10))
+        self.assertIs(store.base, self.snapshot)
+        self.assertEqual(rows(store), song_rows(songs))
+        self.assertEqual(store.index_of(make_song(10)['path']), len(songs) - 1)
+
+    def test_move_materializes(self):
+        store, songs = self.store, self.songs
+        store[1] = make_song(1, artist="Someone")
+        store.move(9, 0)
+        songs[1] = make_song(1, artist="Someone")
+        songs.insert(0, songs.pop(9))
+        self.assertIsNone(store.base)
+        self.assertEqual(rows(store), song_rows(songs))
+
+
+if __name__ == '__main__':
+    unittest.main()
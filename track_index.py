@@ -0,0 +1,116 @@
+import hashlib
+import os
+import struct
+
+
+# 指纹采样：音频数据的开头、中间、结尾各读取这么多字节
+FINGERPRINT_CHUNK = 64 * 1024
+
+
+def path_key(filepath):
+    """把路径规范化为索引键，符号链接和大小写不同的路径会得到同一个键"""
+    return os.path.normcase(os.path.realpath(filepath))
+
+
+def audio_data_range(f, file_size):
+    """返回去掉ID3v2、ID3v1和APEv2标签之后音频帧所在的 (起点, 终点)"""
+    start = 0
+    # 文件开头可能有一个或多个ID3v2标签
+    while True:
+        f.seek(start)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'ID3':
+            break
+        flags = header[5]
+        size = 0
+        for b in header[6:10]:
+            size = (size << 7) | (b & 0x7f)
+        start += 10 + size + (10 if flags & 0x10 else 0)
+
+    end = file_size
+    # ID3v1标签固定128字节
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    # APEv2标签（位于ID3v1之前）
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b'APETAGEX':
+            tag_size, = struct.unpack('<I', footer[12:16])
+            tag_flags, = struct.unpack('<I', footer[20:24])
+            end -= tag_size + (32 if tag_flags & 0x80000000 else 0)
+
+    return start, max(start, end)
+
+
+def audio_fingerprint(filepath):
+    """计算不受标签影响的音频内容指纹
+
+    只对音频帧进行哈希，修改标签不会改变指纹。为了控制I/O，
+    只采样音频数据的开头、中间和结尾，并把音频长度一并计入。
+    """
+    try:
+        file_size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            start, end = audio_data_range(f, file_size)
+            length = end - start
+            digest = hashlib.sha1(str(length).encode('ascii'))
+
+            if length <= 3 * FINGERPRINT_CHUNK:
+                offsets = [start]
+                chunk = length
+            else:
+                middle = start + (length - FINGERPRINT_CHUNK) // 2
+                offsets = [start, middle, end - FINGERPRINT_CHUNK]
+                chunk = FINGERPRINT_CHUNK
+
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(chunk))
+        return digest.hexdigest()
+    except OSError as e:
+        print(f"Failed to fingerprint {filepath}: {e}")
+        return None
+
+
+# 播放列表索引
+class TrackIndex(object):
+    """播放列表的路径索引和内容指纹索引，用于常数时间的重复检测"""
+
+    def __init__(self):
+        self.paths = set()
+        self.fingerprints = set()
+
+    def clear(self):
+        self.paths.clear()
+        self.fingerprints.clear()
+
+    def rebuild(self, playlist):
+        """从TrackStore重建索引，快照中已保存的路径键不需要重新规范化"""
+        self.clear()
+        for i in range(len(playlist)):
+            self.paths.add(playlist.key(i))
+            fingerprint = playlist.fingerprint(i)
+            if fingerprint:
+                self.fingerprints.add(fingerprint)
+
+    def add(self, song):
+        self.paths.add(path_key(song['path']))
+        fingerprint = song.get('fingerprint')
+        if fingerprint:
+            self.fingerprints.add(fingerprint)
+
+    def discard(self, song):
+        self.paths.discard(path_key(song['path']))
+        fingerprint = song.get('fingerprint')
+        if fingerprint:
+            self.fingerprints.discard(fingerprint)
+
+    def is_duplicate(self, song):
+        """同一路径，或内容指纹相同（复制到其他文件夹的同一首歌）即视为重复"""
+        if path_key(song['path']) in self.paths:
+            return True
+        fingerprint = song.get('fingerprint')
+        return bool(fingerprint) and fingerprint in self.fingerprints
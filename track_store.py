@@ -0,0 +1,327 @@
+import os
+from array import array
+from contextlib import contextmanager
+
+from track_index import path_key
+
+
+def format_duration(seconds):
+    """把秒数格式化为 mm:ss"""
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+# 紧凑的播放列表存储
+class TrackStore(object):
+    """按列存储的播放列表
+
+    每首歌不再是一个字典：标题和文件名放在列表里，艺术家和所在文件夹
+    放在去重的字符串表中、每首歌只存一个下标，时长存在 array 里，
+    时长字符串在读取时再格式化。按下标读取时返回与原来相同的字典，
+    所以 song['title']、song.get('length') 等写法仍然可用。
+
+    从二进制快照（见 library_snapshot）加载时，前 base_count 首歌由映射的
+    快照提供，读取时才解码：base_rows 是它们在快照中的位置，删除时只需
+    更新这个数组，被替换的歌曲按快照中的位置记在 base_overrides 中；
+    之后追加的歌曲存在各列中。移动歌曲时先把快照中的歌曲全部解码到
+    各列（只发生一次）。
+
+    按路径查找下标用的路径表在第一次查找时建立，追加和替换时同步更新，
+    删除和移动后作废、下次查找时重建。
+
+    修改后通知监听者；在 batch() 中的多次修改只通知一次。
+    """
+
+    def __init__(self, songs=None):
+        self.titles = []
+        self.names = []
+        self.fingerprints = []
+        self.artist_ids = array('I')
+        self.folder_ids = array('I')
+        self.lengths = array('d')
+        self.base = None
+        self.base_rows = array('I')
+        self.base_overrides = {}
+        self.base_count = 0
+        self.artist_table = []
+        self.artist_lookup = {}
+        self.folder_table = []
+        self.folder_lookup = {}
+        self.listeners = []
+        self.batch_depth = 0
+        self.changed = False
+        self.path_rows = None  # 路径 -> 下标，第一次按路径查找时建立
+        if songs:
+            for song in songs:
+                self._append(song)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """以映射的快照（MappedSnapshot）作为前面的歌曲，不解码任何歌曲"""
+        store = cls()
+        store.base = snapshot
+        store.base_rows = array('I', range(len(snapshot)))
+        store.base_count = len(snapshot)
+        return store
+
+    # 读取
+    def __len__(self):
+        return self.base_count + len(self.titles)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._song(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("track index out of range")
+        return self._song(index)
+
+    def __setitem__(self, index, song):
+        """替换一首歌的信息（路径也可以不同）"""
+        folder, name = os.path.split(song['path'])
+        if self.path_rows is not None:
+            old_path = self.path(index)
+            if old_path != song['path']:
+                if self.path_rows.get(old_path) == index:
+                    del self.path_rows[old_path]
+                self.path_rows.setdefault(song['path'], index)
+        if index < self.base_count:
+            self.base_overrides[self.base_rows[index]] = {
+                'title': song.get('title', name),
+                'artist': song.get('artist', 'Unknown Artist'),
+                'path': song['path'],
+                'length': float(song.get('length', 180)),
+                'fingerprint': song.get('fingerprint')
+            }
+            self._touch()
+            return
+        index -= self.base_count
+        self.titles[index] = song.get('title', name)
+        self.names[index] = name
+        self.fingerprints[index] = song.get('fingerprint')
+        self.artist_ids[index] = self._intern(song.get('artist', 'Unknown Artist'),
+                                              self.artist_table, self.artist_lookup)
+        self.folder_ids[index] = self._intern(folder, self.folder_table, self.folder_lookup)
+        self.lengths[index] = song.get('length', 180)
+        self._touch()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._song(i)
+
+    def path(self, index):
+        if index < self.base_count:
+            return self._base_value(index, 'path')
+        index -= self.base_count
+        return os.path.join(self.folder_table[self.folder_ids[index]], self.names[index])
+
+    def paths(self):
+        for i in range(len(self)):
+            yield self.path(i)
+
+    def index_of(self, path):
+        """返回路径所在的下标，不在列表中时返回None"""
+        if self.path_rows is None:
+            rows = {}
+            for i in range(len(self)):
+                rows.setdefault(self.path(i), i)
+            self.path_rows = rows
+        return self.path_rows.get(path)
+
+    def title(self, index):
+        if index < self.base_count:
+            return self._base_value(index, 'title')
+        return self.titles[index - self.base_count]
+
+    def artist(self, index):
+        if index < self.base_count:
+            return self._base_value(index, 'artist')
+        return self.artist_table[self.artist_ids[index - self.base_count]]
+
+    def length(self, index):
+        if index < self.base_count:
+            return self._base_value(index, 'length')
+        return self.lengths[index - self.base_count]
+
+    def fingerprint(self, index):
+        if index < self.base_count:
+            return self._base_value(index, 'fingerprint')
+        return self.fingerprints[index - self.base_count]
+
+    def key(self, index):
+        """重复检测用的路径索引键；快照中保存了计算好的键，不需要再访问文件系统"""
+        if index < self.base_count:
+            return self._base_value(index, 'key')
+        return path_key(self.path(index))
+
+    def copy(self):
+        """复制一份（只复制各列，字符串表共享同样的字符串对象）"""
+        other = TrackStore()
+        other.titles = list(self.titles)
+        other.names = list(self.names)
+        other.fingerprints = list(self.fingerprints)
+        other.artist_ids = array('I', self.artist_ids)
+        other.folder_ids = array('I', self.folder_ids)
+        other.lengths = array('d', self.lengths)
+        other.base = self.base
+        other.base_rows = array('I', self.base_rows)
+        other.base_overrides = dict(self.base_overrides)
+        other.base_count = self.base_count
+        other.artist_table = list(self.artist_table)
+        other.artist_lookup = dict(self.artist_lookup)
+        other.folder_table = list(self.folder_table)
+        other.folder_lookup = dict(self.folder_lookup)
+        return other
+
+    # 修改
+    def bind(self, callback):
+        """注册修改监听者，callback(store)"""
+        self.listeners.append(callback)
+
+    @contextmanager
+    def batch(self):
+        """批量修改，结束时只通知一次"""
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0 and self.changed:
+                self._notify()
+
+    def append(self, song):
+        self._append(song)
+        self._touch()
+
+    def extend(self, songs):
+        for song in songs:
+            self._append(song)
+        self._touch()
+
+    def remove_indices(self, indices):
+        """删除一组下标对应的歌曲"""
+        removed = set(indices)
+        if not removed:
+            return
+        if self.base is not None:
+            # 快照中的歌曲只需要更新位置数组，不需要解码
+            self.base_rows = array('I', (self.base_rows[i] for i in range(self.base_count)
+                                         if i not in removed))
+            removed = set(i - self.base_count for i in removed if i >= self.base_count)
+            self.base_count = len(self.base_rows)
+        keep = [i for i in range(len(self.titles)) if i not in removed]
+        self.titles = [self.titles[i] for i in keep]
+        self.names = [self.names[i] for i in keep]
+        self.fingerprints = [self.fingerprints[i] for i in keep]
+        self.artist_ids = array('I', (self.artist_ids[i] for i in keep))
+        self.folder_ids = array('I', (self.folder_ids[i] for i in keep))
+        self.lengths = array('d', (self.lengths[i] for i in keep))
+        self.path_rows = None
+        self._touch()
+
+    def move(self, from_index, to_index):
+        self._materialize()
+        for column in (self.titles, self.names, self.fingerprints,
+                       self.artist_ids, self.folder_ids, self.lengths):
+            value = column.pop(from_index)
+            column.insert(to_index, value)
+        self.path_rows = None
+        self._touch()
+
+    def clear(self):
+        self.swap(TrackStore())
+
+    def swap(self, other):
+        """用另一个存储的内容替换当前内容（O(1)，other之后不应再使用）"""
+        for name in ('titles', 'names', 'fingerprints', 'artist_ids', 'folder_ids', 'lengths',
+                     'base', 'base_rows', 'base_overrides', 'base_count',
+                     'artist_table', 'artist_lookup', 'folder_table', 'folder_lookup'):
+            setattr(self, name, getattr(other, name))
+        self.path_rows = None
+        self._touch()
+
+    def _song(self, index):
+        if index < self.base_count:
+            row = self.base_rows[index]
+            song = self.base_overrides.get(row)
+            if song is None:
+                song = self.base.song(row)
+            else:
+                song = dict(song)
+                if not song['fingerprint']:
+                    del song['fingerprint']
+            song['duration'] = format_duration(song['length'])
+            return song
+        index -= self.base_count
+        length = self.lengths[index]
+        song = {
+            'title': self.titles[index],
+            'artist': self.artist_table[self.artist_ids[index]],
+            'duration': format_duration(length),
+            'path': os.path.join(self.folder_table[self.folder_ids[index]], self.names[index]),
+            'length': length
+        }
+        if self.fingerprints[index]:
+            song['fingerprint'] = self.fingerprints[index]
+        return song
+
+    def _append(self, song):
+        folder, name = os.path.split(song['path'])
+        self.titles.append(song.get('title', name))
+        self.names.append(name)
+        self.fingerprints.append(song.get('fingerprint'))
+        self.artist_ids.append(self._intern(song.get('artist', 'Unknown Artist'),
+                                            self.artist_table, self.artist_lookup))
+        self.folder_ids.append(self._intern(folder, self.folder_table, self.folder_lookup))
+        self.lengths.append(song.get('length', 180))
+        if self.path_rows is not None:
+            self.path_rows.setdefault(song['path'], len(self) - 1)
+
+    def _base_value(self, index, field):
+        # 快照中的歌曲被替换过时使用替换后的信息
+        row = self.base_rows[index]
+        song = self.base_overrides.get(row)
+        if song is None:
+            return getattr(self.base, field)(row)
+        if field == 'key':
+            return path_key(song['path'])
+        return song[field]
+
+    def _materialize(self):
+        # 把快照中的歌曲解码到各列的前面，之后所有歌曲都可以原地修改
+        if self.base is None:
+            return
+        songs = [self._song(i) for i in range(len(self))]
+        self.path_rows = None
+        empty = TrackStore()
+        for name in ('titles', 'names', 'fingerprints', 'artist_ids', 'folder_ids', 'lengths',
+                     'base', 'base_rows', 'base_overrides', 'base_count',
+                     'artist_table', 'artist_lookup', 'folder_table', 'folder_lookup'):
+            setattr(self, name, getattr(empty, name))
+        for song in songs:
+            self._append(song)
+
+    @staticmethod
+    def _intern(value, table, lookup):
+        # 相同的字符串只保存一份
+        index = lookup.get(value)
+        if index is None:
+            index = len(table)
+            table.append(value)
+            lookup[value] = index
+        return index
+
+    def _touch(self):
+        if self.batch_depth:
+            self.changed = True
+        else:
+            self._notify()
+
+    def _notify(self):
+        self.changed = False
+        for callback in self.listeners:
+            callback(self)
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import threading
+from array import array
+from collections import OrderedDict, deque
+
+from audio_decoder import can_decode, stream_pcm
+
+if can_decode():
+    import numpy as np
+
+
+def file_key(path, stat):
+    """文件身份（路径、大小、修改时间）的哈希，文件被修改后自动对应新的缓存"""
+    identity = f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha1(identity.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def compute_peaks(path, bins, sample_rate=11025, hop=256):
+    """逐块解码，返回 (最小值数组, 最大值数组)，各bins个，范围-127到127
+
+    每hop个采样先取一次最小/最大值（向量化），解码完后再合并成bins段，
+    所以内存只与时长成很小的比例（每秒约43对数值）。
+    """
+    mins, maxs = [], []
+    tail = np.zeros(0, dtype=np.float32)
+    for block in stream_pcm(path, sample_rate, 1, hop * 64):
+        block = np.concatenate((tail, block)) if len(tail) else block
+        usable = len(block) - len(block) % hop
+        frames = block[:usable].reshape(-1, hop)
+        mins.append(frames.min(axis=1))
+        maxs.append(frames.max(axis=1))
+        tail = block[usable:]
+    if len(tail):
+        mins.append(tail.min(keepdims=True))
+        maxs.append(tail.max(keepdims=True))
+    if not mins:
+        return array('b', [0] * bins), array('b', [0] * bins)
+
+    mins = np.concatenate(mins)
+    maxs = np.concatenate(maxs)
+    # 把细粒度的峰值均匀合并成bins段（短于bins段时重复）
+    edges = (np.arange(bins) * len(mins)) // bins
+    peak_min = np.minimum.reduceat(mins, edges)
+    peak_max = np.maximum.reduceat(maxs, edges)
+    to_int = lambda values: array('b', np.clip(np.round(values * 127), -127, 127).astype(np.int8).tobytes())
+    return to_int(peak_min), to_int(peak_max)
+
+
+def waveform_mesh(peaks, x, y, width, height):
+    """把峰值转换成一个Mesh的顶点和下标：每段一个从最小值到最大值的矩形（两个三角形）"""
+    mins, maxs = peaks
+    count = len(mins)
+    step = width / float(count)
+    # 细条之间留一点空隙
+    bar = max(step * 0.7, 1.0)
+    middle = y + height / 2.0
+    scale = height / 2.0 / 127.0
+    vertices = []
+    indices = []
+    for i in range(count):
+        left = x + i * step
+        right = left + bar
+        low = middle + mins[i] * scale
+        high = middle + max(maxs[i], mins[i] + 1) * scale
+        vertices.extend((left, low, 0, 0, right, low, 0, 0, right, high, 0, 0, left, high, 0, 0))
+        base = i * 4
+        indices.extend((base, base + 1, base + 2, base + 2, base + 3, base))
+    return vertices, indices
+
+
+# 波形峰值缓存
+class WaveformCache(object):
+    """每首歌降采样后的最小/最大峰值：内存LRU + 磁盘缓存，缺失时在后台计算
+
+    磁盘上每首歌一个文件，以文件身份的哈希为文件名，内容是bins个最小值
+    和bins个最大值（有符号字节）。读取缓存不需要解码音频，可以在主线程直接读取。
+    """
+
+    # 等待中的请求最多保留这么多个，快速切歌时丢弃最早的请求
+    QUEUE_LIMIT = 8
+
+    def __init__(self, call_in_main, cache_dir="waveform_cache", bins=200, max_items=64):
+        self.call_in_main = call_in_main
+        self.cache_dir = cache_dir
+        self.bins = bins
+        self.max_items = max_items
+        self.peaks = OrderedDict()  # 文件身份 -> (最小值, 最大值)，只在主线程访问
+        self.waiting = {}  # 文件身份 -> 等待的回调列表
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.thread = None
+
+    @property
+    def available(self):
+        return can_decode()
+
+    def get(self, path, callback):
+        """返回已缓存的峰值 (最小值, 最大值)
+
+        还没有计算过时返回None并在后台计算，完成后在主线程调用 callback(路径, 峰值)；
+        无法解码时峰值为None。
+        """
+        try:
+            key = file_key(path, os.stat(path))
+        except OSError:
+            return None
+        peaks = self.peaks.get(key)
+        if peaks is not None:
+            self.peaks.move_to_end(key)
+            return peaks
+        peaks = self._read(key)
+        if peaks is not None:
+            self._remember(key, peaks)
+            return peaks
+
+        if not self.available:
+            return None
+        callbacks = self.waiting.get(key)
+        if callbacks is not None:
+            callbacks.append(callback)
+            return None
+        self.waiting[key] = [callback]
+
+        with self.cond:
+            self.queue.append((key, path))
+            while len(self.queue) > self.QUEUE_LIMIT:
+                self.waiting.pop(self.queue.popleft()[0], None)
+            self.cond.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return None
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key + ".peaks")
+
+    def _read(self, key):
+        try:
+            with open(self._cache_path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != 2 * self.bins:
+            return None
+        return array('b', data[:self.bins]), array('b', data[self.bins:])
+
+    def _write(self, key, peaks):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._cache_path(key)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(peaks[0].tobytes() + peaks[1].tobytes())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to save waveform: {e}")
+
+    def _remember(self, key, peaks):
+        self.peaks[key] = peaks
+        while len(self.peaks) > self.max_items:
+            self.peaks.popitem(last=False)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                # 最新的请求通常是当前歌曲，优先处理
+                key, path = self.queue.pop()
+
+            try:
+                peaks = compute_peaks(path, self.bins)
+                self._write(key, peaks)
+            except Exception as e:
+                print(f"Failed to compute waveform {path}: {e}")
+                peaks = None
+            self.call_in_main(lambda key=key, path=path, peaks=peaks: self._loaded(key, path, peaks))
+
+    def _loaded(self, key, path, peaks):
+        if peaks is not None:
+            self._remember(key, peaks)
+        for callback in self.waiting.pop(key, []):
+            callback(path, peaks)